@@ -0,0 +1,186 @@
+"""
+Head-to-head controller comparison on the 90-step CSTR scenario.
+
+Every candidate (a single skill, or a selector with its skills) controls the same reactor
+(cstr_common.cstr.CSTRBatch) from the same initial state, in a fresh process so imports and
+caches do not carry over between candidates. The table lists control KPIs next to compute KPIs:
+
+    rms_Ca        RMS of Cref - Ca over the episode
+    max_T         highest reactor temperature (K)
+    runaways      steps on which T crossed RUNAWAY_TEMPERATURE upwards
+    product       product produced, Σ F·Cb_Prod·Δt (kmol)
+    step_ms       mean and p99 agent step time
+    skill_s       total time spent in the skills' compute_action (the solvers for the MPC skills)
+    remote        True if the candidate solves on a remote server (GEKKO with --gekko-remote), so its
+                  step times include the network round trip
+    peak_mb       peak Python memory allocated during an episode (tracemalloc, separate run)
+
+The learned selector is evaluated from a policy given as module:callable with the cstr_common.distill
+contract: it takes an (M, sensors) array and returns M skill indices.
+
+Usage:
+    python -m cstr_common.compare
+    python -m cstr_common.compare --only pid mpc programmed-selector --csv results.csv
+    python -m cstr_common.compare --only gekko --gekko-remote
+    python -m cstr_common.compare --policy my_policies:learned_selector \
+        --selector-skills skills/pid skills/mpc-skill-group skills/pid
+"""
+import argparse
+import asyncio
+import multiprocessing
+import time
+import tracemalloc
+
+import numpy as np
+
+from cstr_common.components import REPO_ROOT, load_component, resolve
+from cstr_common.cstr import EPISODE_STEPS, F, RUNAWAY_TEMPERATURE, CSTRBatch
+from cstr_common.orchestrator import Orchestrator
+from cstr_common.report import format_table, table_rows, write_csv
+from cstr_common.sensors import SENSOR_INDEX
+
+# Skills the selectors choose from, by selector action: the programmed selectors pick
+# start_reaction, control_transition and produce_product, which are trained skills; the
+# harness maps the phases to the controller skills instead (steady phases PID, transition MPC).
+DEFAULT_SELECTOR_SKILLS = ('skills/pid', 'skills/mpc-skill-group', 'skills/pid')
+
+
+# Returns the candidates compared by default. The GEKKO benchmark is passed remote=False (its own
+# default is the public server), so it solves locally unless gekko_remote is set;
+# a candidate's optional 'skill_kwargs' are passed to its skills and 'remote' marks network solves.
+# The component directories are resolved against root (default: REPO_ROOT).
+def default_candidates(selector_skills=DEFAULT_SELECTOR_SKILLS, policy=None, gekko_remote=False, root=None):
+    candidates = [
+        {'name': 'pid', 'skills': ['skills/pid']},
+        {'name': 'mpc', 'skills': ['skills/mpc-skill-group']},
+        {'name': 'gekko', 'skills': ['skills/mpc-benchmark'], 'skill_kwargs': [{'remote': gekko_remote}],
+         'remote': gekko_remote},
+        {'name': 'programmed-selector', 'selector': 'selectors/programmed-selector', 'skills': list(selector_skills)},
+        {'name': 'programmed-selector-ctft', 'selector': 'selectors/programmed-selector-ctft',
+         'skills': list(selector_skills)},
+    ]
+    if policy:
+        candidates.append({'name': 'learned-selector', 'policy': policy, 'skills': list(selector_skills)})
+    for candidate in candidates:
+        candidate['skills'] = [resolve(path, root) for path in candidate['skills']]
+        if candidate.get('selector'):
+            candidate['selector'] = resolve(candidate['selector'], root)
+    return candidates
+
+
+# Selector that evaluates a batch policy on one observation, for the learned selector.
+class PolicySelector:
+    def __init__(self, spec):
+        from cstr_common.distill import load_policy
+        self.policy = load_policy(spec)
+
+    async def compute_action(self, obs, action):
+        return int(np.ravel(self.policy(obs.values[None, :]))[0])
+
+
+# Builds the orchestrator for a candidate.
+def build(candidate, skill_kwargs=None):
+    """
+    Args:
+        candidate: Candidate dictionary with 'skills' and optionally 'selector', 'policy' or 'skill_kwargs'.
+        skill_kwargs: Optional list with the constructor keyword arguments of each skill, added to
+            the candidate's own.
+    """
+    selector = None
+    if candidate.get('selector'):
+        selector = load_component(candidate['selector'])
+    elif candidate.get('policy'):
+        selector = PolicySelector(candidate['policy'])
+    base = candidate.get('skill_kwargs') or [{}] * len(candidate['skills'])
+    skill_kwargs = skill_kwargs or [{}] * len(candidate['skills'])
+    skills = [load_component(path, **own, **extra)
+              for path, own, extra in zip(candidate['skills'], base, skill_kwargs)]
+    return Orchestrator(skills, selector=selector, speculate=False, threads=False)
+
+
+# Runs one episode and returns the per-step observations and the orchestrator.
+async def run_episode(candidate, env=None, skill_kwargs=None):
+    env = env if env is not None else CSTRBatch(1)
+    observations = np.empty((EPISODE_STEPS + 1, len(SENSOR_INDEX)))
+    env.observe(out=observations[0:1])
+    with build(candidate, skill_kwargs) as orchestrator:
+        for t in range(EPISODE_STEPS):
+            action = await orchestrator.step(observations[t])
+            env.step(np.array([np.ravel(action)[0]], dtype=np.float64))
+            env.observe(out=observations[t + 1:t + 2])
+    return observations, orchestrator
+
+
+# Control KPIs of an episode.
+def control_kpis(observations):
+    T = observations[:, SENSOR_INDEX['T']]
+    error = observations[1:, SENSOR_INDEX['Cref']] - observations[1:, SENSOR_INDEX['Ca']]
+    hot = T >= RUNAWAY_TEMPERATURE
+    return {
+        'rms_Ca': float(np.sqrt(np.mean(error**2))),
+        'max_T': float(T.max()),
+        'runaways': int(np.count_nonzero(hot[1:] & ~hot[:-1])),
+        'product': float(np.sum(F * observations[1:, SENSOR_INDEX['Cb_Prod']])),
+    }
+
+
+# Evaluates one candidate (in the calling process) and returns its table row.
+def evaluate(candidate, memory=True):
+    row = {'candidate': candidate['name'], 'remote': candidate.get('remote', False)}
+    try:
+        observations, orchestrator = asyncio.run(run_episode(candidate))
+        step = np.asarray(orchestrator.timings['step']) * 1e3
+        row.update(control_kpis(observations))
+        row.update({
+            'step_ms_mean': float(step.mean()),
+            'step_ms_p99': float(np.percentile(step, 99)),
+            'skill_s': float(np.sum(orchestrator.timings['skill'])),
+        })
+        if memory:
+            # Separate episode, as tracemalloc slows down every allocation.
+            tracemalloc.start()
+            asyncio.run(run_episode(candidate))
+            row['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+    except Exception as e:
+        row['error'] = f"{type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}"
+    return row
+
+
+# Evaluates the candidates one after another, each in a fresh process.
+def compare(candidates, memory=True):
+    ctx = multiprocessing.get_context('spawn')
+    rows = []
+    for candidate in candidates:
+        start = time.perf_counter()
+        with ctx.Pool(1) as pool:
+            row = pool.apply(evaluate, (candidate, memory))
+        row['wall_s'] = time.perf_counter() - start
+        rows.append(row)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the controllers on the 90-step CSTR scenario.")
+    parser.add_argument('--only', nargs='+', help="Candidate names to run (default: all)")
+    parser.add_argument('--selector-skills', nargs='+', default=list(DEFAULT_SELECTOR_SKILLS),
+                        help="Skill component directories chosen by the selectors, by selector action")
+    parser.add_argument('--policy', help="Learned selector policy as module:callable")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc run")
+    parser.add_argument('--gekko-remote', action='store_true', help="Solve the GEKKO candidate on the public GEKKO server")
+    parser.add_argument('--csv', help="Write the table to a CSV file")
+    parser.add_argument('--root', default=REPO_ROOT, help="Directory the component directories are relative to (default: this repository)")
+    args = parser.parse_args(argv)
+
+    candidates = default_candidates(args.selector_skills, args.policy, args.gekko_remote, args.root)
+    if args.only:
+        candidates = [c for c in candidates if c['name'] in args.only]
+
+    rows = table_rows(compare(candidates, memory=not args.no_memory))
+    print(format_table(rows))
+    if args.csv:
+        write_csv(args.csv, rows)
+
+
+if __name__ == '__main__':
+    main()
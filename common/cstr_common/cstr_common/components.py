@@ -0,0 +1,51 @@
+import importlib
+import os
+import sys
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    import tomli as tomllib
+
+# Default root that relative component directories are resolved against: the repository this
+# package sits in (common/cstr_common/cstr_common -> repository root). The functions below and the
+# tools' --root option take another root.
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+
+# Returns the absolute path of a component directory. Absolute paths are returned unchanged.
+def resolve(path, root=None):
+    return os.path.abspath(os.path.join(root or REPO_ROOT, path))
+
+
+# Reads the [composabl] table of a component's pyproject.toml.
+def read_manifest(path, root=None):
+    """
+    Args:
+        path: Component directory (containing pyproject.toml), absolute or relative to root.
+        root: Directory relative paths are resolved against (default: REPO_ROOT).
+
+    Returns:
+        A dictionary with the component's 'type', 'entrypoint' ("module:Class") and absolute 'path'.
+    """
+    path = resolve(path, root)
+    with open(os.path.join(path, 'pyproject.toml'), 'rb') as f:
+        manifest = tomllib.load(f).get('composabl')
+    if not manifest or 'entrypoint' not in manifest:
+        raise ValueError(f"{path}/pyproject.toml has no [composabl] entrypoint")
+    return dict(manifest, path=path)
+
+
+# Imports the class named by a component's entrypoint, as the Composabl runtime does for an installed component.
+# The component directory is put on sys.path, so the component does not have to be installed.
+def load_class(path, root=None):
+    manifest = read_manifest(path, root)
+    if manifest['path'] not in sys.path:
+        sys.path.insert(0, manifest['path'])
+    module, name = manifest['entrypoint'].split(':')
+    return getattr(importlib.import_module(module), name)
+
+
+# Creates an instance of a component; the other arguments are passed to its constructor.
+def load_component(path, *args, root=None, **kwargs):
+    return load_class(path, root)(*args, **kwargs)
@@ -0,0 +1,142 @@
+import numpy as np
+
+from cstr_common.sensors import SENSOR_INDEX, SENSORS
+
+# Constants of the continuous stirred tank reactor (CSTR) used throughout the skills.
+# They match the model in mpc_skill_group.controller.
+F = 1  # Volumetric flow rate (m3/h).
+V = 1  # Reactor volume (m3).
+k0 = 34930800  # Pre-exponential nonthermal factor (1/h).
+E = 11843  # Activation energy per mole (kcal/kmol).
+R = 1.985875  # Boltzmann's ideal gas constant (kcal/(kmol·K)).
+ΔH = -5960  # Heat of reaction per mole (kcal/kmol).
+phoCp = 500  # Density multiplied by heat capacity (kcal/(m3·K)).
+UA = 150  # Overall heat transfer coefficient multiplied by tank area (kcal/(K·h)).
+Cafin = 10  # Feed concentration (kmol/m3).
+Tf = 298.2  # Feed temperature (K).
+
+# Coolant temperature bounds and the maximum change per step applied by the skills.
+TC_MIN = 273
+TC_MAX = 322
+DTC_MAX = 10
+
+# Reactor temperature treated as a thermal runaway. With Tc <= TC_MAX the reactor cannot reach the
+# MPC's 400 K bound: ignition takes it to the hot branch of steady states, which tops out at about
+# 382 K (Tc = 322 K). The threshold sits between that and the production steady state (373 K).
+RUNAWAY_TEMPERATURE = 380.0
+
+# Reference schedule: steady state until p1, linear transition until p2, steady state until the end.
+P1 = 22
+P2 = 74
+EPISODE_STEPS = 90
+CA_START, CA_END = 8.57, 2
+T_START, T_END = 311.2612, 373.1311
+
+# Steady-state coolant temperature for the initial state (CA_START, T_START).
+TC_START = 297.98
+
+# RK4 substeps per one-unit simulation step; the reaction term is stiff near runaway.
+SUBSTEPS = 10
+
+
+# Returns the reference concentration and temperature at the given step(s).
+def reference(step):
+    """
+    Args:
+        step: Step index or array of step indices.
+
+    Returns:
+        (Cref, Tref), with the shape of step.
+    """
+    x = [0, P1, P2, EPISODE_STEPS]
+    Cref = np.interp(step, x, [CA_START, CA_START, CA_END, CA_END])
+    Tref = np.interp(step, x, [T_START, T_START, T_END, T_END])
+    return Cref, Tref
+
+
+# The sensors derived from Ca and Cref: the relative concentration error, the conversion of the
+# feed (Eps_Yield) and the product concentration (Cb_Prod), elementwise over arrays.
+def derived_sensors(Ca, Cref):
+    return np.abs(Ca - Cref) / Cref, (Cafin - Ca) / Cafin, Cafin - Ca
+
+
+# Time derivatives of the CSTR states, elementwise over arrays of reactors.
+def derivatives(Ca, T, Tc):
+    rate = k0 * np.exp(-E / (R * T)) * Ca
+    dCa = F / V * (Cafin - Ca) - rate
+    dT = F / V * (Tf - T) - (ΔH / phoCp) * rate - (UA / (phoCp * V)) * (T - Tc)
+    return dCa, dT
+
+
+# Integrates the CSTR states over dt with fixed-step RK4, holding Tc constant.
+def integrate(Ca, T, Tc, dt=1.0, substeps=SUBSTEPS):
+    h = dt / substeps
+    for _ in range(substeps):
+        k1a, k1t = derivatives(Ca, T, Tc)
+        k2a, k2t = derivatives(Ca + h / 2 * k1a, T + h / 2 * k1t, Tc)
+        k3a, k3t = derivatives(Ca + h / 2 * k2a, T + h / 2 * k2t, Tc)
+        k4a, k4t = derivatives(Ca + h * k3a, T + h * k3t, Tc)
+        Ca = Ca + h / 6 * (k1a + 2 * k2a + 2 * k3a + k4a)
+        T = T + h / 6 * (k1t + 2 * k2t + 2 * k3t + k4t)
+    return Ca, T
+
+
+# The CSTRBatch class simulates N independent reactors over the 90-step reference schedule.
+# All state is held in arrays, so one step advances every reactor with a few NumPy operations.
+# The sensors follow SENSORS: T, Tc, Ca, Cref, Tref, the relative concentration error,
+# the conversion of the feed (Eps_Yield) and the product concentration (Cb_Prod).
+class CSTRBatch:
+    def __init__(self, n, rng=None, jitter=0.0):
+        """
+        Args:
+            n: Number of reactors.
+            rng: Optional numpy Generator used for the initial-state jitter.
+            jitter: Relative standard deviation of the initial Ca and T (0 starts every reactor at steady state).
+        """
+        self.n = n
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.jitter = jitter
+        self.Ca = np.empty(n)
+        self.T = np.empty(n)
+        self.Tc = np.empty(n)
+        self.step_count = np.zeros(n, dtype=np.int64)
+        self.reset()
+
+    # Resets the reactors selected by mask (all if None) to the initial state.
+    def reset(self, mask=None):
+        idx = np.arange(self.n) if mask is None else np.flatnonzero(mask)
+        self.Ca[idx] = CA_START
+        self.T[idx] = T_START
+        if self.jitter:
+            self.Ca[idx] *= 1.0 + self.jitter * self.rng.standard_normal(len(idx))
+            self.T[idx] *= 1.0 + self.jitter * self.rng.standard_normal(len(idx))
+        self.Tc[idx] = TC_START
+        self.step_count[idx] = 0
+
+    # Writes the (N, sensors) observation into out (allocated if None) and returns it.
+    def observe(self, out=None):
+        if out is None:
+            out = np.empty((self.n, len(SENSORS)))
+        Cref, Tref = reference(self.step_count)
+        out[:, SENSOR_INDEX['T']] = self.T
+        out[:, SENSOR_INDEX['Tc']] = self.Tc
+        out[:, SENSOR_INDEX['Ca']] = self.Ca
+        out[:, SENSOR_INDEX['Cref']] = Cref
+        out[:, SENSOR_INDEX['Tref']] = Tref
+        (out[:, SENSOR_INDEX['Conc_Error']], out[:, SENSOR_INDEX['Eps_Yield']],
+         out[:, SENSOR_INDEX['Cb_Prod']]) = derived_sensors(self.Ca, Cref)
+        return out
+
+    # Applies one ΔTc per reactor and advances one step.
+    def step(self, dTc):
+        """
+        Args:
+            dTc: (N,) coolant temperature changes, clipped to ±DTC_MAX.
+
+        Returns:
+            (N,) boolean array, True where the episode ended (schedule finished or thermal runaway).
+        """
+        self.Tc = np.clip(self.Tc + np.clip(dTc, -DTC_MAX, DTC_MAX), TC_MIN, TC_MAX)
+        self.Ca, self.T = integrate(self.Ca, self.T, self.Tc)
+        self.step_count += 1
+        return (self.step_count >= EPISODE_STEPS) | (self.T >= RUNAWAY_TEMPERATURE)
@@ -0,0 +1,64 @@
+import inspect
+
+import numpy as np
+
+from cstr_common.observation import Observation
+
+
+# Groups environments by the skill a selector chose for them.
+def group_by_skill(skill_idx):
+    """
+    Args:
+        skill_idx: Integer array with the selected skill index per environment.
+
+    Returns:
+        A list of (skill index, environment indices) pairs, one per skill that was selected at least once.
+    """
+    skill_idx = np.asarray(skill_idx)
+    order = np.argsort(skill_idx, kind='stable')
+    skills, starts = np.unique(skill_idx[order], return_index=True)
+    return list(zip(skills.tolist(), np.split(order, starts[1:])))
+
+
+# Calls every selected skill once with the batch of environments that selected it.
+async def dispatch(skill_idx, obs, skills, out=None):
+    """
+    Args:
+        skill_idx: Integer array with the selected skill index per environment.
+        obs: (N, sensors) observation array.
+        skills: Sequence of batch skills indexed by skill index. Each is called as
+                skill(obs[env_ids], env_ids) and returns one action per environment in the group;
+                it may be a plain function or a coroutine function.
+        out: Optional (N,) array the actions are written into.
+
+    Returns:
+        (N,) array with the action of every environment.
+    """
+    obs = np.asarray(obs, dtype=np.float64)
+    if out is None:
+        out = np.empty(len(obs), dtype=np.float64)
+    for skill, env_ids in group_by_skill(skill_idx):
+        actions = skills[skill](obs[env_ids], env_ids)
+        if inspect.isawaitable(actions):
+            actions = await actions
+        out[env_ids] = np.ravel(actions)
+    return out
+
+
+# The ScalarSkillBatch class exposes per-environment skill controllers (one instance per
+# environment, as the SDK creates them) as a batch skill for dispatch(). It is the fallback
+# for skills without a vectorized implementation, such as the MPC controllers.
+class ScalarSkillBatch:
+    def __init__(self, controllers):
+        """
+        Args:
+            controllers: One SkillController per environment, indexed by environment index.
+        """
+        self.controllers = controllers
+
+    async def __call__(self, obs, env_ids):
+        actions = np.empty(len(env_ids), dtype=np.float64)
+        for j, env_id in enumerate(env_ids.tolist()):
+            action = await self.controllers[env_id].compute_action(Observation(obs[j]), 0.0)
+            actions[j] = np.ravel(action)[0]
+        return actions
@@ -0,0 +1,381 @@
+"""
+Distills a trained skill selector into a dependency-free decision-table selector.
+
+The learned selector (selectors/learned-selector) evaluates a neural policy every step just to
+pick one of a few skills. This tool samples that policy over the observation space, fits a
+compact decision tree (scikit-learn) or a lookup table (numpy only), reports how often the
+distilled policy agrees with the original on held-out samples, and writes the result as a
+selector-controller package in the style of programmed_selector_ctft.
+
+The policy is given as module:callable. The callable takes an (M, sensors) array with columns
+in SENSORS order and returns M skill indices; wrap a per-observation policy with row_policy().
+
+Usage:
+    python -m cstr_common.distill my_policies:learned_selector --method tree --max-depth 6 \
+        --trajectories TRAJECTORY_DIR --output selectors/distilled-selector
+"""
+import argparse
+import glob
+import importlib
+import os
+
+import numpy as np
+
+from cstr_common.cstr import derived_sensors
+from cstr_common.sensors import SENSOR_INDEX, SENSORS
+
+# Sampling box used when no recorded trajectories are given. Conc_Error, Eps_Yield and Cb_Prod are
+# computed from the sampled Ca and Cref (see sample_box); their bounds are not used.
+DEFAULT_BOUNDS = {
+    'T': (300.0, 400.0),
+    'Tc': (273.0, 322.0),
+    'Ca': (1.5, 9.5),
+    'Cref': (2.0, 8.57),
+    'Tref': (311.2612, 373.1311),
+    'Conc_Error': (0.0, 1.0),
+    'Eps_Yield': (0.0, 1.0),
+    'Cb_Prod': (0.0, 10.0),
+}
+
+DEFAULT_SAMPLES = 50_000
+DEFAULT_MAX_DEPTH = 6
+DEFAULT_BINS = 8
+
+
+# Wraps a policy that takes one observation dictionary into the batch form used here.
+def row_policy(fn):
+    def policy(X):
+        return np.array([fn(dict(zip(SENSORS, row))) for row in X.tolist()], dtype=np.int64)
+    return policy
+
+
+# Loads a policy given as "module:callable".
+def load_policy(spec):
+    module, _, name = spec.partition(':')
+    return getattr(importlib.import_module(module), name)
+
+
+# Draws observations uniformly from the sampling box, with the derived sensors computed from the
+# sampled Ca and Cref as the environment computes them, so every sample is a consistent observation.
+def sample_box(n, rng, bounds=DEFAULT_BOUNDS):
+    low = np.array([bounds[name][0] for name in SENSORS])
+    high = np.array([bounds[name][1] for name in SENSORS])
+    X = rng.uniform(low, high, size=(n, len(SENSORS)))
+    (X[:, SENSOR_INDEX['Conc_Error']], X[:, SENSOR_INDEX['Eps_Yield']],
+     X[:, SENSOR_INDEX['Cb_Prod']]) = derived_sensors(X[:, SENSOR_INDEX['Ca']], X[:, SENSOR_INDEX['Cref']])
+    return X
+
+
+# Draws observations from recorded trajectories, jittered by a fraction of each sensor's spread
+# so the distilled policy also sees states near (not only on) the recorded ones.
+def sample_trajectories(n, rng, directory, jitter=0.02):
+    from cstr_common.trajectory import read_trajectory
+
+    paths = sorted(glob.glob(os.path.join(directory, '*.npz')) + glob.glob(os.path.join(directory, '*.parquet')))
+    parts = []
+    for path in paths:
+        data = read_trajectory(path)
+        parts.append(np.column_stack([data[name] for name in SENSORS]))
+    states = np.concatenate(parts)
+    states = states[~np.isnan(states).any(axis=1)]
+    if len(states) == 0:
+        raise ValueError(f"No complete observations found in {directory}")
+
+    X = states[rng.integers(len(states), size=n)]
+    return X + rng.normal(scale=jitter * states.std(axis=0), size=X.shape)
+
+
+# The TreePolicy class is a decision tree fitted with scikit-learn, kept as plain arrays so it can
+# be evaluated and exported without scikit-learn.
+class TreePolicy:
+    def __init__(self, max_depth=DEFAULT_MAX_DEPTH, features=SENSORS):
+        self.max_depth = max_depth
+        self.features = list(features)
+
+    def fit(self, X, y):
+        from sklearn.tree import DecisionTreeClassifier
+
+        columns = [SENSORS.index(name) for name in self.features]
+        tree = DecisionTreeClassifier(max_depth=self.max_depth).fit(X[:, columns], y)
+        t = tree.tree_
+        # feature: Index into SENSORS of the split feature (-1 for leaves).
+        # threshold: Split value; the left child is taken when value <= threshold.
+        # leaf: Skill index returned by each leaf.
+        self.left = t.children_left.copy()
+        self.right = t.children_right.copy()
+        self.feature = np.where(t.feature >= 0, np.array(columns)[np.maximum(t.feature, 0)], -1)
+        self.threshold = t.threshold.copy()
+        self.leaf = tree.classes_[t.value[:, 0, :].argmax(axis=1)].astype(np.int64)
+        return self
+
+    def predict(self, X):
+        node = np.zeros(len(X), dtype=np.int64)
+        for _ in range(self.max_depth + 1):
+            inner = self.feature[node] >= 0
+            if not inner.any():
+                break
+            f = self.feature[node[inner]]
+            go_left = X[inner, f] <= self.threshold[node[inner]]
+            node[inner] = np.where(go_left, self.left[node[inner]], self.right[node[inner]])
+        return self.leaf[node]
+
+    # Returns the body of the generated select() function as nested if/else statements.
+    def source(self):
+        lines = []
+
+        def emit(node, depth):
+            indent = '    ' * (depth + 1)
+            if self.feature[node] < 0:
+                lines.append(f"{indent}return {int(self.leaf[node])}")
+                return
+            name = SENSORS[self.feature[node]]
+            lines.append(f"{indent}if obs['{name}'] <= {float(self.threshold[node])!r}:")
+            emit(self.left[node], depth + 1)
+            lines.append(f"{indent}else:")
+            emit(self.right[node], depth + 1)
+
+        emit(0, 0)
+        return '\n'.join(lines)
+
+
+# The TablePolicy class is a lookup table over a uniform grid of the chosen features,
+# storing the majority skill of the samples in each cell.
+class TablePolicy:
+    def __init__(self, bins=DEFAULT_BINS, features=('T', 'Ca', 'Cref')):
+        self.bins = bins
+        self.features = list(features)
+
+    def _cells(self, X):
+        columns = [SENSORS.index(name) for name in self.features]
+        scaled = (X[:, columns] - self.low) / (self.high - self.low) * self.bins
+        idx = np.clip(scaled.astype(np.int64), 0, self.bins - 1)
+        return np.ravel_multi_index(idx.T, (self.bins,) * len(self.features))
+
+    def fit(self, X, y):
+        columns = [SENSORS.index(name) for name in self.features]
+        self.low = X[:, columns].min(axis=0)
+        self.high = X[:, columns].max(axis=0)
+        self.high = np.where(self.high > self.low, self.high, self.low + 1)
+
+        cells = self._cells(X)
+        n_cells = self.bins ** len(self.features)
+        counts = np.zeros((n_cells, int(y.max()) + 1), dtype=np.int64)
+        np.add.at(counts, (cells, y), 1)
+        # Empty cells fall back to the most common skill overall.
+        self.table = np.where(counts.sum(axis=1) > 0, counts.argmax(axis=1), np.bincount(y).argmax())
+        return self
+
+    def predict(self, X):
+        return self.table[self._cells(X)]
+
+    # Returns the body of the generated select() function as a table lookup.
+    def source(self):
+        indent = '    '
+        lines = [f"{indent}cell = 0"]
+        for name, low, high in zip(self.features, self.low, self.high):
+            lines.append(f"{indent}i = int((obs['{name}'] - {float(low)!r}) / {float(high - low)!r} * {self.bins})")
+            lines.append(f"{indent}cell = cell * {self.bins} + min(max(i, 0), {self.bins - 1})")
+        lines.append(f"{indent}return TABLE[cell]")
+        return '\n'.join(lines)
+
+    def constants(self):
+        return f"TABLE = {self.table.tolist()!r}\n"
+
+
+# Compares the distilled policy with the original on held-out samples.
+def agreement_report(y_true, y_pred):
+    """
+    Returns:
+        A dictionary with the overall agreement rate, the agreement per original skill and the confusion matrix.
+        distill() adds the number of held-out samples as 'n_test'.
+    """
+    n = int(max(y_true.max(), y_pred.max())) + 1
+    confusion = np.zeros((n, n), dtype=np.int64)
+    np.add.at(confusion, (y_true, y_pred), 1)
+    per_skill = {skill: float(confusion[skill, skill] / confusion[skill].sum())
+                 for skill in range(n) if confusion[skill].sum()}
+    return {
+        'agreement': float(np.mean(y_true == y_pred)),
+        'per_skill': per_skill,
+        'confusion': confusion.tolist(),
+    }
+
+
+CONTROLLER_TEMPLATE = '''from typing import Dict, List
+from composabl_core import SkillController
+
+# Generated by cstr_common.distill from {policy} ({method}, agreement {agreement:.2%} on {n_test} held-out samples).
+# Do not edit by hand; re-run the distillation instead.
+
+SENSORS = {sensors!r}
+{constants}
+
+# Distilled skill-selection policy.
+def select(obs):
+{body}
+
+
+# The Controller class is a distilled skill selector.
+# It reproduces the learned selector's decisions with a fixed decision table, without a neural network.
+class Controller(SkillController):
+    def __init__(self, *args, **kwargs):
+        # Initialize tracking variables.
+        # counter: Tracks the number of steps or iterations the controller has executed.
+        self.counter = 0
+
+    # Computes the skill to run from the current observation.
+    async def compute_action(self, obs, action):
+        """
+        Args:
+            obs: Observations or sensor data from the environment.
+            action: The current action placeholder, to be replaced with computed actions.
+
+        Returns:
+            action: The index of the selected skill.
+        """
+        # Increment the step counter.
+        self.counter += 1
+
+        # Read the sensors by name from mappings (dictionaries, Observations) and by
+        # position from sequences (lists, tuples, arrays in SENSORS order).
+        if hasattr(obs, 'keys'):
+            obs = {{name: float(obs[name]) for name in SENSORS}}
+        else:
+            obs = {{name: float(value) for name, value in zip(SENSORS, obs)}}
+
+        return select(obs)
+
+    # Transforms the observed sensor data if needed.
+    # By default, this function returns the data unchanged.
+    async def transform_sensors(self, obs):
+        return obs
+
+    # Specifies the sensors that are relevant for this controller.
+    async def filtered_sensor_space(self):
+        return SENSORS
+
+    # Defines the success criteria for the skill.
+    # This implementation does not define any success criteria and always returns False.
+    async def compute_success_criteria(self, transformed_obs, action):
+        return False
+
+    # Determines whether to terminate the current episode.
+    # This implementation does not terminate episodes and always returns False.
+    async def compute_termination(self, transformed_obs, action):
+        return False
+'''
+
+PYPROJECT_TEMPLATE = '''[project]
+name = "Distilled Selector"
+version = "0.1.0"
+description = "Decision-table selector distilled from the learned selector for CSTR"
+authors = [{{ name = "John Doe", email = "john.doe@composabl.com" }}]
+dependencies = [
+    "composabl-core"
+]
+
+[composabl]
+type = "selector-controller"
+entrypoint = "{package}.controller:Controller"
+'''
+
+INIT = '''# Copyright (C) Composabl, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+'''
+
+
+# Writes the distilled policy as a selector-controller package.
+def export(distilled, output, policy_name, method, report, n_test):
+    package = os.path.basename(os.path.normpath(output)).replace('-', '_')
+    os.makedirs(os.path.join(output, package), exist_ok=True)
+
+    source = CONTROLLER_TEMPLATE.format(
+        policy=policy_name,
+        method=method,
+        agreement=report['agreement'],
+        n_test=n_test,
+        sensors=list(SENSORS),
+        constants=distilled.constants() if hasattr(distilled, 'constants') else '',
+        body=distilled.source(),
+    )
+    with open(os.path.join(output, package, 'controller.py'), 'w') as f:
+        f.write(source)
+    with open(os.path.join(output, package, '__init__.py'), 'w') as f:
+        f.write(INIT)
+    with open(os.path.join(output, 'pyproject.toml'), 'w') as f:
+        f.write(PYPROJECT_TEMPLATE.format(package=package))
+    return os.path.join(output, package, 'controller.py')
+
+
+# Samples the policy, fits the distilled policy and measures agreement on held-out samples.
+def distill(policy, method='tree', n_samples=DEFAULT_SAMPLES, test_fraction=0.2, seed=0,
+            trajectories=None, max_depth=DEFAULT_MAX_DEPTH, bins=DEFAULT_BINS, features=None):
+    """
+    Args:
+        policy: Callable mapping an (M, sensors) array to M skill indices.
+        method: 'tree' (decision tree, requires scikit-learn to fit) or 'table' (lookup table).
+        n_samples: Number of observations to sample.
+        test_fraction: Fraction of the samples held out for the agreement report.
+        seed: Seed of the sampling generator.
+        trajectories: Optional directory of recorded trajectories to sample states from instead of the box.
+        max_depth: Maximum depth of the decision tree.
+        bins: Number of grid cells per feature of the lookup table.
+        features: Sensor names the distilled policy may use.
+
+    Returns:
+        distilled, report: The fitted policy and its agreement report.
+    """
+    rng = np.random.default_rng(seed)
+    if trajectories:
+        X = sample_trajectories(n_samples, rng, trajectories)
+    else:
+        X = sample_box(n_samples, rng)
+    y = np.asarray(policy(X), dtype=np.int64)
+
+    n_test = int(n_samples * test_fraction)
+    X_train, y_train, X_test, y_test = X[n_test:], y[n_test:], X[:n_test], y[:n_test]
+
+    if method == 'tree':
+        distilled = TreePolicy(max_depth, features or SENSORS)
+    elif method == 'table':
+        distilled = TablePolicy(bins, features or ('T', 'Ca', 'Cref'))
+    else:
+        raise ValueError(f"Unknown distillation method: {method}")
+    distilled.fit(X_train, y_train)
+
+    report = agreement_report(y_test, distilled.predict(X_test))
+    report['n_test'] = n_test
+    return distilled, report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('policy', help="Trained selector policy as module:callable")
+    parser.add_argument('--method', choices=['tree', 'table'], default='tree')
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--trajectories', help="Sample states from recorded trajectories in this directory")
+    parser.add_argument('--max-depth', type=int, default=DEFAULT_MAX_DEPTH)
+    parser.add_argument('--bins', type=int, default=DEFAULT_BINS)
+    parser.add_argument('--features', nargs='+', choices=SENSORS)
+    parser.add_argument('--output', default='selectors/distilled-selector')
+    args = parser.parse_args(argv)
+
+    distilled, report = distill(load_policy(args.policy), args.method, args.samples, seed=args.seed,
+                                trajectories=args.trajectories, max_depth=args.max_depth, bins=args.bins,
+                                features=args.features)
+    n_test = report['n_test']
+    path = export(distilled, args.output, args.policy, args.method, report, n_test)
+
+    print(f"Agreement with {args.policy}: {report['agreement']:.2%} on {n_test} held-out samples")
+    for skill, rate in report['per_skill'].items():
+        print(f"  skill {skill}: {rate:.2%}")
+    print("Confusion matrix (rows: original, columns: distilled):")
+    for row in report['confusion']:
+        print('  ' + ' '.join(f"{v:7d}" for v in row))
+    print(f"Wrote {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,337 @@
+"""
+Local environment farm: worker processes that each host a slice of the CSTR reactors
+(cstr_common.cstr.CSTRBatch) and, optionally, this repo's perceptor/selector/skill stack.
+
+Observations, actions, rewards, episode flags and the selected skill are exchanged through one
+preallocated shared-memory block of NumPy arrays. A step is one command byte sent to each worker
+and one byte back; no arrays are pickled. Episodes reset automatically: where `done` is set, the
+observation already belongs to the next episode.
+
+Usage:
+    python -m cstr_common.farm --envs 256 --steps 900
+    python -m cstr_common.farm --envs 32 --selector selectors/programmed-selector \
+        --skills skills/pid skills/pid skills/pid
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import time
+import traceback
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from cstr_common.components import REPO_ROOT, load_component
+from cstr_common.cstr import CSTRBatch
+from cstr_common.observation import Observation
+from cstr_common.preload import preload_components, resolve_stack, stack_paths
+from cstr_common.rewards import RewardState, batch_reward
+from cstr_common.sensors import SENSORS
+
+# Commands sent to the workers and the acknowledgement they send back.
+_STEP, _RESET, _CLOSE = b's', b'r', b'c'
+_OK, _ERROR = b'k', b'e'
+
+# Array offsets in the shared block are aligned to cache lines.
+_ALIGN = 64
+
+
+# The SharedBuffers class lays out the per-environment arrays in one shared-memory block.
+# The trainer creates it; workers attach to it by name and use their slice of each array.
+class SharedBuffers:
+    # Field name, dtype and per-environment shape.
+    FIELDS = (
+        ('obs', np.float64, (len(SENSORS),)),
+        ('action', np.float64, ()),
+        ('reward', np.float64, ()),
+        ('done', np.bool_, ()),
+        ('skill', np.int64, ()),
+    )
+
+    def __init__(self, n, name=None):
+        """
+        Args:
+            n: Number of environments.
+            name: Name of an existing block to attach to. A new block is created if None.
+        """
+        offsets = []
+        size = 0
+        for _, dtype, shape in self.FIELDS:
+            offsets.append(size)
+            nbytes = n * int(np.prod(shape, dtype=np.int64)) * np.dtype(dtype).itemsize
+            size += -(-nbytes // _ALIGN) * _ALIGN
+
+        self.n = n
+        self.owner = name is None
+        self.shm = SharedMemory(name=name, create=self.owner, size=max(size, 1))
+        for (field, dtype, shape), offset in zip(self.FIELDS, offsets):
+            setattr(self, field, np.ndarray((n,) + shape, dtype=dtype, buffer=self.shm.buf, offset=offset))
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    # Releases the arrays and the mapping; the block itself is removed by its owner.
+    def close(self):
+        for field, _, _ in self.FIELDS:
+            setattr(self, field, None)
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# The StackRunner class hosts the repo's components for the reactors of one worker:
+# one perceptor, selector and set of skills per reactor, as the SDK creates them per environment.
+class StackRunner:
+    def __init__(self, stack, n):
+        """
+        Args:
+            stack: Dictionary with 'skills' (component directories indexed by the selector's action) and
+                   optionally 'selector' and 'perceptor' (component directories). Without a selector
+                   the first skill is used.
+            n: Number of reactors.
+        """
+        self.stack = stack
+        self.instances = [self._create() for _ in range(n)]
+
+    def _create(self):
+        return {
+            'perceptor': load_component(self.stack['perceptor']) if self.stack.get('perceptor') else None,
+            'selector': load_component(self.stack['selector']) if self.stack.get('selector') else None,
+            'skills': [load_component(path) for path in self.stack['skills']],
+        }
+
+    # Recreates the components of the reactors selected by mask for a new episode.
+    def reset(self, mask=None):
+        idx = range(len(self.instances)) if mask is None else np.flatnonzero(mask)
+        for j in idx:
+            self.instances[j] = self._create()
+
+    # Computes one action per reactor and writes it, with the selected skill, into the output arrays.
+    async def act(self, obs, actions, skills):
+        for j, components in enumerate(self.instances):
+            o = Observation(obs[j].copy())
+            if components['perceptor'] is not None:
+                o.extra.update(await components['perceptor'].compute(None, o))
+            skill = 0
+            if components['selector'] is not None:
+                skill = int(np.ravel(await components['selector'].compute_action(o, 0))[0])
+            action = await components['skills'][skill].compute_action(o, 0.0)
+            actions[j] = np.ravel(action)[0]
+            skills[j] = skill
+
+
+# Worker process: steps its slice of the reactors on command.
+def _worker(conn, shm_name, n_envs, start, stop, stack, seed, jitter):
+    buffers = SharedBuffers(n_envs, name=shm_name)
+    try:
+        _serve(conn, buffers, start, stop, stack, seed, jitter)
+    finally:
+        buffers.close()
+        conn.close()
+
+
+# Command loop of a worker. The array slices are local, so they are released before the buffers are closed.
+def _serve(conn, buffers, start, stop, stack, seed, jitter):
+    try:
+        loop = asyncio.new_event_loop()
+        env = CSTRBatch(stop - start, rng=np.random.default_rng(seed), jitter=jitter)
+        rewards = RewardState(stop - start)
+        runner = StackRunner(stack, stop - start) if stack else None
+    except Exception:
+        conn.send_bytes(_ERROR + traceback.format_exc().encode())
+        return
+
+    obs = buffers.obs[start:stop]
+    action = buffers.action[start:stop]
+    reward = buffers.reward[start:stop]
+    done = buffers.done[start:stop]
+    skill = buffers.skill[start:stop]
+
+    # The first observation of an episode is not rewarded, as in the teachers.
+    def begin(mask=None):
+        env.observe(out=obs)
+        rewards.reset(mask)
+        if mask is None:
+            rewards.started[:] = True
+            reward[:] = 0.0
+            done[:] = False
+            skill[:] = 0
+        else:
+            rewards.started[mask] = True
+
+    begin()
+    conn.send_bytes(_OK)
+
+    while True:
+        cmd = conn.recv_bytes()
+        if cmd == _CLOSE:
+            return
+        try:
+            if cmd == _STEP:
+                if runner is not None:
+                    loop.run_until_complete(runner.act(obs, action, skill))
+                done[:] = env.step(action)
+                env.observe(out=obs)
+                reward[:] = batch_reward(obs, rewards)
+                if done.any():
+                    env.reset(done)
+                    if runner is not None:
+                        runner.reset(done)
+                    begin(done.copy())
+            elif cmd == _RESET:
+                env.reset()
+                if runner is not None:
+                    runner.reset()
+                begin()
+            conn.send_bytes(_OK)
+        except Exception:
+            conn.send_bytes(_ERROR + traceback.format_exc().encode())
+
+
+# The Farm class is the trainer side: it creates the shared buffers, starts the workers and
+# exposes the buffers as NumPy arrays that are valid after every reset() and step().
+class Farm:
+    def __init__(self, n_envs, n_workers=None, stack=None, seed=0, jitter=0.0, context=None, preload=False):
+        """
+        Args:
+            n_envs: Total number of reactors.
+            n_workers: Number of worker processes (default: one per CPU, at most n_envs).
+            stack: Optional component stack hosted by the workers (see StackRunner). Without a stack,
+                   the actions are written by the trainer and passed to step().
+            seed: Seed for the workers' random generators (split with SeedSequence.spawn).
+            jitter: Relative standard deviation of the initial Ca and T.
+            context: multiprocessing start method ('fork', 'spawn', 'forkserver'); the platform default if None.
+            preload: If True, the stack's components load their heavy artifacts in this process before the
+                     workers are started (see cstr_common.preload). Forked workers share them copy-on-write.
+        """
+        n_workers = min(n_workers or os.cpu_count(), n_envs)
+        self.n_envs = n_envs
+        self.stack = stack
+        self.buffers = SharedBuffers(n_envs)
+        self.bounds = np.linspace(0, n_envs, n_workers + 1).astype(int)
+        self.preload_seconds = preload_components(stack_paths(stack)) if preload and stack else None
+
+        ctx = multiprocessing.get_context(context)
+        seeds = np.random.SeedSequence(seed).spawn(n_workers)
+        self._conns = []
+        self._procs = []
+        for w in range(n_workers):
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(target=_worker, daemon=True,
+                               args=(child, self.buffers.name, n_envs, self.bounds[w], self.bounds[w + 1],
+                                     stack, seeds[w], jitter))
+            proc.start()
+            child.close()
+            self._conns.append(parent)
+            self._procs.append(proc)
+        try:
+            self._collect()
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def obs(self):
+        return self.buffers.obs
+
+    # Process ids of the workers.
+    @property
+    def pids(self):
+        return [proc.pid for proc in self._procs]
+
+    # Waits for every worker's acknowledgement and re-raises worker errors.
+    def _collect(self):
+        errors = []
+        for w, conn in enumerate(self._conns):
+            reply = conn.recv_bytes()
+            if reply != _OK:
+                errors.append(f"worker {w}:\n{reply[1:].decode()}")
+        if errors:
+            raise RuntimeError('\n'.join(errors))
+
+    def _broadcast(self, cmd):
+        for conn in self._conns:
+            conn.send_bytes(cmd)
+        self._collect()
+
+    # Resets every reactor and returns the (n_envs, sensors) observation array.
+    def reset(self):
+        self._broadcast(_RESET)
+        return self.buffers.obs
+
+    # Advances every reactor by one step.
+    def step(self, actions=None):
+        """
+        Args:
+            actions: (n_envs,) ΔTc values. Required without a stack; with a stack the workers compute
+                     the actions and write them into `buffers.action`.
+
+        Returns:
+            (obs, reward, done) arrays backed by shared memory. They are overwritten by the next step.
+        """
+        if actions is not None:
+            self.buffers.action[:] = actions
+        elif self.stack is None:
+            raise ValueError("actions are required when the farm hosts no component stack")
+        self._broadcast(_STEP)
+        return self.buffers.obs, self.buffers.reward, self.buffers.done
+
+    def close(self):
+        if self.buffers is None:
+            return
+        for conn in self._conns:
+            try:
+                conn.send_bytes(_CLOSE)
+            except (BrokenPipeError, OSError):
+                pass
+        for proc in self._procs:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+        for conn in self._conns:
+            conn.close()
+        self.buffers.close()
+        self.buffers = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the collection throughput of the environment farm.")
+    parser.add_argument('--envs', type=int, default=256, help="Total number of reactors")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument('--steps', type=int, default=900, help="Steps to run")
+    parser.add_argument('--selector', default=None, help="Selector component directory hosted by the workers")
+    parser.add_argument('--skills', nargs='*', default=None, help="Skill component directories hosted by the workers")
+    parser.add_argument('--perceptor', default=None, help="Perceptor component directory hosted by the workers")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--preload', action='store_true', help="Preload the stack's components before forking the workers")
+    parser.add_argument('--root', default=REPO_ROOT, help="Directory the component directories are relative to (default: this repository)")
+    args = parser.parse_args(argv)
+
+    stack = None
+    if args.skills:
+        stack = resolve_stack({'selector': args.selector, 'skills': args.skills, 'perceptor': args.perceptor}, args.root)
+
+    with Farm(args.envs, args.workers, stack=stack, seed=args.seed, context='fork' if args.preload else None,
+              preload=args.preload) as farm:
+        rng = np.random.default_rng(args.seed)
+        episodes = 0
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            actions = None if stack else rng.uniform(-1, 1, args.envs)
+            _, _, done = farm.step(actions)
+            episodes += int(done.sum())
+        elapsed = time.perf_counter() - start
+        print(f"{len(farm._procs)} workers, {args.envs} envs: {args.envs * args.steps / elapsed:,.0f} env-steps/s, "
+              f"{episodes} episodes in {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+"""
+Load test for many concurrent agent sessions.
+
+A session is one simulated CSTR (cstr_common.cstr.CSTRBatch) with its own agent: an Orchestrator
+over fresh instances of a candidate's selector and skills (see cstr_common.compare) and, with
+--perceptor, a perceptor. Each session asks for an action every `period` seconds, as a plant with
+that sample time would, and all sessions of a process run as asyncio tasks on one event loop.
+Requests are scheduled open-loop: a step's latency runs from the time it was due to the time its
+action is returned, so it includes the time spent waiting behind other sessions' steps.
+
+The harness ramps the session count (doubling from --start) until the p99 latency exceeds the
+service-level objective (--slo-ms), and reports per level the throughput (steps/s) and the latency
+percentiles. With --processes P the sessions are split across P worker processes, which keep
+their sessions from one level to the next and start each level together. When a session's
+episode ends, its reactor is reset and its agent's components are restored to their state from
+before the first request (cstr_common.snapshot), so every episode starts from step 0 while the
+solvers the MPC skills built on first use are kept.
+GEKKO solves locally unless --gekko-remote is given; the `remote` column marks latencies that
+include the round trip to the GEKKO server.
+
+Usage:
+    python -m cstr_common.loadtest --controllers pid mpc gekko --period 1.0 --slo-ms 100
+    python -m cstr_common.loadtest --controllers mpc --processes 4 --max 512 --csv capacity.csv
+"""
+import argparse
+import asyncio
+import multiprocessing
+import time
+import traceback
+
+import numpy as np
+
+from cstr_common import snapshot
+from cstr_common.components import REPO_ROOT, load_component, resolve
+from cstr_common.compare import build, default_candidates
+from cstr_common.cstr import CSTRBatch
+from cstr_common.report import format_table, table_rows, write_csv
+
+# Seconds between two requests of a session (the plant's sample time).
+DEFAULT_PERIOD = 1.0
+# p99 step latency (ms) the harness ramps up to.
+DEFAULT_SLO_MS = 100.0
+# Requests per session per level, and the first ones of every session excluded from the latencies.
+DEFAULT_STEPS = 20
+DEFAULT_WARMUP = 2
+# Delay (s) between the start command and the first request, so every worker starts the level together.
+START_MARGIN = 0.2
+
+
+# The components of an agent that carry state between steps (those with snapshot()/restore()).
+def _components(orchestrator):
+    components = {f'skill{i}': skill for i, skill in enumerate(orchestrator.skills)}
+    components['selector'] = orchestrator.selector
+    components['perceptor'] = orchestrator.perceptor
+    return {name: c for name, c in components.items() if hasattr(c, 'snapshot') and hasattr(c, 'restore')}
+
+
+# The SessionPool class holds the sessions of one process. Sessions are created on demand and kept
+# between levels, so a level only pays for the sessions it adds.
+class SessionPool:
+    def __init__(self, candidate, perceptor=None, seed=0):
+        """
+        Args:
+            candidate: Candidate dictionary (see cstr_common.compare.default_candidates).
+            perceptor: Optional perceptor component directory added to every session.
+            seed: Seed of the sessions' initial-state jitter.
+        """
+        self.candidate = candidate
+        self.perceptor = perceptor
+        self.seed = seed
+        self.sessions = []
+
+    # Creates sessions until there are n. The agent's initial state is captured, then each new
+    # session serves one untimed request, so components that build their solver on first use (the
+    # MPC skills) are built here rather than during a level, and starts over from the initial state.
+    def grow(self, n):
+        while len(self.sessions) < n:
+            orchestrator = build(self.candidate)
+            if self.perceptor:
+                orchestrator.perceptor = load_component(self.perceptor)
+            components = _components(orchestrator)
+            initial = snapshot.capture(components)
+            env = CSTRBatch(1, rng=np.random.default_rng(self.seed + len(self.sessions)), jitter=0.01)
+            asyncio.run(orchestrator.step(env.observe()[0]))
+            env.reset()
+            snapshot.restore(components, initial)
+            self.sessions.append((orchestrator, env, components, initial))
+
+    def close(self):
+        for orchestrator, *_ in self.sessions:
+            orchestrator.close()
+        self.sessions = []
+
+    # One session's requests, each due `period` seconds after the previous one. When the episode
+    # ends, the reactor is reset and the agent restored to its initial state.
+    @staticmethod
+    async def _session(session, first_due, period, steps, latencies):
+        orchestrator, env, components, initial = session
+        obs = env.observe()
+        for k in range(steps):
+            due = first_due + k * period
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            action = await orchestrator.step(obs[0])
+            latencies[k] = time.perf_counter() - due
+            if env.step(np.array([np.ravel(action)[0]], dtype=np.float64))[0]:
+                env.reset()
+                snapshot.restore(components, initial)
+            env.observe(out=obs)
+
+    # Runs the first n sessions (created with grow()) for `steps` requests each, their first requests
+    # spread over one period.
+    async def run(self, n, period, steps, start):
+        """
+        Args:
+            start: perf_counter() time of the first request.
+
+        Returns:
+            (n, steps) array of step latencies (s) and the wall time (s) from start to the last action.
+        """
+        latencies = np.full((n, steps), np.nan)
+        await asyncio.gather(*(self._session(session, start + i * period / n, period, steps, latencies[i])
+                               for i, session in enumerate(self.sessions[:n])))
+        return latencies, time.perf_counter() - start
+
+
+# Worker process: keeps a SessionPool and builds or runs its share of each level on command.
+def _worker(conn, candidate, perceptor, seed):
+    pool = SessionPool(candidate, perceptor, seed)
+    try:
+        while True:
+            command, args = conn.recv()
+            if command == 'close':
+                break
+            try:
+                if command == 'grow':
+                    pool.grow(args)
+                    conn.send(('ok', None))
+                else:
+                    n, period, steps, start_wall = args
+                    # perf_counter() has no common origin across processes; translate from the wall clock.
+                    start = time.perf_counter() + (start_wall - time.time())
+                    conn.send(('ok', asyncio.run(pool.run(n, period, steps, start))))
+            except Exception:
+                conn.send(('error', traceback.format_exc()))
+    finally:
+        pool.close()
+        conn.close()
+
+
+# Runs the ramp for one candidate and returns one row per level, up to the first one that breaks the SLO.
+def ramp(candidate, levels, processes=1, period=DEFAULT_PERIOD, steps=DEFAULT_STEPS, warmup=DEFAULT_WARMUP,
+         slo_ms=DEFAULT_SLO_MS, perceptor=None, seed=0):
+    workers = []
+    pool = None
+    if processes > 1:
+        ctx = multiprocessing.get_context('spawn')
+        for p in range(processes):
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(target=_worker, args=(child, candidate, perceptor, seed + 100_000 * p), daemon=True)
+            proc.start()
+            child.close()
+            workers.append((parent, proc))
+    else:
+        pool = SessionPool(candidate, perceptor, seed)
+
+    # Sends a command to every worker with a share of the sessions and returns their results.
+    def broadcast(command, shares, make_args):
+        for (conn, _), share in zip(workers, shares):
+            if share:
+                conn.send((command, make_args(share)))
+        results = []
+        for (conn, _), share in zip(workers, shares):
+            if share:
+                status, result = conn.recv()
+                if status == 'error':
+                    raise RuntimeError(result.strip().splitlines()[-1])
+                results.append(result)
+        return results
+
+    rows = []
+    try:
+        for n in levels:
+            build_start = time.perf_counter()
+            if workers:
+                shares = [len(part) for part in np.array_split(np.arange(n), processes)]
+                broadcast('grow', shares, lambda share: share)
+                start_wall = time.time() + START_MARGIN
+                results = broadcast('run', shares, lambda share: (share, period, steps, start_wall))
+            else:
+                pool.grow(n)
+                start = time.perf_counter() + START_MARGIN
+                results = [asyncio.run(pool.run(n, period, steps, start))]
+            build_s = time.perf_counter() - build_start - START_MARGIN - max(wall for _, wall in results)
+
+            latencies = np.concatenate([lat[:, warmup:].ravel() for lat, _ in results]) * 1e3
+            wall = max(wall for _, wall in results)
+            p99 = float(np.percentile(latencies, 99))
+            rows.append({
+                'controller': candidate['name'],
+                'remote': candidate.get('remote', False),
+                'sessions': n,
+                'processes': processes,
+                'offered_per_s': n / period,
+                'steps_per_s': n * steps / wall,
+                'p50_ms': float(np.percentile(latencies, 50)),
+                'p99_ms': p99,
+                'max_ms': float(latencies.max()),
+                'slo_met': p99 <= slo_ms,
+                'build_s': build_s,
+            })
+            if p99 > slo_ms:
+                break
+    except Exception as e:
+        rows.append({'controller': candidate['name'], 'remote': candidate.get('remote', False),
+                     'sessions': n, 'processes': processes,
+                     'error': f"{type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}"})
+    finally:
+        if pool is not None:
+            pool.close()
+        for conn, proc in workers:
+            try:
+                conn.send(('close', None))
+            except OSError:
+                pass
+            proc.join(timeout=10)
+            if proc.is_alive():
+                proc.terminate()
+    return rows
+
+
+# Session counts of the ramp: start, 2 start, 4 start, ... up to maximum.
+def levels(start, maximum):
+    counts = []
+    n = start
+    while n <= maximum:
+        counts.append(n)
+        n *= 2
+    return counts
+
+
+# The capacity of a candidate: the largest session count of the ramp that met the SLO.
+def capacity(rows):
+    met = [row['sessions'] for row in rows if row.get('slo_met')]
+    return max(met) if met else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ramp concurrent CSTR agent sessions until the latency SLO breaks.")
+    parser.add_argument('--controllers', nargs='+', default=['pid', 'mpc', 'gekko'],
+                        help="Candidate names (see cstr_common.compare)")
+    parser.add_argument('--perceptor', default=None, help="Perceptor component directory added to every session")
+    parser.add_argument('--processes', type=int, default=1, help="Processes the sessions are split across")
+    parser.add_argument('--start', type=int, default=1, help="Sessions on the first level")
+    parser.add_argument('--max', type=int, default=4096, help="Largest session count tried")
+    parser.add_argument('--period', type=float, default=DEFAULT_PERIOD, help="Seconds between a session's requests")
+    parser.add_argument('--steps', type=int, default=DEFAULT_STEPS, help="Requests per session per level")
+    parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP, help="First requests of a session not measured")
+    parser.add_argument('--slo-ms', type=float, default=DEFAULT_SLO_MS, help="p99 step latency objective (ms)")
+    parser.add_argument('--gekko-remote', action='store_true', help="Solve the GEKKO candidate on the public GEKKO server")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--csv', help="Write the table to a CSV file")
+    parser.add_argument('--root', default=REPO_ROOT, help="Directory the component directories are relative to (default: this repository)")
+    args = parser.parse_args(argv)
+    if args.warmup >= args.steps:
+        parser.error("--warmup must be smaller than --steps")
+
+    candidates = [c for c in default_candidates(gekko_remote=args.gekko_remote, root=args.root)
+                  if c['name'] in args.controllers]
+    perceptor = resolve(args.perceptor, args.root) if args.perceptor else None
+    rows = []
+    for candidate in candidates:
+        result = ramp(candidate, levels(args.start, args.max), args.processes, args.period, args.steps,
+                      args.warmup, args.slo_ms, perceptor, args.seed)
+        rows += result
+        remote = " (remote solver, latency includes the network)" if candidate.get('remote') else ""
+        print(f"{candidate['name']}{remote}: {capacity(result)} sessions within p99 <= {args.slo_ms:g} ms", flush=True)
+
+    rows = table_rows(rows)
+    print(format_table(rows))
+    if args.csv:
+        write_csv(args.csv, rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""
+Memory-growth profiling for long-running agents.
+
+Runs one set of component instances (perceptor, selector, skills and a teacher) through many
+consecutive CSTR episodes, as a long-running agent does, with tracemalloc enabled. A snapshot is
+taken every `interval` steps and at the end of every episode, and the growth since the previous
+one is attributed two ways:
+
+    tracemalloc    bytes still allocated from code in each component's directory (any frame of the
+                   allocation's traceback), so growth inside numpy or do_mpc on a component's behalf
+                   is charged to the component
+    retained       bytes reachable from each instance (its attributes, containers and NumPy
+                   buffers), which separates two instances of the same component
+
+Memory held by native libraries outside Python's allocator (CasADi/IPOPT, the GEKKO server) is not
+seen by either.
+
+The report has one row per episode. After the warm-up episodes (one-off allocations such as
+building the MPC), the growth per step of the traced memory is compared with a threshold, and the
+run fails (exit code 1) if it is exceeded; the instance that grew the most is named.
+
+Usage:
+    python -m cstr_common.memprofile --skills skills/pid --teacher skills/control_reaction --episodes 20
+    python -m cstr_common.memprofile --skills skills/mpc-skill-group --threshold 512 --csv memory.csv
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tracemalloc
+import types
+
+import numpy as np
+
+from cstr_common.components import REPO_ROOT, load_component, read_manifest
+from cstr_common.cstr import EPISODE_STEPS, CSTRBatch
+from cstr_common.observation import Observation
+from cstr_common.preload import preload_components, resolve_stack, stack_paths
+from cstr_common.report import format_table, write_csv
+
+# Frames stored per allocation: enough to reach a component's frame from inside numpy. Every traced
+# allocation (the environment's included) pays for each frame; raise it for allocations deep inside do_mpc.
+TRACEBACK_FRAMES = 8
+# Default growth per step (bytes) above which a run fails.
+DEFAULT_THRESHOLD = 256
+# Episodes excluded from the growth per step.
+DEFAULT_WARMUP = 2
+
+# Objects retained_bytes() does not descend into: code and module-level objects shared by all instances.
+_SHARED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+                 types.CodeType, types.FrameType)
+
+
+# Bytes reachable from an object: its size and, recursively, that of its attributes and container
+# items, with NumPy arrays counted by their buffers. Each object is counted once.
+def retained_bytes(obj):
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, _SHARED_TYPES):
+            continue
+        seen.add(id(o))
+        if isinstance(o, np.ndarray):
+            total += sys.getsizeof(o) + (o.nbytes if o.base is None else 0)
+            if o.base is not None:
+                stack.append(o.base)
+            continue
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        elif hasattr(o, '__dict__'):
+            stack.append(vars(o))
+        for name in getattr(type(o), '__slots__', ()):
+            if hasattr(o, name):
+                stack.append(getattr(o, name))
+    return total
+
+
+# The MemoryProfiler class tracks the memory of named component instances over consecutive episodes.
+# Call sample() every step and end_episode() after every episode; report() returns the per-episode rows.
+class MemoryProfiler:
+    def __init__(self, instances, interval=EPISODE_STEPS, frames=TRACEBACK_FRAMES):
+        """
+        Args:
+            instances: Dictionary of name -> component instance.
+            interval: Steps between intermediate snapshots (their top growing line is reported).
+            frames: Traceback frames stored per allocation.
+        """
+        self.instances = instances
+        self.interval = interval
+        self.frames = frames
+        # Directory of the module each instance's class is defined in; allocations with a frame there are charged to it.
+        self._dirs = {name: os.path.dirname(sys.modules[type(obj).__module__].__file__) + os.sep
+                      for name, obj in instances.items()}
+        self.rows = []
+        self.steps = 0
+        self._episode_steps = 0
+        self._top = None
+        self._last = None
+        self._last_sample = None
+
+    def start(self):
+        tracemalloc.start(self.frames)
+        self._last = self._measure(self._snapshot())
+        self._last_sample = None
+
+    def stop(self):
+        tracemalloc.stop()
+
+    # Snapshot without the profiler's own allocations (the snapshots it keeps and its report).
+    @staticmethod
+    def _snapshot():
+        return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                                          tracemalloc.Filter(False, __file__)])
+
+    # Traced bytes in total and per instance directory, and retained bytes per instance.
+    def _measure(self, snapshot):
+        # One pass over the distinct tracebacks; the directories a file belongs to are looked up once per file.
+        owners = {}
+        traced = dict.fromkeys(self._dirs, 0)
+        total = 0
+        for stat in snapshot.statistics('traceback'):
+            total += stat.size
+            charged = set()
+            for frame in stat.traceback:
+                if frame.filename not in owners:
+                    owners[frame.filename] = [name for name, d in self._dirs.items() if frame.filename.startswith(d)]
+                charged.update(owners[frame.filename])
+            for name in charged:
+                traced[name] += stat.size
+        return {'snapshot': snapshot, 'total': total, 'traced': traced,
+                'retained': {name: retained_bytes(obj) for name, obj in self.instances.items()}}
+
+    # Counts a step, and every `interval` steps records the line whose allocations grew the most.
+    def sample(self):
+        self.steps += 1
+        self._episode_steps += 1
+        if self._episode_steps % self.interval == 0:
+            snapshot = self._snapshot()
+            previous = self._last_sample if self._last_sample is not None else self._last['snapshot']
+            # compare_to() sorts by absolute difference, so the largest growth is not necessarily first.
+            top = max(snapshot.compare_to(previous, 'lineno'), key=lambda stat: stat.size_diff, default=None)
+            if top is not None and top.size_diff > 0 and (self._top is None or top.size_diff > self._top.size_diff):
+                self._top = top
+            self._last_sample = snapshot
+
+    # Takes the end-of-episode snapshot and appends the episode's row to the report.
+    def end_episode(self):
+        current = self._measure(self._snapshot())
+        steps = max(self._episode_steps, 1)
+        row = {
+            'episode': len(self.rows),
+            'steps': self._episode_steps,
+            'traced_kb': current['total'] / 1024,
+            'growth_kb': (current['total'] - self._last['total']) / 1024,
+            'growth_per_step': (current['total'] - self._last['total']) / steps,
+        }
+        for name in self.instances:
+            row[f'{name}_traced_kb'] = (current['traced'][name] - self._last['traced'][name]) / 1024
+            row[f'{name}_retained_kb'] = current['retained'][name] / 1024
+        top = self._top
+        row['top_line'] = (f"{top.traceback[0].filename.rsplit(os.sep, 2)[-1]}:{top.traceback[0].lineno} "
+                           f"+{top.size_diff / 1024:.1f} KB") if top is not None else ''
+        self.rows.append(row)
+        self._last = current
+        self._last_sample = None
+        self._episode_steps = 0
+        self._top = None
+        return row
+
+    def report(self):
+        return self.rows
+
+    # Growth per step of the traced memory after the warm-up episodes, and the instance whose retained size grew the most.
+    def growth(self, warmup=DEFAULT_WARMUP):
+        """
+        Returns:
+            (bytes per step, instance name), or (nan, None) if no episode follows the warm-up.
+        """
+        rows = self.rows[warmup:]
+        if not rows:
+            return float('nan'), None
+        steps = sum(row['steps'] for row in rows)
+        per_step = sum(row['growth_kb'] for row in rows) * 1024 / steps
+        first = self.rows[warmup - 1] if warmup > 0 else None
+        grown = {name: rows[-1][f'{name}_retained_kb'] - (first[f'{name}_retained_kb'] if first else 0.0)
+                 for name in self.instances}
+        return per_step, max(grown, key=grown.get)
+
+
+# Builds the instances of a stack, named by role and component directory.
+def build_instances(stack):
+    instances = {}
+    for role in ('perceptor', 'selector', 'teacher'):
+        if stack.get(role):
+            instances[f'{role}:{os.path.basename(stack[role])}'] = load_component(stack[role])
+    for i, path in enumerate(stack['skills']):
+        instances[f'skill{i}:{os.path.basename(path)}'] = load_component(path)
+    return instances
+
+
+# Runs the stack through consecutive episodes with the same instances, profiling every step. The
+# components' preload() hooks run first, so imports and shared artifacts are not traced.
+async def profile(stack, episodes, interval=EPISODE_STEPS, frames=TRACEBACK_FRAMES, jitter=0.0, seed=0):
+    preload_components(stack_paths(stack))
+    instances = build_instances(stack)
+    names = {role: next((name for name in instances if name.startswith(f'{role}:')), None)
+             for role in ('perceptor', 'selector', 'teacher')}
+    skills = [instances[name] for name in instances if name.startswith('skill')]
+    env = CSTRBatch(1, rng=np.random.default_rng(seed), jitter=jitter)
+    profiler = MemoryProfiler(instances, interval, frames)
+    profiler.start()
+    try:
+        for _ in range(episodes):
+            env.reset()
+            for _ in range(EPISODE_STEPS):
+                obs = Observation(env.observe()[0].copy())
+                if names['perceptor']:
+                    obs.extra.update(await instances[names['perceptor']].compute(None, obs))
+                skill = 0
+                if names['selector']:
+                    skill = int(np.ravel(await instances[names['selector']].compute_action(obs, 0))[0])
+                action = await skills[skill].compute_action(obs, 0.0)
+                if names['teacher']:
+                    await instances[names['teacher']].compute_reward(obs, action, 0.0)
+                env.step(np.array([np.ravel(action)[0]], dtype=np.float64))
+                profiler.sample()
+            profiler.end_episode()
+    finally:
+        profiler.stop()
+    return profiler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profile memory growth of a long-running agent stack.")
+    parser.add_argument('--skills', nargs='+', default=['skills/pid'], help="Skill component directories")
+    parser.add_argument('--selector', default=None, help="Selector component directory")
+    parser.add_argument('--perceptor', default=None, help="Perceptor component directory")
+    parser.add_argument('--teacher', default=None, help="Teacher component directory; it scores every step")
+    parser.add_argument('--episodes', type=int, default=20)
+    parser.add_argument('--interval', type=int, default=EPISODE_STEPS, help="Steps between intermediate snapshots")
+    parser.add_argument('--frames', type=int, default=TRACEBACK_FRAMES, help="Traceback frames stored per allocation")
+    parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP, help="Episodes excluded from the growth per step")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Fail if the traced memory grows by more than this many bytes per step")
+    parser.add_argument('--csv', help="Write the per-episode report to a CSV file")
+    parser.add_argument('--root', default=REPO_ROOT, help="Directory the component directories are relative to (default: this repository)")
+    args = parser.parse_args(argv)
+
+    stack = resolve_stack({'skills': args.skills, 'selector': args.selector, 'perceptor': args.perceptor,
+                           'teacher': args.teacher}, args.root)
+    for path in stack_paths(stack) + [stack['teacher']]:
+        if path:
+            read_manifest(path)  # fail early on a wrong directory
+    profiler = asyncio.run(profile(stack, args.episodes, args.interval, args.frames))
+    rows = profiler.report()
+    print(format_table(rows))
+    if args.csv:
+        write_csv(args.csv, rows)
+
+    per_step, culprit = profiler.growth(args.warmup)
+    if per_step > args.threshold:
+        print(f"FAIL: memory grows by {per_step:.0f} bytes/step after {args.warmup} warm-up episodes "
+              f"(threshold {args.threshold:.0f}); largest retained growth: {culprit}")
+        sys.exit(1)
+    print(f"OK: memory grows by {per_step:.0f} bytes/step after {args.warmup} warm-up episodes (threshold {args.threshold:.0f})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Seeded Monte Carlo robustness evaluation under measurement noise.
+
+Runs many 90-step episodes per controller candidate (see cstr_common.compare) and noise level in
+parallel worker processes, and aggregates the runaway probability and the distributions of the
+tracking error and peak temperature. An episode counts as a runaway when T reaches
+cstr_common.cstr.RUNAWAY_TEMPERATURE (380 K, just below the ignited steady states).
+
+Every episode gets its own SeedSequence, spawned from the root seed by episode index. It seeds the
+reactor's initial-state jitter and, through the `seed` constructor argument, each skill's noise
+generator. The results therefore do not depend on the number of workers or the scheduling, and a
+given seed reproduces them bit for bit. The same episode seeds are used for every candidate and
+noise level, so the comparisons are paired. The noise level is passed to the skills as `noise`:
+the MPC skills add it to their measurements, and skills without a noise model ignore it.
+
+Usage:
+    python -m cstr_common.montecarlo --candidate mpc pid --noise 0 0.005 0.01 --episodes 1000
+    python -m cstr_common.montecarlo --candidate programmed-selector --noise 0.01 --save runs.npz
+
+    # Ignites: the PID overshoots to ~383 K, and noisy measurements push the MPC over (p_runaway ~0.9).
+    python -m cstr_common.montecarlo --candidate pid mpc --noise 0.05 --episodes 8 --jitter 0.02
+"""
+import argparse
+import asyncio
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from cstr_common.compare import DEFAULT_SELECTOR_SKILLS, control_kpis, default_candidates, run_episode
+from cstr_common.components import REPO_ROOT
+from cstr_common.cstr import CSTRBatch
+from cstr_common.report import format_table, write_csv
+
+# Per-episode KPIs, in the column order of the result arrays.
+KPIS = ('rms_Ca', 'max_T', 'runaways', 'product')
+
+# z value of the 95% Wilson interval for the runaway probability.
+Z_95 = 1.959964
+
+
+# Runs the episodes with the given seeds; executed in the worker processes.
+def _run_chunk(candidate, noise, jitter, seeds):
+    results = np.empty((len(seeds), len(KPIS)))
+    for row, seed in enumerate(seeds):
+        env_seed, skill_seed = seed.spawn(2)
+        env = CSTRBatch(1, rng=np.random.default_rng(env_seed), jitter=jitter)
+        skill_kwargs = [{'noise': noise, 'seed': s} for s in skill_seed.spawn(len(candidate['skills']))]
+        observations, _ = asyncio.run(run_episode(candidate, env, skill_kwargs))
+        kpis = control_kpis(observations)
+        results[row] = [kpis[k] for k in KPIS]
+    return results
+
+
+# Runs n_episodes of one candidate at one noise level.
+def simulate(candidate, noise, n_episodes, seed=0, jitter=0.0, executor=None, chunk_size=None):
+    """
+    Returns:
+        (n_episodes, len(KPIS)) array of per-episode KPIs, ordered by episode index.
+    """
+    seeds = np.random.SeedSequence(seed).spawn(n_episodes)
+    if executor is None:
+        return _run_chunk(candidate, noise, jitter, seeds)
+    chunk_size = chunk_size or max(1, math.ceil(n_episodes / (4 * (os.cpu_count() or 1))))
+    chunks = [seeds[i:i + chunk_size] for i in range(0, n_episodes, chunk_size)]
+    futures = [executor.submit(_run_chunk, candidate, noise, jitter, chunk) for chunk in chunks]
+    return np.concatenate([future.result() for future in futures])
+
+
+# Wilson score interval for a binomial proportion.
+def wilson_interval(successes, n, z=Z_95):
+    if n == 0:
+        return float('nan'), float('nan')
+    p = successes / n
+    center = (p + z**2 / (2 * n)) / (1 + z**2 / n)
+    half = z * math.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / (1 + z**2 / n)
+    return center - half, center + half
+
+
+# Aggregates the per-episode KPIs of one candidate and noise level.
+def summarize(results):
+    rms = results[:, KPIS.index('rms_Ca')]
+    max_T = results[:, KPIS.index('max_T')]
+    runaway = results[:, KPIS.index('runaways')] > 0
+    low, high = wilson_interval(int(runaway.sum()), len(results))
+    return {
+        'episodes': len(results),
+        'p_runaway': float(runaway.mean()),
+        'p_runaway_lo': low,
+        'p_runaway_hi': high,
+        'rms_Ca_mean': float(rms.mean()),
+        'rms_Ca_p50': float(np.percentile(rms, 50)),
+        'rms_Ca_p95': float(np.percentile(rms, 95)),
+        'rms_Ca_p99': float(np.percentile(rms, 99)),
+        'max_T_p50': float(np.percentile(max_T, 50)),
+        'max_T_p95': float(np.percentile(max_T, 95)),
+        'product_mean': float(results[:, KPIS.index('product')].mean()),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monte Carlo robustness evaluation under measurement noise.")
+    parser.add_argument('--candidate', nargs='+', default=['mpc'], help="Candidate names (see cstr_common.compare)")
+    parser.add_argument('--selector-skills', nargs='+', default=list(DEFAULT_SELECTOR_SKILLS))
+    parser.add_argument('--policy', help="Learned selector policy as module:callable")
+    parser.add_argument('--noise', type=float, nargs='+', default=[0.0, 0.01], help="Measurement noise levels")
+    parser.add_argument('--episodes', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--jitter', type=float, default=0.0, help="Relative std of the initial Ca and T")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--csv', help="Write the summary table to a CSV file")
+    parser.add_argument('--save', help="Write the per-episode KPIs to an .npz file")
+    parser.add_argument('--root', default=REPO_ROOT, help="Directory the component directories are relative to (default: this repository)")
+    args = parser.parse_args(argv)
+
+    candidates = {c['name']: c for c in default_candidates(args.selector_skills, args.policy, root=args.root)}
+    rows = []
+    runs = {}
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for name in args.candidate:
+            for noise in args.noise:
+                results = simulate(candidates[name], noise, args.episodes, args.seed, args.jitter, executor)
+                runs[f"{name}/{noise:g}"] = results
+                rows.append(dict({'candidate': name, 'noise': noise}, **summarize(results)))
+
+    print(format_table(rows))
+    if args.csv:
+        write_csv(args.csv, rows)
+    if args.save:
+        np.savez_compressed(args.save, kpis=np.array(KPIS), seed=args.seed, **runs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import numpy as np
+
+from cstr_common.sensors import SENSOR_INDEX, SENSORS
+
+# Name of the sensor variable added by the thermal runaway perceptor.
+RUNAWAY_PREDICT = 'thermal_runaway_predict'
+
+
+# The Observation class is the typed CSTR observation shared by the skills, selectors,
+# teachers and perceptor. The eight sensor values live in one float64 array; name and
+# index access read from that array directly, so an observation is parsed once per step
+# and then passed around instead of being rebuilt as a dictionary by every component.
+# Variables that are not CSTR sensors (such as perceptor outputs) are kept in `extra`.
+class Observation:
+    __slots__ = ('values', 'extra')
+
+    def __init__(self, values, extra=None):
+        """
+        Args:
+            values: Array of the sensor values in SENSORS order. A float64 array is used without copying.
+            extra: Optional dictionary of additional named variables.
+        """
+        self.values = np.asarray(values, dtype=np.float64)
+        self.extra = extra if extra is not None else {}
+
+    # Builds an observation from a dictionary keyed by sensor name. Missing sensors are NaN;
+    # keys that are not sensors are kept in `extra`.
+    @classmethod
+    def from_dict(cls, obs):
+        values = np.full(len(SENSORS), np.nan)
+        extra = {}
+        for key, value in obs.items():
+            i = SENSOR_INDEX.get(key)
+            if i is None:
+                extra[key] = value
+            else:
+                values[i] = float(value)
+        return cls(values, extra)
+
+    # Builds an observation from a list or array in SENSORS order. Shorter sequences
+    # (such as the five-element list the SDK passes to some skills) leave the rest NaN.
+    @classmethod
+    def from_list(cls, obs):
+        n = min(len(obs), len(SENSORS))
+        values = np.full(len(SENSORS), np.nan)
+        values[:n] = np.asarray(obs[:n], dtype=np.float64)
+        return cls(values)
+
+    # Returns obs as an Observation, converting dictionaries and lists. An Observation is returned as is.
+    @classmethod
+    def of(cls, obs):
+        if isinstance(obs, cls):
+            return obs
+        if isinstance(obs, dict):
+            return cls.from_dict(obs)
+        return cls.from_list(obs)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            i = SENSOR_INDEX.get(key)
+            if i is None:
+                return self.extra[key]
+            return self.values.item(i)
+        return self.values.item(key)
+
+    def __setitem__(self, key, value):
+        if isinstance(key, str):
+            i = SENSOR_INDEX.get(key)
+            if i is None:
+                self.extra[key] = value
+                return
+            key = i
+        self.values[key] = value
+
+    def __contains__(self, key):
+        return key in SENSOR_INDEX or key in self.extra
+
+    def __len__(self):
+        return len(SENSORS) + len(self.extra)
+
+    # Iterates over the variable names, like a dictionary.
+    def __iter__(self):
+        yield from SENSORS
+        yield from self.extra
+
+    def keys(self):
+        return list(self)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    # Returns a plain dictionary with the sensor values and the extra variables.
+    def to_dict(self):
+        obs = dict(zip(SENSORS, self.values.tolist()))
+        obs.update(self.extra)
+        return obs
+
+    def copy(self):
+        return Observation(self.values.copy(), dict(self.extra))
+
+    def __repr__(self):
+        return f"Observation({self.to_dict()})"
+
+
+# Attribute access for every sensor (obs.T, obs.Ca, ...), reading straight from the array.
+def _sensor_property(i):
+    return property(lambda self: self.values.item(i), doc=f"{SENSORS[i]} sensor value.")
+
+
+for _i, _name in enumerate(SENSORS):
+    setattr(Observation, _name, _sensor_property(_i))
+
+
+# Returns the thermal runaway prediction carried by an observation, in any of the formats the SDK
+# uses for perceptor-augmented observations: an Observation or dictionary with the
+# `thermal_runaway_predict` variable, a dictionary wrapping the raw `observation` array,
+# or the raw array itself, where the prediction is at index 5.
+def runaway_predict(obs):
+    if isinstance(obs, Observation):
+        return obs.extra[RUNAWAY_PREDICT]
+    if isinstance(obs, dict):
+        if 'observation' in obs:
+            return obs['observation'][5]
+        return obs[RUNAWAY_PREDICT]
+    return obs[5]
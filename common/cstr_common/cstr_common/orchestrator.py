@@ -0,0 +1,168 @@
+import asyncio
+import inspect
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from cstr_common.observation import Observation
+from cstr_common.sensors import SENSORS
+
+# Stages of an agent step, in dependency order. 'speculative' is the likely next skill's action,
+# computed concurrently with the perceptor and selector.
+STAGES = ('perceptor', 'selector', 'speculative', 'skill', 'teacher')
+
+_local = threading.local()
+
+
+# Runs a component method to completion on the calling thread. The components' coroutines do not
+# wait on anything, so each worker thread drives them on its own event loop.
+def _run(fn, args):
+    result = fn(*args)
+    if inspect.isawaitable(result):
+        loop = getattr(_local, 'loop', None)
+        if loop is None:
+            loop = _local.loop = asyncio.new_event_loop()
+        result = loop.run_until_complete(result)
+    return result
+
+
+# The Orchestrator class runs one agent step through the dependency graph
+# perceptor -> selector -> skill -> teacher transform_action.
+#
+# With speculation on, the skill selected on the previous step computes its action while the
+# perceptor and selector run. The guess is used only for skills that read the CSTR sensors
+# alone (so the perceptor output cannot change their action) and that provide snapshot()/restore():
+# when the selector picks another skill, the speculative skill is rolled back to its state before
+# the step. A rolled-back step may still have written a trajectory row for that skill.
+#
+# Stages run on worker threads, so solver code that releases the GIL (and remote solver calls)
+# overlaps with the other stages. The timings show how far the step latency falls below the
+# sum of its stages.
+class Orchestrator:
+    def __init__(self, skills, selector=None, perceptor=None, teacher=None, speculate=True, threads=True):
+        """
+        Args:
+            skills: Skill controllers indexed by the selector's action.
+            selector: Optional selector controller; without one the first skill is always used.
+            perceptor: Optional perceptor; its outputs are added to the observation before the selector runs.
+            teacher: Optional teacher whose transform_action is applied to the skill's action.
+            speculate: If True, the previous step's skill runs concurrently with the perceptor and selector.
+            threads: If True, stages run on worker threads; otherwise they run on the event loop.
+        """
+        self.skills = list(skills)
+        self.selector = selector
+        self.perceptor = perceptor
+        self.teacher = teacher
+        self.speculate = speculate
+        self.executor = ThreadPoolExecutor(max_workers=3) if threads else None
+        self.last_skill = None
+        self._independent = {}
+
+        # Per-stage and per-step durations (seconds) and the speculation outcome counts.
+        self.timings = {stage: [] for stage in STAGES + ('step',)}
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    async def _stage(self, stage, fn, *args):
+        start = time.perf_counter()
+        if self.executor is not None:
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, _run, fn, args)
+        else:
+            result = fn(*args)
+            if inspect.isawaitable(result):
+                result = await result
+        self.timings[stage].append(time.perf_counter() - start)
+        return result
+
+    # True if skill i can run before the perceptor output is known and be rolled back.
+    async def _can_speculate(self, i):
+        if i not in self._independent:
+            skill = self.skills[i]
+            sensors = await skill.filtered_sensor_space() if hasattr(skill, 'filtered_sensor_space') else None
+            self._independent[i] = (hasattr(skill, 'snapshot') and hasattr(skill, 'restore')
+                                    and sensors is not None and set(sensors) <= set(SENSORS))
+        return self._independent[i]
+
+    # Runs one agent step and returns the action.
+    async def step(self, obs):
+        start = time.perf_counter()
+        obs = Observation.of(obs).copy()
+
+        # Start the speculative action on the sensor values alone, before the perceptor adds its output.
+        guess = self.last_skill
+        speculative = None
+        if self.speculate and guess is not None and await self._can_speculate(guess):
+            state = self.skills[guess].snapshot()
+            speculative = asyncio.ensure_future(
+                self._stage('speculative', self.skills[guess].compute_action, obs.copy(), 0.0))
+
+        try:
+            if self.perceptor is not None:
+                obs.extra.update(await self._stage('perceptor', self.perceptor.compute, None, obs))
+
+            skill = 0
+            if self.selector is not None:
+                skill = int(np.ravel(await self._stage('selector', self.selector.compute_action, obs, 0))[0])
+        except BaseException:
+            if speculative is not None:
+                await asyncio.gather(speculative, return_exceptions=True)
+            raise
+
+        action = None
+        if speculative is not None:
+            result = await speculative
+            if skill == guess:
+                action = result
+                self.hits += 1
+            else:
+                self.skills[guess].restore(state)
+                self.misses += 1
+        if action is None:
+            action = await self._stage('skill', self.skills[skill].compute_action, obs, 0.0)
+
+        if self.teacher is not None:
+            action = await self._stage('teacher', self.teacher.transform_action, obs, action)
+
+        self.last_skill = skill
+        self.timings['step'].append(time.perf_counter() - start)
+        return action
+
+    # Returns mean and p99 duration (milliseconds) per stage and per step, the mean of the summed
+    # stage durations, and the speculation hit rate.
+    def report(self):
+        stages = {}
+        for stage, durations in self.timings.items():
+            if durations:
+                ms = np.asarray(durations) * 1e3
+                stages[stage] = {'n': len(ms), 'mean_ms': float(ms.mean()), 'p99_ms': float(np.percentile(ms, 99))}
+        steps = len(self.timings['step'])
+        stage_sum = sum(sum(self.timings[stage]) for stage in STAGES)
+        attempts = self.hits + self.misses
+        return {
+            'stages': stages,
+            'step_mean_ms': stages['step']['mean_ms'] if steps else float('nan'),
+            'stage_sum_mean_ms': stage_sum / steps * 1e3 if steps else float('nan'),
+            'speculation_hit_rate': self.hits / attempts if attempts else float('nan'),
+        }
+
+    # Formats report() as a table.
+    def format_report(self):
+        report = self.report()
+        lines = [f"{'stage':<12} {'n':>6} {'mean ms':>9} {'p99 ms':>9}"]
+        for stage, row in report['stages'].items():
+            lines.append(f"{stage:<12} {row['n']:>6} {row['mean_ms']:>9.3f} {row['p99_ms']:>9.3f}")
+        lines.append(f"step latency {report['step_mean_ms']:.3f} ms vs. sum of stages {report['stage_sum_mean_ms']:.3f} ms, "
+                     f"speculation hit rate {report['speculation_hit_rate']:.1%}")
+        return '\n'.join(lines)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
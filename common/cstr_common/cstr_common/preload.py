@@ -0,0 +1,163 @@
+"""
+Preload/fork mode for multi-worker agents.
+
+The parent process loads the components' heavy, read-only artifacts once (the runaway model, the
+solver modules and plugins, the forecaster's transition table) by calling each component class's
+`preload()` hook, moves everything it has allocated out of the garbage collector's reach with
+gc.freeze(), and then forks the workers. The workers share those pages copy-on-write instead of
+each loading its own copy; the collector does not touch the frozen objects, so the pages stay shared.
+
+The benchmark runs the same environment farm (cstr_common.farm) in three modes, each in a fresh
+process, and reports the time until the workers have run their first steps and the memory of the
+parent and the workers. PSS (proportional set size) splits shared pages between the processes
+that map them, so the PSS total is the physical memory of the whole group; the RSS total counts
+shared pages once per process.
+
+    spawn    workers start a fresh interpreter and load everything themselves
+    fork     workers are forked from a parent that has loaded nothing, and load on first use
+    preload  the parent preloads the stack's components and forks the workers
+
+Usage:
+    python -m cstr_common.preload --skills skills/mpc-skill-group --workers 8
+    python -m cstr_common.preload --perceptor perceptors/thermal_runaway_predictor \
+        --selector selectors/programmed-selector --skills skills/pid skills/mpc-skill-group skills/pid
+"""
+import argparse
+import gc
+import multiprocessing
+import os
+import time
+
+from cstr_common.components import REPO_ROOT, load_class, resolve
+from cstr_common.report import format_table, write_csv
+
+# Benchmark modes, see the module docstring.
+MODES = ('spawn', 'fork', 'preload')
+
+
+# Returns the component directories of a farm stack (see cstr_common.farm.StackRunner).
+def stack_paths(stack):
+    paths = [stack.get('perceptor'), stack.get('selector')] + list(stack['skills'])
+    return list(dict.fromkeys(path for path in paths if path))
+
+
+# Returns a copy of a stack with its component directories made absolute, so worker processes
+# load the same components whatever root the stack was given relative to.
+def resolve_stack(stack, root=None):
+    return {role: ([resolve(path, root) for path in value] if role == 'skills' else
+                   resolve(value, root) if value else value)
+            for role, value in stack.items()}
+
+
+# Calls the preload() hook of every component that has one, then freezes the collector's view of
+# the loaded objects. Call it in the parent before forking the workers.
+def preload_components(paths):
+    """
+    Returns:
+        Dictionary of the seconds spent preloading each component.
+    """
+    seconds = {}
+    for path in paths:
+        cls = load_class(path)
+        start = time.perf_counter()
+        if hasattr(cls, 'preload'):
+            cls.preload()
+        seconds[path] = time.perf_counter() - start
+    gc.collect()
+    gc.freeze()
+    return seconds
+
+
+# Memory of a process in bytes: 'rss', 'pss' and 'uss' (private pages), from /proc (Linux).
+def memory(pid):
+    fields = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1]) * 1024
+    except OSError:
+        return {'rss': float('nan'), 'pss': float('nan'), 'uss': float('nan')}
+    return {
+        'rss': fields.get('Rss', 0),
+        'pss': fields.get('Pss', 0),
+        'uss': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+    }
+
+
+# Runs the farm in one mode in the calling process and returns the measurements.
+def measure(stack, n_workers, mode, steps=3):
+    from cstr_common.farm import Farm
+
+    start = time.perf_counter()
+    farm = Farm(n_workers, n_workers, stack=stack, context='spawn' if mode == 'spawn' else 'fork',
+                preload=mode == 'preload')
+    try:
+        ready = time.perf_counter() - start
+        for _ in range(steps):
+            farm.step()
+        first_steps = time.perf_counter() - start - ready
+        workers = [memory(pid) for pid in farm.pids]
+        parent = memory(os.getpid())
+    finally:
+        farm.close()
+
+    mb = 2**-20
+    return {
+        'mode': mode,
+        'workers': n_workers,
+        'ready_s': ready,
+        'first_steps_s': first_steps,
+        'parent_pss_mb': parent['pss'] * mb,
+        'worker_rss_mb': sum(w['rss'] for w in workers) * mb,
+        'worker_uss_mb': sum(w['uss'] for w in workers) * mb,
+        'total_pss_mb': (parent['pss'] + sum(w['pss'] for w in workers)) * mb,
+    }
+
+
+def _measure_into(conn, *args):
+    conn.send(measure(*args))
+    conn.close()
+
+
+# Measures every mode in a fresh (non-daemonic, so it can start the farm's workers) process, so one
+# mode's preloaded artifacts do not carry over to the next.
+def benchmark(stack, n_workers, modes=MODES, steps=3):
+    ctx = multiprocessing.get_context('spawn')
+    rows = []
+    for mode in modes:
+        receiver, sender = ctx.Pipe(duplex=False)
+        proc = ctx.Process(target=_measure_into, args=(sender, stack, n_workers, mode, steps))
+        proc.start()
+        sender.close()
+        try:
+            rows.append(receiver.recv())
+        except EOFError:
+            raise RuntimeError(f"{mode} benchmark failed (exit code {proc.exitcode})") from None
+        finally:
+            proc.join()
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare worker start-up time and memory with and without preloading.")
+    parser.add_argument('--skills', nargs='+', default=['skills/mpc-skill-group'], help="Skill component directories")
+    parser.add_argument('--selector', default=None, help="Selector component directory")
+    parser.add_argument('--perceptor', default=None, help="Perceptor component directory")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--steps', type=int, default=3, help="Steps run before the memory is measured")
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=MODES)
+    parser.add_argument('--csv', help="Write the table to a CSV file")
+    parser.add_argument('--root', default=REPO_ROOT, help="Directory the component directories are relative to (default: this repository)")
+    args = parser.parse_args(argv)
+
+    stack = resolve_stack({'selector': args.selector, 'skills': args.skills, 'perceptor': args.perceptor}, args.root)
+    rows = benchmark(stack, args.workers, args.modes, args.steps)
+    print(format_table(rows))
+    if args.csv:
+        write_csv(args.csv, rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+import os
+
+import numpy as np
+
+from cstr_common.observation import Observation
+from cstr_common.sensors import SENSORS
+
+# Number of rows added to the buffer each time it runs out of space.
+DEFAULT_CHUNK_SIZE = 256
+
+# Default retention for the teachers: far longer than the 90-step CSTR episode,
+# so a normal episode is kept in full while a runaway training loop stays bounded.
+DEFAULT_MAX_STEPS = 10_000
+
+# Metric columns the CSTR teachers record next to the sensor values.
+TEACHER_COLUMNS = ('error', 'rms', 'reward')
+
+
+# The EpisodeRecorder class is a columnar store for per-step episode data.
+# Each row holds the eight CSTR sensor values followed by any extra metric columns
+# (for example error, rms and reward), stored as float64 in a preallocated array.
+class EpisodeRecorder:
+    def __init__(self, extra_columns=(), max_steps=None, chunk_size=DEFAULT_CHUNK_SIZE, spill_path=None):
+        """
+        Args:
+            extra_columns: Names of metric columns stored after the sensor columns.
+            max_steps: Retention policy. None keeps the full episode; an integer keeps only the last N steps.
+            chunk_size: Number of rows the buffer grows by when it is full.
+            spill_path: Optional file path. When set, the buffer is a memory-mapped file instead of process memory.
+        """
+        if max_steps is not None and max_steps <= 0:
+            raise ValueError(f"max_steps must be positive or None, got {max_steps}")
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+
+        # columns: Sensor columns followed by the extra metric columns.
+        # index: Maps every column name to its position in a row.
+        # max_steps: Retention limit (None means the full episode is kept).
+        # size: Number of rows currently retained.
+        # total: Number of rows appended since the last reset (including dropped ones).
+        self.columns = list(SENSORS) + list(extra_columns)
+        self.index = {name: i for i, name in enumerate(self.columns)}
+        self.max_steps = max_steps
+        self.chunk_size = chunk_size
+        self.spill_path = spill_path
+        self.size = 0
+        self.total = 0
+
+        # The buffer starts at one chunk and grows by chunks. With a retention limit it stops
+        # growing at max_steps rows and from then on is used as a ring buffer.
+        self._head = 0
+        self._data = self._allocate(chunk_size if max_steps is None else min(chunk_size, max_steps))
+
+    def __len__(self):
+        return self.size
+
+    # Allocates (or re-opens at a larger size) the backing array.
+    def _allocate(self, capacity):
+        shape = (capacity, len(self.columns))
+        if self.spill_path is None:
+            return np.empty(shape, dtype=np.float64)
+
+        # Extend the file first so the memory map can cover the new shape.
+        nbytes = capacity * len(self.columns) * np.dtype(np.float64).itemsize
+        mode = 'r+b' if os.path.exists(self.spill_path) else 'w+b'
+        with open(self.spill_path, mode) as f:
+            f.truncate(nbytes)
+        return np.memmap(self.spill_path, dtype=np.float64, mode='r+', shape=shape)
+
+    # Grows the buffer by one chunk (capped at the retention limit), keeping the rows recorded so far.
+    def _grow(self):
+        capacity = self._data.shape[0] + self.chunk_size
+        if self.max_steps is not None:
+            capacity = min(capacity, self.max_steps)
+        if self.spill_path is None:
+            data = np.empty((capacity, len(self.columns)), dtype=np.float64)
+            data[:self.size] = self._data[:self.size]
+            self._data = data
+        else:
+            # The memory map is backed by the same file, so existing rows survive the resize.
+            self._data.flush()
+            del self._data
+            self._data = self._allocate(capacity)
+
+    # True once the retention limit is reached and the oldest rows are being overwritten.
+    def _wrapped(self):
+        return self.max_steps is not None and self.size == self.max_steps
+
+    # Appends one step to the recorder.
+    def append(self, obs, **metrics):
+        """
+        Args:
+            obs: Sensor data as an Observation, a dictionary keyed by sensor name, or a sequence in SENSORS order.
+            metrics: Values for the extra columns, keyed by column name. Missing columns are stored as NaN.
+        """
+        if self._wrapped():
+            # Overwrite the oldest retained row.
+            row = self._data[self._head]
+            self._head = (self._head + 1) % self.max_steps
+        else:
+            if self.size == self._data.shape[0]:
+                self._grow()
+            row = self._data[self.size]
+            self.size += 1
+
+        if isinstance(obs, Observation):
+            row[:len(SENSORS)] = obs.values
+        elif isinstance(obs, dict):
+            for i, name in enumerate(SENSORS):
+                row[i] = float(obs[name])
+        else:
+            row[:len(SENSORS)] = [float(v) for v in obs[:len(SENSORS)]]
+
+        row[len(SENSORS):] = np.nan
+        for name, value in metrics.items():
+            row[self.index[name]] = value
+
+        self.total += 1
+
+    # Returns the retained rows in chronological order.
+    def to_array(self):
+        """
+        Returns:
+            A (size, n_columns) float64 array. Until the retention limit is reached this is a view on the buffer.
+        """
+        if not self._wrapped():
+            return self._data[:self.size]
+        return np.roll(self._data, -self._head, axis=0)
+
+    # Returns one column of the retained rows in chronological order.
+    def column(self, name):
+        return self.to_array()[:, self.index[name]]
+
+    # Returns the most recently appended row as a dictionary, or None if nothing was recorded.
+    def last(self):
+        if self.size == 0:
+            return None
+        i = (self._head - 1) % self.max_steps if self._wrapped() else self.size - 1
+        return dict(zip(self.columns, self._data[i].tolist()))
+
+    # Clears the recorder for a new episode while keeping the allocated buffer.
+    def reset(self):
+        self.size = 0
+        self.total = 0
+        self._head = 0
+
+    # Returns the retained rows and the step total (see cstr_common.snapshot).
+    def snapshot(self):
+        return {'columns': list(self.columns), 'rows': np.array(self.to_array()), 'total': self.total}
+
+    # Replaces the recorder contents with a snapshot. Rows beyond the retention limit are dropped, oldest first.
+    def restore(self, state):
+        if list(state['columns']) != self.columns:
+            raise ValueError(f"snapshot columns {state['columns']} do not match recorder columns {self.columns}")
+        rows = state['rows']
+        if self.max_steps is not None:
+            rows = rows[-self.max_steps:]
+        self.reset()
+        while self._data.shape[0] < len(rows):
+            self._grow()
+        self._data[:len(rows)] = rows
+        self.size = len(rows)
+        self.total = state['total']
+
+    # Bytes held by the backing buffer (on disk when spilling to a memory-mapped file).
+    def nbytes(self):
+        return self._data.nbytes
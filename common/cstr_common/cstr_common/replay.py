@@ -0,0 +1,325 @@
+"""
+Offline replay evaluator for trajectories written by cstr_common.trajectory.
+
+Re-scores recorded episodes under alternative reward functions, perceptor probability
+thresholds and ΔTc damping factors. Rewards and thresholds are re-scored from the records
+alone; a damping factor re-simulates the step after every flagged step with the damped
+coolant move (cstr_common.cstr.integrate). The batch files of each recording process are
+scored together (an episode can span several batches), the processes' files are scored in
+parallel, and all scoring uses array operations only.
+
+A trajectory stream is one component instance, which may run several episodes. Records are
+kept in emission order within a stream, and a new episode starts wherever the step counter
+does not increase.
+
+Usage:
+    python -m cstr_common.replay TRAJECTORY_DIR \
+        --reward exp_cumulative:0.01 --reward exp_cumulative:0.005 --reward exp_step:0.05 \
+        --threshold 0.2 0.3 0.5 --damping 0.05 0.1 --csv results
+
+    --csv is a prefix: the example writes results-rewards.csv and results-perceptor.csv.
+"""
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from cstr_common.cstr import RUNAWAY_TEMPERATURE, TC_MAX, TC_MIN, integrate
+from cstr_common.report import format_table, write_csv
+from cstr_common.rewards import REWARD_SCALE, RUNAWAY_DAMPING, batch_transform_action, squared_error
+from cstr_common.trajectory import read_trajectory
+
+# Sources whose records carry teacher rewards.
+TEACHER_SOURCES = ('control_reaction', 'control_reaction_perceptor', 'control_transition',
+                   'produce_product', 'start_reaction', 'learned_selector')
+PERCEPTOR_SOURCE = 'thermal_runaway_predictor'
+
+# Probability threshold the perceptor currently uses.
+BASELINE_THRESHOLD = 0.3
+
+# Number of steps ahead a flagged step may precede an actual runaway and still count as a hit.
+DEFAULT_HORIZON = 5
+
+
+# Alternative reward functions. Each takes the per-step squared error, its running sum within
+# the episode and a scale, and returns the per-step reward.
+REWARD_FUNCTIONS = {
+    # The teachers' current reward, exp(-scale * Σerror).
+    'exp_cumulative': lambda error, cumulative, scale: np.exp(-scale * cumulative),
+    # Per-step exponential reward, exp(-scale * error).
+    'exp_step': lambda error, cumulative, scale: np.exp(-scale * error),
+    # Negative scaled squared error.
+    'neg_error': lambda error, cumulative, scale: -scale * error,
+}
+
+
+# Parses a "name:scale" reward variant from the command line.
+def parse_reward(text):
+    name, _, scale = text.partition(':')
+    if name not in REWARD_FUNCTIONS:
+        raise argparse.ArgumentTypeError(f"Unknown reward function {name!r}, choose from {sorted(REWARD_FUNCTIONS)}")
+    return name, float(scale) if scale else REWARD_SCALE
+
+
+# Groups the selected rows by stream, keeping their emission order within a stream, and returns the
+# ordered indices and a boolean array marking the first row of every episode: the first row of a
+# stream, and every row whose step counter does not increase (the emitter started a new episode).
+def _episodes(data, rows):
+    order = rows[np.argsort(data['stream'][rows], kind='stable')]
+    streams = data['stream'][order]
+    steps = data['step'][order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (streams[1:] != streams[:-1]) | (steps[1:] <= steps[:-1])
+    return order, first
+
+
+# Running sum within each episode, restarting at every True in first.
+def _segmented_cumsum(values, first):
+    total = np.cumsum(values)
+    starts = np.flatnonzero(first)
+    offsets = np.repeat(total[starts] - values[starts], np.diff(np.append(starts, len(values))))
+    return total - offsets
+
+
+# Maximum of values over the next `horizon` rows (including the current one) within each episode.
+def _forward_max(values, first, horizon):
+    out = np.empty_like(values)
+    bounds = np.append(np.flatnonzero(first), len(values))
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        padded = np.concatenate([values[start:end], np.full(horizon - 1, -np.inf)])
+        out[start:end] = np.lib.stride_tricks.sliding_window_view(padded, horizon).max(axis=1)
+    return out
+
+
+# Scores the teacher records of one recording process under every reward variant.
+def _score_rewards(data, rewards):
+    rows = np.flatnonzero(np.isin(data['source'], TEACHER_SOURCES))
+    if len(rows) == 0:
+        return {}
+    order, first = _episodes(data, rows)
+
+    # The first record of an episode only opens the history and is never rewarded.
+    error = squared_error(data['Cref'][order], data['Ca'][order])
+    error[first] = 0.0
+    cumulative = _segmented_cumsum(error, first)
+    count = _segmented_cumsum((~first).astype(np.float64), first)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rms = np.sqrt(cumulative / count)
+
+    episode_id = np.cumsum(first) - 1
+    last = np.append(np.flatnonzero(first)[1:] - 1, len(order) - 1)
+    n_episodes = int(first.sum())
+
+    results = {}
+    for name, scale in rewards:
+        reward = REWARD_FUNCTIONS[name](error, cumulative, scale)
+        reward[first] = 0.0
+        returns = np.bincount(episode_id, weights=reward, minlength=n_episodes)
+        entry = {
+            'episodes': n_episodes,
+            'steps': len(order),
+            'return_sum': float(returns.sum()),
+            'final_rms_sum': float(np.nansum(rms[last])),
+            'max_diff_vs_recorded': np.nan,
+        }
+        if name == 'exp_cumulative' and scale == REWARD_SCALE:
+            # Sanity check: the baseline variant must reproduce the recorded rewards. The last record of
+            # an episode is left out: with the criteria's success bonus on, a settled episode's final
+            # reward includes the return of the steps it did not run (see cstr_common.termination).
+            recorded = data['reward'][order]
+            checked = np.ones(len(order), dtype=bool)
+            checked[last] = False
+            diff = np.abs(reward - recorded)[checked]
+            entry['max_diff_vs_recorded'] = float(np.nanmax(diff)) if diff.size else np.nan
+        results[(name, scale)] = entry
+    return results
+
+
+# Scores the perceptor records of one recording process under every (threshold, damping) pair.
+def _score_perceptor(data, thresholds, dampings, horizon, runaway_temperature):
+    rows = np.flatnonzero(data['source'] == PERCEPTOR_SOURCE)
+    if len(rows) == 0:
+        return {}
+    order, first = _episodes(data, rows)
+
+    proba = data['runaway_proba'][order]
+    Ca = data['Ca'][order]
+    T = data['T'][order]
+    Tc = data['Tc'][order]
+
+    # Label: a runaway temperature is reached within the horizon.
+    label = _forward_max(T, first, horizon) >= runaway_temperature
+
+    # Coolant change actually applied after each step, Tc[t+1] - Tc[t]; the last step of an episode has no successor.
+    has_next = ~np.append(first[1:], True)
+    dTc = np.zeros_like(Tc)
+    dTc[:-1] = Tc[1:] - Tc[:-1]
+    dTc[~has_next] = 0.0
+
+    # Next-step temperature with the recorded coolant move, re-simulated so that it is compared
+    # with the damped move under the same model.
+    with np.errstate(over='ignore', invalid='ignore'):
+        T_next = integrate(Ca, T, Tc + dTc)[1]
+
+    results = {}
+    for threshold in thresholds:
+        # The perceptor flags a step when the classifier predicts 1 (probability above 0.5)
+        # or the probability reaches the threshold. NaN means the classifier was not invoked.
+        with np.errstate(invalid='ignore'):
+            flagged = (proba > 0.5) | (proba >= threshold)
+        tp = int(np.sum(flagged & label))
+        fp = int(np.sum(flagged & ~label))
+        fn = int(np.sum(~flagged & label))
+        resimulated = flagged & has_next
+        for damping in dampings:
+            # Re-simulate the flagged steps with the coolant move damped as control_reaction_perceptor does.
+            damped = batch_transform_action(dTc[resimulated], np.ones(int(resimulated.sum())), damping)
+            with np.errstate(over='ignore', invalid='ignore'):
+                T_damped = integrate(Ca[resimulated], T[resimulated],
+                                     np.clip(Tc[resimulated] + damped, TC_MIN, TC_MAX))[1]
+            results[(threshold, damping)] = {
+                'steps': len(order),
+                'flagged': int(flagged.sum()),
+                'tp': tp,
+                'fp': fp,
+                'fn': fn,
+                'resimulated': int(resimulated.sum()),
+                'dT_next_sum': float(np.nansum(T_damped - T_next[resimulated])),
+                'runaways_next': int(np.sum(T_damped >= runaway_temperature)),
+                'runaways_next_recorded': int(np.sum(T_next[resimulated] >= runaway_temperature)),
+            }
+    return results
+
+
+# Groups batch files by the process that wrote them. Stream ids are only unique within a process.
+def group_files(paths):
+    groups = {}
+    for path in sorted(paths):
+        stem = os.path.basename(path).rsplit('.', 1)[0]
+        key = (os.path.dirname(path), stem.rsplit('-', 1)[0])
+        groups.setdefault(key, []).append(path)
+    return list(groups.values())
+
+
+# Reads and concatenates the batch files of one recording process.
+def read_group(paths):
+    parts = [read_trajectory(path) for path in paths]
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+# Scores the batch files of one recording process. Runs in a worker process.
+def score_group(paths, rewards, thresholds, dampings, horizon=DEFAULT_HORIZON,
+                runaway_temperature=RUNAWAY_TEMPERATURE):
+    data = read_group(paths)
+    return (_score_rewards(data, rewards),
+            _score_perceptor(data, thresholds, dampings, horizon, runaway_temperature))
+
+
+# Adds the counts of one process group into the running totals.
+def _merge(total, part):
+    for key, entry in part.items():
+        if key not in total:
+            total[key] = dict(entry)
+            continue
+        for field, value in entry.items():
+            if field == 'max_diff_vs_recorded':
+                total[key][field] = np.fmax(total[key][field], value)
+            else:
+                total[key][field] += value
+
+
+# Scores every file in parallel and returns the reward and perceptor comparison rows.
+def evaluate(paths, rewards, thresholds, dampings, horizon=DEFAULT_HORIZON,
+             runaway_temperature=RUNAWAY_TEMPERATURE, workers=None):
+    """
+    Args:
+        paths: Trajectory files (.npz or .parquet).
+        rewards: List of (reward function name, scale) variants.
+        thresholds: Perceptor probability thresholds.
+        dampings: ΔTc damping factors.
+        horizon: Steps ahead a flag may precede a runaway and still count as a hit.
+        runaway_temperature: Temperature that defines a runaway.
+        workers: Number of worker processes (defaults to the CPU count).
+
+    Returns:
+        reward_rows, perceptor_rows: Lists of dictionaries, one per variant.
+    """
+    reward_totals = {}
+    perceptor_totals = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(score_group, group, rewards, thresholds, dampings, horizon, runaway_temperature)
+                   for group in group_files(paths)]
+        for future in futures:
+            reward_part, perceptor_part = future.result()
+            _merge(reward_totals, reward_part)
+            _merge(perceptor_totals, perceptor_part)
+
+    reward_rows = []
+    for (name, scale), t in reward_totals.items():
+        reward_rows.append({
+            'reward': name,
+            'scale': scale,
+            'episodes': t['episodes'],
+            'mean_return': t['return_sum'] / t['episodes'],
+            'mean_final_rms': t['final_rms_sum'] / t['episodes'],
+            'max_diff_vs_recorded': t['max_diff_vs_recorded'],
+        })
+
+    perceptor_rows = []
+    for (threshold, damping), t in sorted(perceptor_totals.items()):
+        perceptor_rows.append({
+            'threshold': threshold,
+            'damping': damping,
+            'baseline': threshold == BASELINE_THRESHOLD and damping == RUNAWAY_DAMPING,
+            'flag_rate': t['flagged'] / t['steps'],
+            'recall': t['tp'] / (t['tp'] + t['fn']) if t['tp'] + t['fn'] else np.nan,
+            'precision': t['tp'] / (t['tp'] + t['fp']) if t['tp'] + t['fp'] else np.nan,
+            # Mean change of the next-step temperature on flagged steps, and next-step runaways
+            # with the damped and with the recorded coolant move.
+            'dT_next_mean': t['dT_next_sum'] / t['resimulated'] if t['resimulated'] else np.nan,
+            'runaways_next': t['runaways_next'],
+            'runaways_next_recorded': t['runaways_next_recorded'],
+        })
+    return reward_rows, perceptor_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('paths', nargs='+', help="Trajectory files or directories containing them")
+    parser.add_argument('--reward', action='append', type=parse_reward, dest='rewards',
+                        help="Reward variant as name:scale (repeatable)")
+    parser.add_argument('--threshold', type=float, nargs='+', default=[BASELINE_THRESHOLD])
+    parser.add_argument('--damping', type=float, nargs='+', default=[RUNAWAY_DAMPING])
+    parser.add_argument('--horizon', type=int, default=DEFAULT_HORIZON)
+    parser.add_argument('--runaway-temperature', type=float, default=RUNAWAY_TEMPERATURE)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--csv', help="Prefix for CSV output (writes PREFIX-rewards.csv and PREFIX-perceptor.csv)")
+    args = parser.parse_args(argv)
+
+    paths = []
+    for p in args.paths:
+        if os.path.isdir(p):
+            paths += sorted(glob.glob(os.path.join(p, '*.npz')) + glob.glob(os.path.join(p, '*.parquet')))
+        else:
+            paths.append(p)
+    rewards = args.rewards or [('exp_cumulative', REWARD_SCALE)]
+
+    reward_rows, perceptor_rows = evaluate(paths, rewards, args.threshold, args.damping, args.horizon,
+                                           args.runaway_temperature, args.workers)
+    print(f"Replayed {len(paths)} files\n")
+    print("Teacher rewards")
+    print(format_table(reward_rows))
+    print("\nPerceptor thresholds and ΔTc damping")
+    print(format_table(perceptor_rows))
+
+    if args.csv:
+        if reward_rows:
+            write_csv(f"{args.csv}-rewards.csv", reward_rows)
+        if perceptor_rows:
+            write_csv(f"{args.csv}-perceptor.csv", perceptor_rows)
+
+
+if __name__ == '__main__':
+    main()
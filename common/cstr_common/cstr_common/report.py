@@ -0,0 +1,32 @@
+# Reporting helpers shared by the command-line tools: aligned text tables and CSV files, both from
+# lists of dictionaries (one per row).
+
+
+# Aligns the rows on the union of their columns, in order of first appearance; missing cells are
+# empty (a failed run's row may only have an 'error' column).
+def table_rows(rows):
+    columns = []
+    for row in rows:
+        columns += [c for c in row if c not in columns]
+    return [{c: row.get(c, '') for c in columns} for row in rows]
+
+
+# Formats a list of dictionaries as an aligned text table.
+def format_table(rows):
+    if not rows:
+        return '(no records)'
+    columns = list(rows[0])
+    cells = [[f"{row[c]:.6g}" if isinstance(row[c], float) else str(row[c]) for c in columns] for row in rows]
+    widths = [max(len(c), *(len(r[i]) for r in cells)) for i, c in enumerate(columns)]
+    lines = ['  '.join(c.rjust(w) for c, w in zip(columns, widths))]
+    lines += ['  '.join(v.rjust(w) for v, w in zip(r, widths)) for r in cells]
+    return '\n'.join(lines)
+
+
+# Writes a list of dictionaries to a CSV file.
+def write_csv(path, rows):
+    import csv
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
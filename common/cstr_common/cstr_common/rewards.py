@@ -0,0 +1,105 @@
+import numpy as np
+
+from cstr_common.sensors import SENSOR_INDEX
+
+# Scale of the cumulative squared error in the teachers' reward, exp(-REWARD_SCALE * Σerror).
+REWARD_SCALE = 0.01
+
+# Fraction of |ΔTc| removed by control_reaction_perceptor when a thermal runaway is predicted.
+RUNAWAY_DAMPING = 0.05
+
+CA = SENSOR_INDEX['Ca']
+CREF = SENSOR_INDEX['Cref']
+T = SENSOR_INDEX['T']
+
+
+# Squared concentration tracking error. Works on floats and arrays alike.
+def squared_error(cref, ca):
+    return (cref - ca)**2
+
+
+# Teacher reward for a cumulative squared error. Both the scalar teachers and the batch
+# path below go through numpy's exp, so they return bit-identical rewards.
+def reward_from_error_sum(error_sum, scale=REWARD_SCALE):
+    return np.exp(-scale * error_sum)
+
+
+# Per-environment running statistics for batch_reward, the array form of the
+# teachers' error_sum/count/history/criteria state.
+class RewardState:
+    def __init__(self, n, criteria=None):
+        """
+        Args:
+            n: Number of environments.
+            criteria: Dictionary of EpisodeCriteria arguments, as passed to the teachers as `criteria`.
+        """
+        from cstr_common.termination import BatchCriteria
+
+        # error_sum: Running sum of squared errors per environment.
+        # count: Number of rewarded steps per environment.
+        # started: False until an environment has seen its first (unrewarded) observation.
+        # criteria: Early-termination and success rules per environment (see cstr_common.termination).
+        self.error_sum = np.zeros(n, dtype=np.float64)
+        self.count = np.zeros(n, dtype=np.int64)
+        self.started = np.zeros(n, dtype=bool)
+        self.criteria = BatchCriteria(n, **(criteria or {}))
+
+    # Returns the RMS error per environment (NaN for environments without a rewarded step).
+    def rms(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(self.error_sum / self.count)
+
+    # Resets the environments selected by mask (all environments when mask is None) for a new episode.
+    def reset(self, mask=None):
+        if mask is None:
+            mask = slice(None)
+        self.error_sum[mask] = 0.0
+        self.count[mask] = 0
+        self.started[mask] = False
+        self.criteria.reset(mask)
+
+
+# Batch counterpart of the teachers' compute_reward, including their episode resets (after an early
+# end, or when Cref rises) and the success bonus of the episode criteria.
+def batch_reward(obs, state, scale=REWARD_SCALE):
+    """
+    Args:
+        obs: (N, sensors) array with columns in SENSORS order.
+        state: RewardState for the N environments, updated in place.
+        scale: Reward scale (REWARD_SCALE in the teachers).
+
+    Returns:
+        rewards: (N,) array. Environments on their first step get 0.0, exactly like the scalar teachers.
+    """
+    obs = np.asarray(obs, dtype=np.float64)
+    state.reset(state.criteria.new_episode(obs[:, CREF]))
+    state.criteria.update(obs[:, CA], obs[:, CREF], obs[:, T])
+    first = ~state.started
+
+    error = squared_error(obs[:, CREF], obs[:, CA])
+    error[first] = 0.0
+    state.error_sum += error
+    state.count += ~first
+    state.started[:] = True
+
+    rewards = reward_from_error_sum(state.error_sum, scale)
+    rewards += state.criteria.success_bonus(rewards)
+    rewards[first] = 0.0
+    return rewards
+
+
+# Batch counterpart of control_reaction_perceptor's transform_action.
+def batch_transform_action(dTc, runaway_predict, damping=RUNAWAY_DAMPING):
+    """
+    Args:
+        dTc: (N,) array of coolant temperature changes proposed by the agent.
+        runaway_predict: (N,) array of perceptor outputs; 1 means a thermal runaway is predicted.
+        damping: Fraction of |ΔTc| removed when a runaway is predicted.
+
+    Returns:
+        (N,) array of ΔTc after damping.
+    """
+    # Keep the input dtype, as the scalar path does with the agent's action array.
+    dTc = np.asarray(dTc)
+    damped = dTc - damping * np.abs(dTc) * np.sign(dTc)
+    return np.where(np.asarray(runaway_predict) == 1, damped, dTc)
@@ -0,0 +1,6 @@
+# Sensor variables published by the CSTR simulator, in the order the simulator emits them.
+# Every skill, selector, teacher and perceptor in this repo filters its sensor space to this list.
+SENSORS = ['T', 'Tc', 'Ca', 'Cref', 'Tref', 'Conc_Error', 'Eps_Yield', 'Cb_Prod']
+
+# Column index of each sensor inside SENSORS, for array-backed storage.
+SENSOR_INDEX = {name: i for i, name in enumerate(SENSORS)}
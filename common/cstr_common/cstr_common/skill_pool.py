@@ -0,0 +1,109 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from cstr_common.observation import Observation
+
+
+# The SkillPool class keeps every skill controller of a selector alive for the whole episode
+# and warm while it is inactive. The selected skill computes the action; the others receive the
+# same observation through their `observe(obs)` method on a background thread, after the action
+# has been returned, so that work overlaps the environment step instead of the agent's.
+# Each skill has its own single-thread worker, so its observations are applied in order, and a
+# skill waits for its pending warm-up to finish before it computes an action again.
+class SkillPool:
+    def __init__(self, skills, background=True):
+        """
+        Args:
+            skills: Skill controllers indexed by the selector's action.
+            background: If True, warm-ups run on background threads; otherwise they run inline
+                        after the active skill, which is useful for profiling.
+        """
+        self.skills = list(skills)
+        self.background = background
+        self.active = None  # Index of the skill that computed the last action.
+        self._workers = [ThreadPoolExecutor(max_workers=1) if background else None for _ in self.skills]
+        self._pending = [None] * len(self.skills)
+
+        # Step latencies (seconds) of the active skill, split into the first step after a switch and the rest.
+        self.switch_latency = []
+        self.steady_latency = []
+        self.switches = 0
+        self.warm_wait = 0.0  # Time spent waiting for a pending warm-up before a step.
+        self.warm_seconds = np.zeros(len(self.skills))  # Time spent in observe() per skill.
+
+    # Waits for the pending warm-up of skill i, if any.
+    def _wait(self, i):
+        pending = self._pending[i]
+        if pending is not None:
+            start = time.perf_counter()
+            pending.result()
+            self.warm_wait += time.perf_counter() - start
+            self._pending[i] = None
+
+    def _observe(self, i, obs):
+        start = time.perf_counter()
+        self.skills[i].observe(obs)
+        self.warm_seconds[i] += time.perf_counter() - start
+
+    # Computes the action of skill `skill` and warms the other skills with the same observation.
+    async def compute_action(self, skill, obs, action=0.0):
+        """
+        Args:
+            skill: Index of the skill chosen by the selector.
+            obs: Observation in any form accepted by Observation.of.
+            action: Action passed on to the skill's compute_action.
+
+        Returns:
+            The action returned by the skill.
+        """
+        obs = Observation.of(obs)
+        start = time.perf_counter()
+        self._wait(skill)
+        result = await self.skills[skill].compute_action(obs, action)
+        latency = time.perf_counter() - start
+
+        if self.active is not None and skill != self.active:
+            self.switches += 1
+            self.switch_latency.append(latency)
+        else:
+            self.steady_latency.append(latency)
+        self.active = skill
+
+        # Skills without observe() are left as they are and pick up from their last active step.
+        for i, other in enumerate(self.skills):
+            if i == skill or not hasattr(other, 'observe'):
+                continue
+            if self.background:
+                self._pending[i] = self._workers[i].submit(self._observe, i, obs.copy())
+            else:
+                self._observe(i, obs)
+        return result
+
+    # Waits for all pending warm-ups.
+    def join(self):
+        for i in range(len(self.skills)):
+            self._wait(i)
+
+    # Returns the switch count and the latency of switch steps compared with steady steps (milliseconds).
+    def metrics(self):
+        def summary(latency):
+            if not latency:
+                return {'n': 0, 'mean_ms': float('nan'), 'p99_ms': float('nan')}
+            latency = np.asarray(latency) * 1e3
+            return {'n': len(latency), 'mean_ms': float(latency.mean()), 'p99_ms': float(np.percentile(latency, 99))}
+
+        return {
+            'switches': self.switches,
+            'switch': summary(self.switch_latency),
+            'steady': summary(self.steady_latency),
+            'warm_wait_ms': self.warm_wait * 1e3,
+            'warm_ms': (self.warm_seconds * 1e3).tolist(),
+        }
+
+    def close(self):
+        self.join()
+        for worker in self._workers:
+            if worker is not None:
+                worker.shutdown()
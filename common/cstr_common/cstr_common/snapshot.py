@@ -0,0 +1,86 @@
+import pickle
+import zlib
+
+# Format version stored in every snapshot; loads() rejects snapshots written by another version.
+SNAPSHOT_VERSION = 1
+
+# Pickle protocol 5 stores NumPy arrays as contiguous binary buffers.
+PICKLE_PROTOCOL = 5
+
+# zlib level used by dumps(). Level 1 is fast and already removes most of the redundancy in
+# float arrays that change slowly from step to step.
+DEFAULT_LEVEL = 1
+
+
+# Captures the state of a set of components. Every component (skill controller, selector,
+# perceptor or teacher) provides snapshot(), which returns a dictionary of plain values and arrays.
+def capture(components):
+    """
+    Args:
+        components: Dictionary of named components.
+
+    Returns:
+        A dictionary with the snapshot of each component, keyed by the same names.
+    """
+    return {name: component.snapshot() for name, component in components.items()}
+
+
+# Restores a captured state into a set of components. The components may be new instances: a single
+# checkpoint can be restored into any number of them to start branch rollouts from the same step.
+def restore(components, state):
+    """
+    Args:
+        components: Dictionary of named components, with the names used by capture().
+        state: State returned by capture() or loads().
+    """
+    missing = set(state) - set(components)
+    if missing:
+        raise KeyError(f"no component for snapshot entries {sorted(missing)}")
+    for name, component_state in state.items():
+        components[name].restore(component_state)
+
+
+# Serializes a captured state to compressed bytes.
+def dumps(state, level=DEFAULT_LEVEL):
+    payload = pickle.dumps({'version': SNAPSHOT_VERSION, 'state': state}, protocol=PICKLE_PROTOCOL)
+    return zlib.compress(payload, level)
+
+
+# Deserializes a state written by dumps().
+def loads(data):
+    payload = pickle.loads(zlib.decompress(data))
+    if payload.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"unsupported snapshot version {payload.get('version')}, expected {SNAPSHOT_VERSION}")
+    return payload['state']
+
+
+def save(path, state, level=DEFAULT_LEVEL):
+    with open(path, 'wb') as f:
+        f.write(dumps(state, level))
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+
+# Creates n independent branches from one checkpoint.
+def fork(data, factory, n):
+    """
+    Args:
+        data: Snapshot bytes from dumps() (or a state dictionary from capture()).
+        factory: Callable returning a new dictionary of named components.
+        n: Number of branches.
+
+    Returns:
+        A list of n component dictionaries, each restored to the checkpoint. Every branch gets its own
+        copy of the state, so the branches can be stepped independently.
+    """
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        data = dumps(data)
+    branches = []
+    for _ in range(n):
+        components = factory()
+        restore(components, loads(data))
+        branches.append(components)
+    return branches
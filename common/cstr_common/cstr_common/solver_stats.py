@@ -0,0 +1,95 @@
+import numpy as np
+
+# Default number of solves kept by SolverStats.
+DEFAULT_CAPACITY = 1024
+
+# One row per solve: step index, solver iterations, return status code (see SolverStats.statuses),
+# success flag, wall-clock solve time (seconds) and objective value.
+STATS_DTYPE = np.dtype([
+    ('step', np.int64),
+    ('iterations', np.int32),
+    ('status', np.int16),
+    ('success', np.bool_),
+    ('solve_time', np.float64),
+    ('objective', np.float64),
+])
+
+
+# The SolverStats class is a fixed-size ring buffer of per-solve solver statistics.
+# Memory is allocated once, so a long-lived controller can record every solve without growth;
+# once full, the oldest solves are overwritten.
+class SolverStats:
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        """
+        Args:
+            capacity: Number of solves retained.
+        """
+        if capacity <= 0:
+            raise ValueError(f"capacity must be positive, got {capacity}")
+        self.capacity = capacity
+        self.total = 0  # Solves recorded, including overwritten ones.
+        self.statuses = []  # Return status strings; a row's status is an index into this list.
+        self._codes = {}
+        self._data = np.zeros(capacity, dtype=STATS_DTYPE)
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    # Records one solve.
+    def record(self, step, iterations, status, success, solve_time, objective=np.nan):
+        code = self._codes.get(status)
+        if code is None:
+            code = self._codes[status] = len(self.statuses)
+            self.statuses.append(status)
+        self._data[self.total % self.capacity] = (step, iterations, code, success, solve_time, objective)
+        self.total += 1
+
+    # Records a solve from a CasADi nlpsol stats() dictionary (as do_mpc's `solver_stats`).
+    # CasADi reports t_wall_total only when timing output is enabled, so the caller may pass its own solve time.
+    def record_casadi(self, step, stats, objective=np.nan, solve_time=None):
+        if solve_time is None:
+            solve_time = stats.get('t_wall_total', np.nan)
+        self.record(step, stats.get('iter_count', -1), stats.get('return_status', 'unknown'),
+                    stats.get('success', False), solve_time, objective)
+
+    # Returns the retained rows in chronological order.
+    def to_array(self):
+        if self.total <= self.capacity:
+            return self._data[:self.total].copy()
+        return np.roll(self._data, -(self.total % self.capacity))
+
+    def reset(self):
+        self.total = 0
+
+    # Aggregates the retained solves.
+    def summary(self):
+        rows = self.to_array()
+        if len(rows) == 0:
+            return {'solves': 0, 'total_solves': self.total}
+        solve_ms = rows['solve_time'] * 1e3
+        return {
+            'solves': len(rows),
+            'total_solves': self.total,
+            'failures': int(np.count_nonzero(~rows['success'])),
+            'iterations_mean': float(rows['iterations'].mean()),
+            'iterations_max': int(rows['iterations'].max()),
+            'solve_ms_mean': float(solve_ms.mean()),
+            'solve_ms_p99': float(np.percentile(solve_ms, 99)),
+            'solve_s_total': float(rows['solve_time'].sum()),
+            'statuses': {self.statuses[code]: int(n) for code, n in zip(*np.unique(rows['status'], return_counts=True))},
+        }
+
+    # Writes the retained rows to a .csv file (status as text) or an .npz file.
+    def export(self, path):
+        rows = self.to_array()
+        if path.endswith('.npz'):
+            np.savez_compressed(path, stats=rows, statuses=np.array(self.statuses))
+            return
+        import csv
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(STATS_DTYPE.names)
+            for row in rows.tolist():
+                row = list(row)
+                row[2] = self.statuses[row[2]]
+                writer.writerow(row)
@@ -0,0 +1,112 @@
+"""
+Startup benchmark: measures, in a fresh interpreter per component, the time to import a component's
+entrypoint module and to construct it, and which heavy packages (solvers, ML) were loaded by then.
+
+Usage:
+    python -m cstr_common.startup
+    python -m cstr_common.startup skills/pid skills/mpc-skill-group --repeat 5
+    python -m cstr_common.startup --root /path/to/checkout
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from cstr_common.components import REPO_ROOT
+from cstr_common.report import format_table, table_rows
+
+# Packages whose import dominates startup when they are loaded eagerly.
+HEAVY_PACKAGES = ('casadi', 'do_mpc', 'gekko', 'scipy', 'sklearn')
+
+# Runs in the child interpreter: imports and constructs one component and prints the measurements as JSON.
+_PROBE = '''
+import importlib, json, sys, time
+start = time.perf_counter()
+from cstr_common.components import read_manifest
+manifest = read_manifest({path!r}, {root!r})
+sys.path.insert(0, manifest['path'])
+module, name = manifest['entrypoint'].split(':')
+t0 = time.perf_counter()
+cls = getattr(importlib.import_module(module), name)
+t1 = time.perf_counter()
+cls()
+t2 = time.perf_counter()
+print(json.dumps({{'import': t1 - t0, 'construct': t2 - t1, 'total': t2 - start,
+                  'heavy': sorted(p for p in {heavy!r} if p in sys.modules)}}))
+'''
+
+
+# Returns the component directories of the repository (every directory with a [composabl] pyproject).
+def find_components(root=REPO_ROOT):
+    components = []
+    for pyproject in sorted(glob.glob(os.path.join(root, '*', '*', 'pyproject.toml'))):
+        with open(pyproject) as f:
+            if '[composabl]' in f.read():
+                components.append(os.path.relpath(os.path.dirname(pyproject), root))
+    return components
+
+
+# Measures one component in a fresh interpreter.
+def probe(path, env=None, root=None):
+    """
+    Args:
+        path: Component directory, absolute or relative to root (default: REPO_ROOT).
+
+    Returns:
+        A dictionary with the import, construction and total times (seconds) and the heavy packages
+        loaded after construction, or with 'error' if the component failed to import or construct.
+    """
+    code = _PROBE.format(path=path, root=root, heavy=HEAVY_PACKAGES)
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        return {'error': result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'failed'}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+# Measures every component `repeat` times and returns the median times per component.
+def benchmark(paths, repeat=3, root=None):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [os.path.dirname(os.path.dirname(__file__)),
+                                                       env.get('PYTHONPATH')]))
+    rows = []
+    for path in paths:
+        runs = [probe(path, env, root) for _ in range(repeat)]
+        errors = [run['error'] for run in runs if 'error' in run]
+        if errors:
+            rows.append({'component': path, 'error': errors[0]})
+            continue
+        row = {'component': path, 'heavy': runs[-1]['heavy']}
+        for key in ('import', 'construct', 'total'):
+            row[key] = float(np.median([run[key] for run in runs]))
+        rows.append(row)
+    return rows
+
+
+# Table rows of the measurements, with the times in milliseconds and the heavy packages as one string.
+def display_rows(rows):
+    return table_rows([row if 'error' in row else {
+        'component': row['component'],
+        'import_ms': row['import'] * 1e3,
+        'construct_ms': row['construct'] * 1e3,
+        'total_ms': row['total'] * 1e3,
+        'heavy_packages': ', '.join(row['heavy']) or '-',
+    } for row in rows])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure import and construction time of the components.")
+    parser.add_argument('components', nargs='*', help="Component directories (default: all components under --root)")
+    parser.add_argument('--repeat', type=int, default=3, help="Fresh interpreters per component (the median is reported)")
+    parser.add_argument('--root', default=REPO_ROOT, help="Directory the component directories are relative to (default: this repository)")
+    args = parser.parse_args(argv)
+
+    paths = args.components or find_components(args.root)
+    print(format_table(display_rows(benchmark(paths, args.repeat, args.root))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+"""
+Early-termination and success criteria for the CSTR teachers.
+
+EpisodeCriteria keeps a few running counters per episode, so every rule is evaluated in O(1) per
+step from the current observation:
+
+    runaway   T reaches runaway_temperature: the episode is lost, terminate.
+    error     |Ca - Cref| stays above error_bound for error_steps consecutive steps: the episode
+              is hopeless, terminate.
+    settled   |Ca - Cref| stays within settle_tolerance, T moves by at most settle_rate per step
+              and Cref holds at settle_setpoint (the final steady state) for settle_steps
+              consecutive steps: the episode has converged, success.
+
+Ending a settled episode early would forgo the reward of its remaining steps and make converging
+worth less than drifting on to the end, so success_bonus() pays that return out on the final step.
+
+The rules and the bonus change the episode length and the reward, so both are opt-in: a teacher
+uses them with criteria={'enabled': True, 'success_bonus': True}. BatchCriteria applies the same
+rules to N environments for cstr_common.rewards.batch_reward.
+
+A teacher instance lives through many episodes. It starts a new one (new_episode()) after an
+episode ended early, or when Cref rises, which the reference schedule only does on a reset.
+
+Every episode that ends early adds the steps it did not run (against the full EPISODE_STEPS
+episode) to a process-wide tally. With CSTR_TERMINATION_REPORT set to a directory, each training
+process writes its tally there at exit, and this tool sums them into one report for the run.
+
+Usage:
+    CSTR_TERMINATION_REPORT=/tmp/savings composabl agent train ...
+    python -m cstr_common.termination /tmp/savings
+"""
+import argparse
+import atexit
+import glob
+import json
+import os
+
+import numpy as np
+
+from cstr_common.cstr import CA_END, EPISODE_STEPS, RUNAWAY_TEMPERATURE
+from cstr_common.report import format_table
+
+# Defaults of the rules, see the module docstring.
+ERROR_BOUND = 2.0  # kmol/m3
+ERROR_STEPS = 10
+SETTLE_TOLERANCE = 0.05  # kmol/m3
+SETTLE_RATE = 0.5  # K per step
+SETTLE_STEPS = 10
+
+# Reasons an episode ends early; 'settled' is a success, the others are terminations.
+REASONS = ('runaway', 'error', 'settled')
+
+# Environment variable naming the directory the per-process tallies are written to at exit.
+TERMINATION_REPORT_ENV = 'CSTR_TERMINATION_REPORT'
+
+
+# Process-wide tally of the episodes seen by the teachers and the steps saved by ending them early.
+class StepSavings:
+    def __init__(self):
+        self.episodes = 0
+        self.steps_run = 0
+        self.ended = dict.fromkeys(REASONS, 0)
+        self.steps_saved = dict.fromkeys(REASONS, 0)
+
+    def record(self, reason, steps_saved):
+        self.ended[reason] += 1
+        self.steps_saved[reason] += steps_saved
+
+    # Totals, with the saving as a fraction of the steps the episodes would have run to the end.
+    def summary(self):
+        saved = sum(self.steps_saved.values())
+        total = self.steps_run + saved
+        return {
+            'episodes': self.episodes,
+            'ended_early': sum(self.ended.values()),
+            'steps_run': self.steps_run,
+            'steps_saved': saved,
+            'saved_fraction': saved / total if total else float('nan'),
+            **{f'{reason}_episodes': self.ended[reason] for reason in REASONS},
+            **{f'{reason}_steps_saved': self.steps_saved[reason] for reason in REASONS},
+        }
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump({'episodes': self.episodes, 'steps_run': self.steps_run, 'ended': self.ended,
+                       'steps_saved': self.steps_saved}, f)
+
+    # Sums the tallies written by write().
+    @classmethod
+    def read(cls, paths):
+        savings = cls()
+        for path in paths:
+            with open(path) as f:
+                data = json.load(f)
+            savings.episodes += data['episodes']
+            savings.steps_run += data['steps_run']
+            for reason in REASONS:
+                savings.ended[reason] += data['ended'][reason]
+                savings.steps_saved[reason] += data['steps_saved'][reason]
+        return savings
+
+
+savings = StepSavings()
+
+
+# The EpisodeCriteria class evaluates the termination and success rules of one episode.
+# A teacher calls update() once per observation (from compute_reward) and reads `terminated` and
+# `succeeded` in compute_termination and compute_success_criteria. Each rule can be disabled on its
+# own by passing None for its threshold, or all of them with enabled=False.
+class EpisodeCriteria:
+    def __init__(self, runaway_temperature=RUNAWAY_TEMPERATURE, error_bound=ERROR_BOUND, error_steps=ERROR_STEPS,
+                 settle_tolerance=SETTLE_TOLERANCE, settle_rate=SETTLE_RATE, settle_steps=SETTLE_STEPS,
+                 settle_setpoint=CA_END, episode_steps=EPISODE_STEPS, success_bonus=False, enabled=False):
+        """
+        Args:
+            runaway_temperature: Reactor temperature (K) that terminates the episode.
+            error_bound: |Ca - Cref| (kmol/m3) counted as far off the setpoint.
+            error_steps: Consecutive far-off steps that terminate the episode.
+            settle_tolerance: |Ca - Cref| (kmol/m3) counted as on the setpoint.
+            settle_rate: Largest T change (K per step) counted as steady.
+            settle_steps: Consecutive steady, on-setpoint steps that count as success.
+            settle_setpoint: Cref of the final steady state; None accepts any constant Cref.
+            episode_steps: Full episode length, against which the saved steps are counted.
+            success_bonus: If True, a settled episode is paid the return of the steps it did not run.
+            enabled: If True, the rules end episodes; if False (the default) no rule ever fires.
+        """
+        self.runaway_temperature = runaway_temperature
+        self.error_bound = error_bound
+        self.error_steps = error_steps
+        self.settle_tolerance = settle_tolerance
+        self.settle_rate = settle_rate
+        self.settle_steps = settle_steps
+        self.settle_setpoint = settle_setpoint
+        self.episode_steps = episode_steps
+        self.pay_success_bonus = success_bonus
+        self.enabled = enabled
+        self.reset()
+
+    # Clears the counters for a new episode.
+    def reset(self):
+        # steps: Observations after the first one (the teachers' rewarded steps).
+        # error_run / settle_run: Current runs of consecutive far-off and steady steps.
+        # last_T / last_Cref: Previous observation's T and Cref (None before the first observation).
+        # reason: Rule that ended the episode (one of REASONS), None while it runs.
+        self.steps = 0
+        self.error_run = 0
+        self.settle_run = 0
+        self.last_T = None
+        self.last_Cref = None
+        self.reason = None
+
+    @property
+    def terminated(self):
+        return self.reason in ('runaway', 'error')
+
+    @property
+    def succeeded(self):
+        return self.reason == 'settled'
+
+    # Whether an observation opens a new episode: the previous one ended early, or Cref rose (the
+    # reference schedule only falls, so the environment was reset).
+    def new_episode(self, obs):
+        return self.reason is not None or (self.last_Cref is not None and obs['Cref'] > self.last_Cref)
+
+    # Extra reward for the step that settles the episode: the step reward for each step not run.
+    def success_bonus(self, reward):
+        if not (self.pay_success_bonus and self.succeeded):
+            return 0.0
+        return reward * max(self.episode_steps - self.steps, 0)
+
+    # Updates the counters with an observation and returns the reason the episode ends, or None.
+    def update(self, obs):
+        """
+        Args:
+            obs: Observation (or anything with 'Ca', 'Cref' and 'T' items).
+        """
+        if self.reason is not None:
+            return self.reason
+        Ca, Cref, T = obs['Ca'], obs['Cref'], obs['T']
+        if self.last_T is None:
+            savings.episodes += 1
+        else:
+            self.steps += 1
+            savings.steps_run += 1
+        error = abs(Ca - Cref)
+
+        if self.error_bound is not None:
+            self.error_run = self.error_run + 1 if error > self.error_bound else 0
+        if self.settle_steps is not None:
+            steady = (self.last_T is not None and error <= self.settle_tolerance
+                      and abs(T - self.last_T) <= self.settle_rate and Cref == self.last_Cref
+                      and (self.settle_setpoint is None or abs(Cref - self.settle_setpoint) <= 1e-9))
+            self.settle_run = self.settle_run + 1 if steady else 0
+        self.last_T, self.last_Cref = T, Cref
+
+        if not self.enabled:
+            return None
+        if self.runaway_temperature is not None and T >= self.runaway_temperature:
+            self.reason = 'runaway'
+        elif self.error_bound is not None and self.error_run >= self.error_steps:
+            self.reason = 'error'
+        elif self.settle_steps is not None and self.settle_run >= self.settle_steps:
+            self.reason = 'settled'
+        if self.reason is not None:
+            savings.record(self.reason, max(self.episode_steps - self.steps, 0))
+        return self.reason
+
+    def snapshot(self):
+        return {'steps': self.steps, 'error_run': self.error_run, 'settle_run': self.settle_run,
+                'last_T': self.last_T, 'last_Cref': self.last_Cref, 'reason': self.reason}
+
+    def restore(self, state):
+        self.steps = state['steps']
+        self.error_run = state['error_run']
+        self.settle_run = state['settle_run']
+        self.last_T = state['last_T']
+        self.last_Cref = state['last_Cref']
+        self.reason = state['reason']
+
+
+# The BatchCriteria class is the array form of EpisodeCriteria for N environments, used through
+# cstr_common.rewards.RewardState. Every rule and the bonus are evaluated as in EpisodeCriteria, so
+# batch_reward returns the rewards the scalar teachers do.
+class BatchCriteria:
+    def __init__(self, n, **kwargs):
+        """
+        Args:
+            n: Number of environments.
+            kwargs: EpisodeCriteria arguments.
+        """
+        # The thresholds are read from an EpisodeCriteria, so both classes share the defaults.
+        self.rules = EpisodeCriteria(**kwargs)
+        self.steps = np.zeros(n, dtype=np.int64)
+        self.error_run = np.zeros(n, dtype=np.int64)
+        self.settle_run = np.zeros(n, dtype=np.int64)
+        self.last_T = np.full(n, np.nan)
+        self.last_Cref = np.full(n, np.nan)
+        # reason: index into REASONS of the rule that ended each episode, -1 while it runs.
+        self.reason = np.full(n, -1, dtype=np.int64)
+
+    # Clears the counters of the environments selected by mask (all when mask is None).
+    def reset(self, mask=None):
+        if mask is None:
+            mask = slice(None)
+        self.steps[mask] = 0
+        self.error_run[mask] = 0
+        self.settle_run[mask] = 0
+        self.last_T[mask] = np.nan
+        self.last_Cref[mask] = np.nan
+        self.reason[mask] = -1
+
+    # Environments whose observation opens a new episode (see EpisodeCriteria.new_episode).
+    def new_episode(self, Cref):
+        with np.errstate(invalid='ignore'):
+            return (self.reason >= 0) | (Cref > self.last_Cref)
+
+    # Updates the counters of the running episodes with (N,) arrays of Ca, Cref and T.
+    def update(self, Ca, Cref, T):
+        rules = self.rules
+        running = self.reason < 0
+        first = np.isnan(self.last_T)
+        savings.episodes += int(np.count_nonzero(running & first))
+        stepped = running & ~first
+        self.steps += stepped
+        savings.steps_run += int(np.count_nonzero(stepped))
+        error = np.abs(Ca - Cref)
+
+        if rules.error_bound is not None:
+            self.error_run = np.where(running, np.where(error > rules.error_bound, self.error_run + 1, 0), self.error_run)
+        if rules.settle_steps is not None:
+            with np.errstate(invalid='ignore'):
+                steady = (~first & (error <= rules.settle_tolerance) & (np.abs(T - self.last_T) <= rules.settle_rate)
+                          & (Cref == self.last_Cref))
+            if rules.settle_setpoint is not None:
+                steady &= np.abs(Cref - rules.settle_setpoint) <= 1e-9
+            self.settle_run = np.where(running, np.where(steady, self.settle_run + 1, 0), self.settle_run)
+        self.last_T = np.where(running, T, self.last_T)
+        self.last_Cref = np.where(running, Cref, self.last_Cref)
+
+        if not rules.enabled:
+            return
+        reason = np.full(len(running), -1)
+        if rules.settle_steps is not None:
+            reason[self.settle_run >= rules.settle_steps] = REASONS.index('settled')
+        if rules.error_bound is not None:
+            reason[self.error_run >= rules.error_steps] = REASONS.index('error')
+        if rules.runaway_temperature is not None:
+            reason[T >= rules.runaway_temperature] = REASONS.index('runaway')
+        ended = running & (reason >= 0)
+        self.reason[ended] = reason[ended]
+        for i in np.flatnonzero(ended):
+            savings.record(REASONS[self.reason[i]], max(rules.episode_steps - int(self.steps[i]), 0))
+
+    # Per-environment bonus of EpisodeCriteria.success_bonus for (N,) step rewards.
+    def success_bonus(self, rewards):
+        if not self.rules.pay_success_bonus:
+            return np.zeros_like(rewards)
+        settled = self.reason == REASONS.index('settled')
+        return np.where(settled, rewards * np.maximum(self.rules.episode_steps - self.steps, 0), 0.0)
+
+
+@atexit.register
+def _write_savings():
+    directory = os.environ.get(TERMINATION_REPORT_ENV)
+    if directory and savings.episodes:
+        os.makedirs(directory, exist_ok=True)
+        savings.write(os.path.join(directory, f'savings-{os.getpid()}.json'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sum the steps saved by early termination over a training run.")
+    parser.add_argument('directory', help=f"Directory the training processes wrote to ({TERMINATION_REPORT_ENV})")
+    args = parser.parse_args(argv)
+
+    paths = sorted(glob.glob(os.path.join(args.directory, 'savings-*.json')))
+    if not paths:
+        parser.error(f"no savings-*.json files in {args.directory}")
+    print(format_table([{'processes': len(paths), **StepSavings.read(paths).summary()}]))
+
+
+if __name__ == '__main__':
+    main()
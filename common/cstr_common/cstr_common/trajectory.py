@@ -0,0 +1,286 @@
+import atexit
+import itertools
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from cstr_common.observation import Observation
+from cstr_common.sensors import SENSORS
+
+# Columns written for every trajectory record, in file order.
+# stream: Identifies the emitting component instance (one stream per teacher/controller/perceptor).
+# step: Step index reported by the emitter.
+# action: First element of the action (ΔTc for skills, the skill index for selectors).
+# reward: Reward returned by a teacher.
+# skill: Skill index chosen by a selector (-1 when not applicable).
+# runaway_predict / runaway_proba: Perceptor output and classifier probability.
+INT_COLUMNS = ['stream', 'step', 'skill']
+FLOAT_COLUMNS = list(SENSORS) + ['action', 'reward', 'runaway_predict', 'runaway_proba']
+COLUMNS = ['source'] + INT_COLUMNS + FLOAT_COLUMNS
+
+DEFAULT_BATCH_SIZE = 4096
+DEFAULT_MAX_QUEUE = 16
+
+# Environment variable that enables the process-wide writer without code changes.
+TRAJECTORY_DIR_ENV = 'CSTR_TRAJECTORY_DIR'
+
+_streams = itertools.count()
+
+
+# Returns a new stream id. Each emitting component instance takes one at construction.
+def new_stream():
+    return next(_streams)
+
+
+# The TrajectoryWriter class batches trajectory records in memory and writes them from a
+# background thread to compressed columnar files, one file per batch.
+# Records are stored column by column in a preallocated array, so emit() is a handful of
+# assignments. Full batches go through a bounded queue; when the writer thread falls
+# behind, emit() blocks (or drops the batch when block=False) and the wait is counted.
+class TrajectoryWriter:
+    def __init__(self, directory, batch_size=DEFAULT_BATCH_SIZE, max_queue=DEFAULT_MAX_QUEUE, fmt='npz',
+                 prefix='trajectory', block=True):
+        """
+        Args:
+            directory: Directory the batch files are written to (created if missing).
+            batch_size: Number of records per batch file.
+            max_queue: Maximum number of full batches waiting to be written.
+            fmt: 'npz' (numpy.savez_compressed) or 'parquet' (requires pyarrow).
+            prefix: File name prefix for the batch files.
+            block: If True, emit() waits for queue space; if False, full batches are dropped and counted.
+        """
+        if fmt not in ('npz', 'parquet'):
+            raise ValueError(f"Unsupported trajectory format: {fmt}")
+        if fmt == 'parquet':
+            # Fail early instead of on the writer thread.
+            import pyarrow  # noqa: F401
+
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.batch_size = batch_size
+        self.fmt = fmt
+        self.prefix = prefix
+        self.block = block
+
+        # Backpressure and throughput metrics, see stats().
+        self.records = 0
+        self.files_written = 0
+        self.batches_dropped = 0
+        self.blocked_puts = 0
+        self.blocked_seconds = 0.0
+        self.write_seconds = 0.0
+        self.queue_high_water = 0
+
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._file_index = itertools.count()
+        self._new_batch()
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='trajectory-writer', daemon=True)
+        self._thread.start()
+
+    def _new_batch(self):
+        self._ints = np.full((self.batch_size, len(INT_COLUMNS)), -1, dtype=np.int64)
+        self._floats = np.full((self.batch_size, len(FLOAT_COLUMNS)), np.nan, dtype=np.float64)
+        self._sources = [''] * self.batch_size
+        self._n = 0
+
+    # Adds one record to the current batch.
+    def emit(self, source, stream, step, obs=None, action=None, reward=None, skill=-1,
+             runaway_predict=None, runaway_proba=None):
+        """
+        Args:
+            source: Name of the emitting component (for example 'pid' or 'control_transition').
+            stream: Stream id of the emitting instance (see new_stream()).
+            step: Step index reported by the emitter.
+            obs: Sensor data as an Observation, a dictionary or a sequence in SENSORS order.
+            action: Action value; lists, arrays and {'action': value} dictionaries are reduced to a float.
+            reward: Teacher reward.
+            skill: Skill index chosen by a selector.
+            runaway_predict: Perceptor prediction.
+            runaway_proba: Perceptor classifier probability of a runaway.
+        """
+        if self._error is not None:
+            raise RuntimeError("Trajectory writer thread failed") from self._error
+
+        with self._lock:
+            i = self._n
+            self._sources[i] = source
+            ints = self._ints[i]
+            ints[0] = stream
+            ints[1] = step
+            ints[2] = skill
+
+            floats = self._floats[i]
+            if obs is not None:
+                if isinstance(obs, Observation):
+                    floats[:len(SENSORS)] = obs.values
+                elif isinstance(obs, dict):
+                    for j, name in enumerate(SENSORS):
+                        if name in obs:
+                            floats[j] = float(obs[name])
+                else:
+                    for j, value in enumerate(obs[:len(SENSORS)]):
+                        floats[j] = float(value)
+            n = len(SENSORS)
+            if action is not None:
+                floats[n] = _scalar(action)
+            if reward is not None:
+                floats[n + 1] = float(reward)
+            if runaway_predict is not None:
+                floats[n + 2] = float(runaway_predict)
+            if runaway_proba is not None:
+                floats[n + 3] = float(runaway_proba)
+
+            self._n += 1
+            self.records += 1
+            if self._n == self.batch_size:
+                self._submit_locked()
+
+    # Hands the current batch to the writer thread and starts a new one. Caller holds the lock.
+    def _submit_locked(self):
+        if self._n == 0:
+            return
+        batch = (self._sources[:self._n], self._ints[:self._n], self._floats[:self._n])
+        self._new_batch()
+
+        try:
+            self._queue.put_nowait(batch)
+        except queue.Full:
+            if not self.block:
+                self.batches_dropped += 1
+                return
+            self.blocked_puts += 1
+            start = time.perf_counter()
+            self._queue.put(batch)
+            self.blocked_seconds += time.perf_counter() - start
+        self.queue_high_water = max(self.queue_high_water, self._queue.qsize())
+
+    def _run(self):
+        while True:
+            batch = self._queue.get()
+            try:
+                if batch is None:
+                    return
+                start = time.perf_counter()
+                self._write(*batch)
+                self.write_seconds += time.perf_counter() - start
+                self.files_written += 1
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    # Writes one batch to disk. The file is renamed into place once complete,
+    # so readers never see a partial batch.
+    def _write(self, sources, ints, floats):
+        name = f"{self.prefix}-{os.getpid()}-{next(self._file_index):06d}.{self.fmt}"
+        path = os.path.join(self.directory, name)
+        tmp = path + '.tmp'
+
+        columns = {'source': np.array(sources)}
+        for j, column in enumerate(INT_COLUMNS):
+            columns[column] = ints[:, j]
+        for j, column in enumerate(FLOAT_COLUMNS):
+            columns[column] = floats[:, j]
+
+        if self.fmt == 'npz':
+            with open(tmp, 'wb') as f:
+                np.savez_compressed(f, **columns)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            pq.write_table(pa.table(columns), tmp, compression='zstd')
+        os.replace(tmp, path)
+
+    # Submits the partial batch and waits until every queued batch is on disk.
+    def flush(self):
+        with self._lock:
+            self._submit_locked()
+        self._queue.join()
+        if self._error is not None:
+            raise RuntimeError("Trajectory writer thread failed") from self._error
+
+    # Flushes outstanding records and stops the writer thread.
+    def close(self):
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    # Returns the writer's throughput and backpressure metrics.
+    def stats(self):
+        return {
+            'records': self.records,
+            'files_written': self.files_written,
+            'queue_size': self._queue.qsize(),
+            'queue_high_water': self.queue_high_water,
+            'blocked_puts': self.blocked_puts,
+            'blocked_seconds': self.blocked_seconds,
+            'batches_dropped': self.batches_dropped,
+            'write_seconds': self.write_seconds,
+        }
+
+
+# Reduces an action in any of the SDK's formats (scalar, list, array or {'action': value}) to a float.
+def _scalar(value):
+    if isinstance(value, dict):
+        value = value.get('action', np.nan)
+    if isinstance(value, (list, tuple, np.ndarray)):
+        value = np.ravel(value)
+        value = value[0] if value.size else np.nan
+    return float(value)
+
+
+# Reads one batch file written by TrajectoryWriter into a dictionary of column arrays.
+def read_trajectory(path):
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        table = pq.read_table(path)
+        return {name: table.column(name).to_numpy() for name in table.column_names}
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+# Process-wide writer used by the teachers, skills, selectors and perceptor.
+_writer = None
+_env_checked = False
+
+
+# Installs the process-wide writer. Components start emitting to it immediately.
+def configure(directory, **kwargs):
+    global _writer
+    if _writer is not None:
+        _writer.close()
+    _writer = TrajectoryWriter(directory, **kwargs)
+    return _writer
+
+
+# Returns the process-wide writer, creating it from CSTR_TRAJECTORY_DIR if that is set.
+def get_writer():
+    global _env_checked
+    if _writer is None and not _env_checked:
+        _env_checked = True
+        directory = os.environ.get(TRAJECTORY_DIR_ENV)
+        if directory:
+            configure(directory)
+    return _writer
+
+
+# Emits a record to the process-wide writer. This is a no-op when no writer is configured.
+def emit(source, stream, step, **fields):
+    writer = _writer if _writer is not None else get_writer()
+    if writer is not None:
+        writer.emit(source, stream, step, **fields)
+
+
+@atexit.register
+def _close_writer():
+    if _writer is not None:
+        _writer.close()
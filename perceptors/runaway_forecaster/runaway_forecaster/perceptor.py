@@ -0,0 +1,161 @@
+from composabl_core import PerceptorImpl
+
+import functools
+import time
+
+import numpy as np
+
+from cstr_common.cstr import DTC_MAX, RUNAWAY_TEMPERATURE, TC_MAX, TC_MIN, integrate
+from cstr_common.observation import Observation
+
+# Forecast horizon (steps).
+FORECAST_STEPS = 10
+# Coolant moves (K per step) forecast side by side; each is applied on every step of the horizon.
+DTC_CANDIDATES = (-DTC_MAX, -5, -2, 0, 2, 5, DTC_MAX)
+# Reactor temperature (K) counted as a runaway (see cstr_common.cstr.RUNAWAY_TEMPERATURE).
+RUNAWAY_THRESHOLD = RUNAWAY_TEMPERATURE
+
+# Grid of the one-step transition table: Ca (kmol/m3), T (K) and Tc (K) as (start, spacing, points).
+GRID = ((0.0, 0.25, 41), (280.0, 1.0, 141), (float(TC_MIN), 1.0, TC_MAX - TC_MIN + 1))
+
+
+# Tabulates the reactor's state after one step, for every grid state, with the RK4 integrator of the
+# environment (cstr_common.cstr.integrate). Built once per process, on first use (about 0.3 s), and
+# shared by every forecaster instance.
+@functools.lru_cache(maxsize=None)
+def transition_table():
+    """
+    Returns:
+        (Ca, T, Tc, 2) float32 array of the (Ca, T) after one step.
+    """
+    axes = [start + spacing * np.arange(n) for start, spacing, n in GRID]
+    Ca, T, Tc = np.meshgrid(*axes, indexing='ij')
+    with np.errstate(over='ignore', invalid='ignore'):
+        Ca1, T1 = integrate(Ca, T, Tc)
+    # The explicit integrator diverges from the hottest grid states; those run away in any case.
+    T_max = axes[1][-1]
+    T1 = np.clip(np.nan_to_num(T1, nan=T_max, posinf=T_max), axes[1][0], T_max)
+    Ca1 = np.clip(np.nan_to_num(Ca1, nan=0.0), axes[0][0], axes[0][-1])
+    return np.stack([Ca1, T1], axis=-1).astype(np.float32)
+
+
+# Corners of a grid cell as (Ca, T, Tc) offsets 0/1, one row per corner.
+_CORNERS = np.array([[i, j, k] for i in (0, 1) for j in (0, 1) for k in (0, 1)], dtype=np.float64)
+
+
+# Forecasts the reactor under every candidate coolant move, all candidates (and reactors) as one
+# NumPy batch. Each step interpolates the transition table trilinearly, a few dozen array operations
+# for the whole batch, so the forecast does not integrate the stiff reaction term at run time.
+def forecast(Ca, T, Tc, steps=FORECAST_STEPS, candidates=DTC_CANDIDATES, threshold=RUNAWAY_THRESHOLD):
+    """
+    Args:
+        Ca, T, Tc: Current state and coolant temperature, scalars or (N,) arrays.
+        steps: Forecast horizon.
+        candidates: Coolant moves (K per step).
+        threshold: Runaway temperature (K).
+
+    Returns:
+        (N, len(candidates)) array of the first step on which T reaches the threshold, steps + 1 if it does not.
+    """
+    flat = transition_table().reshape(-1, 2)
+    (c0, dc, nc), (t0, dt, nt), (u0, du, nu) = GRID
+    candidates = np.asarray(candidates, dtype=np.float64)
+    m = len(candidates)
+    n = np.size(Ca)
+
+    # One row per (reactor, candidate).
+    X = np.repeat(np.column_stack([np.ravel(Ca), np.ravel(T)]).astype(np.float64), m, axis=0)
+    Tc = np.repeat(np.ravel(Tc).astype(np.float64), m)
+    moves = np.tile(candidates, n)
+
+    # Coolant grid coordinates of every step, computed up front: (steps, rows).
+    k = np.arange(1, steps + 1)[:, None]
+    z = np.clip((np.clip(Tc + moves * k, TC_MIN, TC_MAX) - u0) / du, 0, nu - 1.000001)
+    iz = z.astype(np.intp)
+    fz = z - iz
+
+    # Trilinear weight of corner c: Π (1 - o_c + (2 o_c - 1) f) over the three axes.
+    offset = (_CORNERS[:, 0] * nt * nu + _CORNERS[:, 1] * nu + _CORNERS[:, 2]).astype(np.intp)[:, None]
+    base = 1 - _CORNERS[:, :, None]
+    sign = 2 * _CORNERS[:, :, None] - 1
+    lower = np.array([c0, t0])
+    scale = np.array([1 / dc, 1 / dt])
+    upper = np.array([nc - 1.000001, nt - 1.000001])
+
+    first = np.full(n * m, steps + 1)
+    for step in range(steps):
+        g = np.clip((X - lower) * scale, 0, upper)
+        ig = g.astype(np.intp)
+        fg = g - ig
+        w = (base[:, 0] + sign[:, 0] * fg[:, 0]) * (base[:, 1] + sign[:, 1] * fg[:, 1]) * (base[:, 2] + sign[:, 2] * fz[step])
+        X = np.einsum('ij,ijk->jk', w, flat[(ig[:, 0] * nt + ig[:, 1]) * nu + iz[step] + offset])
+        first[(X[:, 1] >= threshold) & (first > steps)] = step + 1
+    return first.reshape(n, m)
+
+
+# The RunawayForecaster class is a model-based Perceptor. Instead of a trained classifier it
+# forecasts the CSTR over the next FORECAST_STEPS steps under each candidate coolant move and adds:
+#   time_to_runaway: steps until T reaches the runaway threshold if Tc is held,
+#                    FORECAST_STEPS + 1 if it does not within the horizon;
+#   min_safe_dTc:    the smallest coolant move (in magnitude, cooling preferred on ties) that avoids
+#                    a runaway over the horizon, -DTC_MAX if none does.
+class RunawayForecaster(PerceptorImpl):
+    def __init__(self, *args, **kwargs):
+        # steps/candidates/threshold: forecast horizon, coolant moves and runaway temperature.
+        # forecast_seconds/forecasts: total time spent forecasting and number of forecasts.
+        self.steps = kwargs.get('steps', FORECAST_STEPS)
+        self.candidates = np.asarray(kwargs.get('candidates', DTC_CANDIDATES), dtype=np.float64)
+        if 0 not in self.candidates:
+            raise ValueError("candidates must include 0 (holding Tc)")
+        self.threshold = kwargs.get('threshold', RUNAWAY_THRESHOLD)
+        # Candidate indices by preference: smallest move first, cooling before heating.
+        self._preference = np.lexsort((self.candidates, np.abs(self.candidates)))
+        self._hold = int(np.flatnonzero(self.candidates == 0)[0])
+        self.forecast_seconds = 0.0
+        self.forecasts = 0
+
+    # Builds the transition table in a parent process before it forks its workers (see cstr_common.preload).
+    @staticmethod
+    def preload():
+        transition_table()
+
+    # Forecasts the reactor from the current observation.
+    async def compute(self, obs_spec, obs):
+        """
+        Args:
+            obs_spec: Specification of the observations (not used in this implementation).
+            obs: Sensor data from the environment, as an Observation, a dictionary or a list.
+
+        Returns:
+            A dictionary with the new sensor variables `time_to_runaway` and `min_safe_dTc`.
+        """
+        obs = Observation.of(obs)
+        start = time.perf_counter()
+        first = forecast(obs['Ca'], obs['T'], obs['Tc'], self.steps, self.candidates, self.threshold)[0]
+        safe = first[self._preference] > self.steps
+        min_safe_dTc = float(self.candidates[self._preference][safe][0]) if safe.any() else -float(DTC_MAX)
+        self.forecast_seconds += time.perf_counter() - start
+        self.forecasts += 1
+        return {"time_to_runaway": float(first[self._hold]), "min_safe_dTc": min_safe_dTc}
+
+    # Mean forecast time in milliseconds.
+    def forecast_ms(self):
+        return self.forecast_seconds / self.forecasts * 1e3 if self.forecasts else float('nan')
+
+    # The forecaster keeps no state between steps (see cstr_common.snapshot).
+    def snapshot(self):
+        return {}
+
+    def restore(self, state):
+        pass
+
+    # Defines the relevant sensors required for the Perceptor's functionality.
+    def filtered_sensor_space(self, obs):
+        """
+        Args:
+            obs: Sensor data from the environment (not used in this implementation).
+
+        Returns:
+            A list of relevant sensor names required by the Perceptor.
+        """
+        return ['T', 'Tc', 'Ca', 'Cref', 'Tref', 'Conc_Error', 'Eps_Yield', 'Cb_Prod']
@@ -1,11 +1,54 @@
 from composabl_core import PerceptorImpl
 
+import functools
+import math
 import os
 import pickle
 
+from cstr_common import trajectory
+from cstr_common.cstr import DTC_MAX, E, F, R, TC_MIN, UA, V, Tf, k0, phoCp, ΔH
+from cstr_common.observation import Observation
+
 # Get the path to the current file to correctly locate the ML model file.
 path = os.path.dirname(os.path.realpath(__file__))
 
+# Pickled classifier used by the perceptor.
+MODEL_FILE = "ml_models/ml_predict_temperature_122.pkl"
+
+# Below T_GATE (K) the classifier is never invoked and the prediction is 0.
+T_GATE = 340
+# Energy-balance screen thresholds on the net heating rate dT/dt (K per step) and on the temperature (K)
+# up to which a stable state is screened as safe, see screen(). Tune them with the perceptor's audit mode.
+SAFE_RATE = 0.5
+RUNAWAY_RATE = 15.0
+SAFE_TEMPERATURE = 375
+
+
+# Loads the ML model once per process, on first use. Unpickling imports scikit-learn, so deferring it
+# keeps agent startup fast; every perceptor instance in the process shares the loaded (read-only) model.
+@functools.lru_cache(maxsize=None)
+def load_model(filename=MODEL_FILE):
+    with open(os.path.join(path, filename), 'rb') as f:
+        return pickle.load(f)
+
+# First stage of the cascade: an energy balance of the reactor in a few floating-point operations.
+# Heat generation by the reaction is compared with the heat removed by the jacket and the flow:
+#   - a net heating rate of at least runaway_rate is a runaway (1);
+#   - a net heating rate of at most safe_rate, up to safe_temperature, that one maximal coolant move
+#     (DTC_MAX lower, within the coolant limits) turns into cooling is safe (0). The temperature limit
+#     keeps the hot, already ignited states with the classifier;
+#   - anything else is ambiguous (None) and goes to the classifier.
+def screen(Ca, T, Tc, safe_rate=SAFE_RATE, runaway_rate=RUNAWAY_RATE, safe_temperature=SAFE_TEMPERATURE):
+    generation = -ΔH / phoCp * k0 * math.exp(-E / (R * T)) * Ca  # K per step
+    rate = generation - UA / (phoCp * V) * (T - Tc) + F / V * (Tf - T)
+    if rate >= runaway_rate:
+        return 1
+    if T <= safe_temperature and rate <= safe_rate:
+        cooled = rate - UA / (phoCp * V) * (Tc - max(Tc - DTC_MAX, TC_MIN))
+        if cooled < 0:
+            return 0
+    return None
+
 # The ThermalRunawayPredict class is a custom Perceptor that uses a pre-trained ML model
 # to predict thermal runaway events. The prediction is added as a new sensor variable.
 class ThermalRunawayPredict(PerceptorImpl):
@@ -13,14 +56,36 @@ class ThermalRunawayPredict(PerceptorImpl):
         # Initialize variables for tracking and processing.
         # y: Tracks the current prediction output from the ML model.
         # thermal_run: An optional variable to track if a thermal runaway condition has occurred (currently unused).
-        # ml_model: The pre-trained machine learning model loaded from a pickle file.
+        # ml_model: The pre-trained machine learning model, loaded from a pickle file on first use (see load_model).
         # ML_list: A list to track relevant ML-related outputs or actions (currently unused).
         # last_Tc: Stores the last observed coolant temperature (Tc) to calculate the change (ΔTc).
         self.y = 0
         self.thermal_run = 0
-        self.ml_model = pickle.load(open(f"{path}/ml_models/ml_predict_temperature_122.pkl", 'rb'))
+        self.ml_model = None
         self.ML_list = []
         self.last_Tc = 0
+        # stream/count: Trajectory stream id and step index used when episodes are persisted.
+        self.stream = trajectory.new_stream()
+        self.count = 0
+        # cascade: if True, the energy-balance screen (see screen()) decides clear cases above T_GATE and the
+        #          classifier runs only on ambiguous ones; safe_rate/runaway_rate/safe_temperature are the screen's thresholds.
+        #          Off by default: the classifier decides every step until an audit shows the screen agrees with it.
+        # audit: if True, the screen and the classifier both run on every step the screen decides and their
+        #        agreement is counted. The output is the screen's decision with cascade on, the classifier's with it off.
+        # stats: step counts by stage, reported by cascade_summary().
+        self.cascade = kwargs.get('cascade', False)
+        self.safe_rate = kwargs.get('safe_rate', SAFE_RATE)
+        self.runaway_rate = kwargs.get('runaway_rate', RUNAWAY_RATE)
+        self.safe_temperature = kwargs.get('safe_temperature', SAFE_TEMPERATURE)
+        self.audit = kwargs.get('audit', False)
+        self.stats = {'steps': 0, 'gated': 0, 'screened_safe': 0, 'screened_runaway': 0, 'model_calls': 0,
+                      'audited': 0, 'agreed': 0, 'model_positives': 0, 'missed_positives': 0}
+
+    # Loads the ML model in a parent process before it forks its workers, which then share it
+    # copy-on-write instead of each unpickling its own copy (see cstr_common.preload).
+    @staticmethod
+    def preload():
+        load_model()
 
     # Processes sensor data and computes predictions using the ML model.
     # Outputs a new sensor variable `thermal_runaway_predict` based on the ML model's prediction.
@@ -28,44 +93,100 @@ class ThermalRunawayPredict(PerceptorImpl):
         """
         Args:
             obs_spec: Specification of the observations (not used in this implementation).
-            obs: Sensor data from the environment, either as a dictionary or list.
+            obs: Sensor data from the environment, as an Observation, a dictionary or a list.
 
         Returns:
             A dictionary containing the prediction as a new sensor variable: `thermal_runaway_predict`.
         """
-        # Convert observations to a dictionary if they are not already in that format.
-        if type(obs) != dict:
-            obs_keys = ['T', 'Tc', 'Ca', 'Cref', 'Tref', 'Conc_Error', 'Eps_Yield', 'Cb_Prod']
-            obs = dict(zip(obs_keys, obs))  # Map predefined keys to observed values.
+        # Parse the observation once (an Observation is used as is) and read the values the model needs.
+        obs = Observation.of(obs)
+        T = obs['T']
+        Tc = obs['Tc']
 
         # Calculate the change in coolant temperature (ΔTc).
         if self.last_Tc == 0:  # If this is the first step, initialize ΔTc with a default value.
             self.ΔTc = 5
         else:
-            self.ΔTc = float(obs['Tc']) - self.last_Tc  # Compute ΔTc as the difference from the previous Tc.
+            self.ΔTc = Tc - self.last_Tc  # Compute ΔTc as the difference from the previous Tc.
 
-        # Initialize prediction output.
+        # Initialize prediction output and the classifier probability (NaN when the model is not invoked).
         y = 0
+        proba = float('nan')
 
-        # Perform ML-based prediction if the current temperature exceeds a threshold.
-        if float(obs['T']) >= 340:  # Threshold condition for invoking the ML model.
-            # Prepare input features for the ML model.
-            X = [[float(obs['Ca']), float(obs['T']), float(obs['Tc']), self.ΔTc]]
+        self.stats['steps'] += 1
 
-            # Use the ML model to predict the thermal runaway condition.
-            y = self.ml_model.predict(X)[0]  # Predict thermal runaway (binary output: 0 or 1).
+        # Perform prediction if the current temperature exceeds a threshold.
+        if T >= T_GATE:  # Threshold condition for invoking the cascade.
+            # Cheap energy-balance screen first; the ML model runs only when it is ambiguous (or when auditing).
+            stage = None
+            if self.cascade or self.audit:
+                stage = screen(obs['Ca'], T, Tc, self.safe_rate, self.runaway_rate, self.safe_temperature)
+            decided = stage is not None and self.cascade
+            if not decided or self.audit:
+                y_model, proba = self._classify([[obs['Ca'], T, Tc, self.ΔTc]])
 
-            # Optionally, check the probability output from the ML model.
-            if self.ml_model.predict_proba(X)[0][1] >= 0.3:  # Confidence threshold for positive prediction.
-                y = 1  # Set the prediction to 1 if the probability of runaway exceeds 30%.
+            if not decided:
+                self.stats['model_calls'] += 1
+                y = y_model
+            else:
+                self.stats['screened_runaway' if stage else 'screened_safe'] += 1
+                y = stage
+            if stage is not None and self.audit:
+                self.stats['audited'] += 1
+                self.stats['agreed'] += int(stage == y_model)
+                self.stats['model_positives'] += int(y_model == 1)
+                self.stats['missed_positives'] += int(y_model == 1 and stage == 0)
+            if y == 1:
                 self.y = y  # Update the internal tracking variable.
+        else:
+            self.stats['gated'] += 1
 
         # Update the last observed coolant temperature for the next computation.
-        self.last_Tc = float(obs['Tc'])
+        self.last_Tc = Tc
+
+        self.count += 1
+        trajectory.emit('thermal_runaway_predictor', self.stream, self.count, obs=obs,
+                        runaway_predict=y, runaway_proba=proba)
 
         # Return the prediction as a new sensor variable.
         return {"thermal_runaway_predict": y}
 
+    # Runs the ML model on the input features (Ca, T, Tc, ΔTc) and returns the prediction and the runaway probability.
+    def _classify(self, X):
+        # Use the ML model to predict the thermal runaway condition.
+        if self.ml_model is None:
+            self.ml_model = load_model()
+        y = self.ml_model.predict(X)[0]  # Predict thermal runaway (binary output: 0 or 1).
+
+        # Optionally, check the probability output from the ML model.
+        proba = self.ml_model.predict_proba(X)[0][1]
+        if proba >= 0.3:  # Confidence threshold for positive prediction.
+            y = 1  # Set the prediction to 1 if the probability of runaway exceeds 30%.
+        return y, proba
+
+    # Returns the step counts by cascade stage, the fraction of steps on which the classifier ran,
+    # and, with audit on, the screen's agreement with the classifier and its recall of the classifier's positives.
+    def cascade_summary(self):
+        stats = dict(self.stats)
+        steps = stats['steps']
+        stats['model_call_rate'] = stats['model_calls'] / steps if steps else float('nan')
+        stats['screen_rate'] = (stats['screened_safe'] + stats['screened_runaway']) / steps if steps else float('nan')
+        stats['agreement'] = stats['agreed'] / stats['audited'] if stats['audited'] else float('nan')
+        positives = stats['model_positives']
+        stats['screen_recall'] = 1 - stats['missed_positives'] / positives if positives else float('nan')
+        return stats
+
+    # Returns the state carried between steps for a checkpoint (see cstr_common.snapshot).
+    # ΔTc is recomputed from last_Tc on every step, and the ML model is loaded, not snapshotted.
+    def snapshot(self):
+        return {'y': self.y, 'last_Tc': self.last_Tc, 'count': self.count}
+
+    # Restores the state from snapshot().
+    def restore(self, state):
+        self.y = state['y']
+        self.last_Tc = state['last_Tc']
+        self.count = state['count']
+
     # Defines the relevant sensors required for the Perceptor's functionality.
     # These are the sensors used as inputs for the ML model.
     def filtered_sensor_space(self, obs):
@@ -1,22 +1,33 @@
 import math
-import numpy as np
 from composabl import Teacher
 
+from cstr_common import trajectory
+from cstr_common.observation import Observation
+from cstr_common.recorder import DEFAULT_MAX_STEPS, TEACHER_COLUMNS, EpisodeRecorder
+from cstr_common.rewards import batch_reward, reward_from_error_sum
+from cstr_common.termination import EpisodeCriteria
+
 class Teacher(Teacher):
     def __init__(self, *args, **kwargs):
         # Initialize history and tracking variables.
-        # obs_history: Stores the history of observed sensor data.
-        # reward_history: Tracks the rewards calculated during training.
-        # last_reward: Keeps a record of the most recent reward.
-        # error_history: Logs errors between reference (Cref) and actual (Ca) concentrations.
-        # rms_history: Maintains root mean squared (RMS) errors over time.
-        # count: Tracks the number of rewards computed.
-        self.obs_history = None
-        self.reward_history = []
+        # history: Columnar, array-backed record of the observed sensor data and the per-step
+        #          error, RMS error and reward (see cstr_common.recorder.EpisodeRecorder).
+        #          history_max_steps keeps only the last N steps (None keeps the full episode) and
+        #          history_spill_path moves the buffer into a memory-mapped file.
+        # last_reward: Tracks the most recent reward.
+        # error_sum: Running sum of the squared errors between Cref and Ca.
+        # count: Counts the number of times rewards have been computed.
+        # stream: Trajectory stream id used when episodes are persisted (see cstr_common.trajectory).
+        # criteria: Early-termination and success rules (see cstr_common.termination); the
+        #           `criteria` argument is a dictionary of EpisodeCriteria arguments.
+        self.history = EpisodeRecorder(extra_columns=TEACHER_COLUMNS,
+                                       max_steps=kwargs.get('history_max_steps', DEFAULT_MAX_STEPS),
+                                       spill_path=kwargs.get('history_spill_path'))
         self.last_reward = 0
-        self.error_history = []
-        self.rms_history = []
+        self.error_sum = 0.0
         self.count = 0
+        self.stream = trajectory.new_stream()
+        self.criteria = EpisodeCriteria(**kwargs.get('criteria', {}))
 
     # Processes sensor data if needed. By default, this function returns the data unchanged.
     # Useful for normalizing, filtering, or otherwise modifying raw sensor values.
@@ -37,42 +48,73 @@ class Teacher(Teacher):
     # Computes the reward signal based on the agent's performance.
     # Encourages minimizing the error between the reference concentration (Cref) and the actual concentration (Ca).
     async def compute_reward(self, transformed_obs, action, sim_reward):
-        # Initialize observation history if this is the first step.
-        if self.obs_history is None:
-            self.obs_history = [transformed_obs]
-            return 0.0  # No reward for the initial step.
-        else:
-            # Append the current observation to the history.
-            self.obs_history.append(transformed_obs)
-
-        # Calculate the squared error between the reference and actual concentrations.
-        error = (float(transformed_obs['Cref']) - float(transformed_obs['Ca']))**2
-        self.error_history.append(error)
-
-        # Compute the root mean square (RMS) error over the observed history.
-        rms = math.sqrt(np.mean(self.error_history))
-        self.rms_history.append(rms)
-
-        # Calculate the reward using an exponential decay function to penalize cumulative errors.
-        reward = math.exp(-0.01 * np.sum(self.error_history))
-        self.reward_history.append(reward)
-
-        # Increment the reward calculation counter.
+        # Parse the observation once; the history, the error and the trajectory all read from it.
+        obs = Observation.of(transformed_obs)
+        if self.criteria.new_episode(obs):
+            self.reset()
+        self.criteria.update(obs)
+
+        # The first observation only opens the episode history; no reward is given for it.
+        if self.history.total == 0:
+            self.history.append(obs, reward=0.0)
+            trajectory.emit('learned_selector', self.stream, 0, obs=obs, action=action, reward=0.0)
+            return 0.0
+
+        # Compute the squared error between the reference concentration (Cref) and the actual concentration (Ca).
+        error = (obs['Cref'] - obs['Ca'])**2
+        self.error_sum += error
         self.count += 1
+
+        # Compute the root mean square (RMS) error over all errors seen so far from the running sum.
+        rms = math.sqrt(self.error_sum / self.count)
+
+        # Compute the reward using an exponential decay based on the cumulative error.
+        reward = float(reward_from_error_sum(self.error_sum))
+        reward += self.criteria.success_bonus(reward)
+        self.last_reward = reward
+
+        # Record the step in the episode history.
+        self.history.append(obs, error=error, rms=rms, reward=reward)
+        trajectory.emit('learned_selector', self.stream, self.count, obs=obs, action=action, reward=reward)
         return reward
 
+    # Batch counterpart of compute_reward for vectorized environment runners.
+    # Takes an (N, sensors) array and a cstr_common.rewards.RewardState with the per-environment
+    # running sums, and returns the N rewards computed exactly as compute_reward does when the
+    # RewardState is built with the teacher's `criteria` (RewardState(n, criteria=...)).
+    compute_reward_batch = staticmethod(batch_reward)
+
+    # Returns the episode state (history, running error sum and step count) for a checkpoint (see cstr_common.snapshot).
+    def snapshot(self):
+        return {'history': self.history.snapshot(), 'last_reward': self.last_reward,
+                'error_sum': self.error_sum, 'count': self.count,
+                'criteria': self.criteria.snapshot()}
+
+    # Clears the episode state when a new episode starts (see EpisodeCriteria.new_episode).
+    def reset(self):
+        self.history.reset()
+        self.last_reward = 0
+        self.error_sum = 0.0
+        self.count = 0
+        self.criteria.reset()
+
+    # Restores the episode state from snapshot().
+    def restore(self, state):
+        self.history.restore(state['history'])
+        self.last_reward = state['last_reward']
+        self.error_sum = state['error_sum']
+        self.count = state['count']
+        self.criteria.restore(state['criteria'])
+
     # Optionally restricts the agent's action space.
     # By default, this function imposes no restrictions (returns None).
     async def compute_action_mask(self, transformed_obs, action):
         return None
 
-    # Defines the success criteria for the skill.
-    # This implementation does not define any success criteria and always returns False.
+    # Succeeds once the reactor has settled in the final steady state (see cstr_common.termination).
     async def compute_success_criteria(self, transformed_obs, action):
-        success = False
-        return success
+        return self.criteria.succeeded
 
-    # Determines whether to terminate the current training episode.
-    # This implementation does not terminate episodes and always returns False.
+    # Terminates hopeless episodes: a thermal runaway, or Ca far off Cref for many steps in a row.
     async def compute_termination(self, transformed_obs, action):
-        return False
\ No newline at end of file
+        return self.criteria.terminated
\ No newline at end of file
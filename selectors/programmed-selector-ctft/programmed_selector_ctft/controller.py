@@ -1,5 +1,28 @@
 from typing import Dict, List
 from composabl_core import SkillController
+import numpy as np
+
+from cstr_common import trajectory
+from cstr_common.observation import Observation
+
+# Relative concentration error at or above which the corrective (coarse tuning) skill is selected.
+ERROR_THRESHOLD = 0.1
+
+
+# Vectorized counterpart of Controller.compute_action for N environments.
+def select_batch(Ca, Cref):
+    """
+    Args:
+        Ca: Array of measured concentrations, one per environment.
+        Cref: Array of reference concentrations, one per environment.
+
+    Returns:
+        An integer array with the selected skill index per environment (1 = corrective, 0 = none).
+    """
+    Ca = np.asarray(Ca, dtype=np.float64)
+    Cref = np.asarray(Cref, dtype=np.float64)
+    return (np.abs(Ca - Cref) / Cref >= ERROR_THRESHOLD).astype(np.int64)
+
 
 # The Controller class is a custom implementation of a skill controller.
 # It defines logic for computing actions based on observed errors in concentration.
@@ -8,6 +31,8 @@ class Controller(SkillController):
         # Initialize tracking variables.
         # counter: Tracks the number of steps or iterations the controller has executed.
         self.counter = 0
+        # stream: Trajectory stream id used when episodes are persisted (see cstr_common.trajectory).
+        self.stream = trajectory.new_stream()
 
     # Computes the action to be taken by the agent based on the observed concentration error.
     # If the error exceeds 10%, the controller takes corrective action.
@@ -24,16 +49,26 @@ class Controller(SkillController):
         self.counter += 1
 
         # Calculate the error between the reference concentration (Cref) and actual concentration (Ca).
-        error_percentage = abs(float(obs['Ca']) - float(obs['Cref'])) / float(obs['Cref'])
+        obs = Observation.of(obs)
+        error_percentage = abs(obs['Ca'] - obs['Cref']) / obs['Cref']
 
         # Decide the action based on the error threshold.
-        if error_percentage >= 0.1:  # If the error is 10% or more.
+        if error_percentage >= ERROR_THRESHOLD:  # If the error is 10% or more.
             action = 1  # Corrective action.
         else:
             action = 0  # No corrective action needed.
 
+        trajectory.emit('programmed_selector_ctft', self.stream, self.counter, obs=obs, action=action, skill=action)
         return action
 
+    # Returns the step counter for a checkpoint (see cstr_common.snapshot).
+    def snapshot(self):
+        return {'counter': self.counter}
+
+    # Restores the step counter from snapshot().
+    def restore(self, state):
+        self.counter = state['counter']
+
     # Transforms the observed sensor data if needed.
     # By default, this function returns the data unchanged.
     async def transform_sensors(self, obs):
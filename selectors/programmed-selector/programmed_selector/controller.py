@@ -1,5 +1,27 @@
 from typing import Dict, List
 from composabl_core import SkillController
+import numpy as np
+
+from cstr_common import trajectory
+
+# Step boundaries of the three phases: start_reaction up to START_END, produce_product from PRODUCE_START,
+# control_transition in between.
+START_END = 22
+PRODUCE_START = 76
+
+
+# Vectorized counterpart of Controller.compute_action for N environments.
+def select_batch(counters):
+    """
+    Args:
+        counters: Array of step counters, one per environment, already incremented for the current step.
+
+    Returns:
+        An integer array with the selected skill index per environment.
+    """
+    counters = np.asarray(counters)
+    return np.select([(counters >= 0) & (counters <= START_END), counters >= PRODUCE_START], [0, 2], 1)
+
 
 # The Controller class is a custom implementation of a skill controller.
 # It defines logic for computing actions based on observations and tracks state during execution.
@@ -8,6 +30,8 @@ class Controller(SkillController):
         # Initialize tracking variables.
         # counter: Keeps track of the number of steps or iterations since the controller started.
         self.counter = 0
+        # stream: Trajectory stream id used when episodes are persisted (see cstr_common.trajectory).
+        self.stream = trajectory.new_stream()
 
     # Computes the action to be taken by the agent based on the current step.
     # Implements a simple time-based logic for deciding actions.
@@ -24,15 +48,24 @@ class Controller(SkillController):
         self.counter += 1
 
         # Define action logic based on the current step range.
-        if self.counter >= 0 and self.counter <= 22:
+        if self.counter >= 0 and self.counter <= START_END:
             action = 0  # Action 0 for the first 22 steps.
-        elif self.counter >= 76:
+        elif self.counter >= PRODUCE_START:
             action = 2  # Action 2 after step 76.
         else:
             action = 1  # Default action for steps between 23 and 75.
 
+        trajectory.emit('programmed_selector', self.stream, self.counter, obs=obs, action=action, skill=action)
         return action
 
+    # Returns the step counter for a checkpoint (see cstr_common.snapshot).
+    def snapshot(self):
+        return {'counter': self.counter}
+
+    # Restores the step counter from snapshot().
+    def restore(self, state):
+        self.counter = state['counter']
+
     # Transforms the observed sensor data if needed.
     # By default, this function returns the data unchanged.
     async def transform_sensors(self, obs):
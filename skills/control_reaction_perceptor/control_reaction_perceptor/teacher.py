@@ -2,22 +2,33 @@ import math
 import numpy as np
 from composabl import Teacher
 
+from cstr_common import trajectory
+from cstr_common.observation import Observation, runaway_predict
+from cstr_common.recorder import DEFAULT_MAX_STEPS, TEACHER_COLUMNS, EpisodeRecorder
+from cstr_common.rewards import batch_reward, batch_transform_action, reward_from_error_sum, RUNAWAY_DAMPING
+from cstr_common.termination import EpisodeCriteria
+
 class BaseCSTR(Teacher):
     def __init__(self, *args, **kwargs):
         # Initialize history and tracking variables.
-        # obs_history: Keeps a record of observed sensor data.
-        # reward_history: Stores all the rewards calculated during training.
+        # history: Columnar, array-backed record of the observed sensor data and the per-step
+        #          error, RMS error and reward (see cstr_common.recorder.EpisodeRecorder).
+        #          history_max_steps keeps only the last N steps (None keeps the full episode) and
+        #          history_spill_path moves the buffer into a memory-mapped file.
         # last_reward: Tracks the most recent reward.
-        # error_history: Tracks errors between reference concentration (Cref) and actual concentration (Ca).
-        # rms_history: Records root mean squared (RMS) error over time.
-        # count: Counts the number of reward computations.
-        self.obs_history = None
-        self.reward_history = []
-        self.last_reward = 0
-        self.error_history = []
-        self.rms_history = []
+        # error_sum: Running sum of the squared errors between Cref and Ca.
+        # count: Counts the number of times rewards have been computed.
+        # stream: Trajectory stream id used when episodes are persisted (see cstr_common.trajectory).
+        # criteria: Early-termination and success rules (see cstr_common.termination); the
+        #           `criteria` argument is a dictionary of EpisodeCriteria arguments.
+        self.history = EpisodeRecorder(extra_columns=TEACHER_COLUMNS,
+                                       max_steps=kwargs.get('history_max_steps', DEFAULT_MAX_STEPS),
+                                       spill_path=kwargs.get('history_spill_path'))
         self.last_reward = 0
+        self.error_sum = 0.0
         self.count = 0
+        self.stream = trajectory.new_stream()
+        self.criteria = EpisodeCriteria(**kwargs.get('criteria', {}))
 
     # Transforms sensor data if needed. Currently, it passes the observation through unmodified.
     # This method can be extended for normalization or unit conversion.
@@ -30,26 +41,22 @@ class BaseCSTR(Teacher):
         # Extract the coolant temperature change from the action array.
         self.ΔTc = action[0]
 
-        # Handle different observation formats (dictionary or list-like).
-        if type(transformed_obs) == dict:
-            # If the observation is a dictionary, extract the key 'observation' or a specific prediction field.
-            if 'observation' in list(transformed_obs.keys()):
-                transformed_obs = transformed_obs['observation']
-                y = transformed_obs[5]  # Extract thermal runaway prediction or other key data.
-            else:
-                y = transformed_obs['thermal_runaway_predict']
-        else:
-            y = transformed_obs[5]  # For list-like observations, use index 5.
+        # Read the thermal runaway prediction from whichever observation format the SDK passed in.
+        y = runaway_predict(transformed_obs)
 
         # Apply machine learning-based constraints to avoid thermal runaway.
         if y == 1:  # If a thermal runaway is predicted:
             # Reduce the magnitude of ΔTc to slow down the cooling or heating process.
-            self.ΔTc -= 0.05 * abs(self.ΔTc) * np.sign(self.ΔTc)
+            self.ΔTc -= RUNAWAY_DAMPING * abs(self.ΔTc) * np.sign(self.ΔTc)
 
         # Reconstruct the action array with the adjusted ΔTc.
         action = np.array([self.ΔTc])
         return action
 
+    # Batch counterpart of transform_action for vectorized environment runners.
+    # Takes (N,) arrays of ΔTc and thermal_runaway_predict and returns the N damped ΔTc values.
+    transform_action_batch = staticmethod(batch_transform_action)
+
     # Filters the sensor space to include only relevant sensors for the skill.
     async def filtered_sensor_space(self):
         # Select relevant sensors such as temperature (T, Tc), concentration (Ca, Cref), and other metrics.
@@ -58,42 +65,73 @@ class BaseCSTR(Teacher):
     # Computes the reward for the agent's actions based on observed sensor data.
     # Rewards are based on minimizing the error between the reference concentration (Cref) and actual concentration (Ca).
     async def compute_reward(self, transformed_obs, action, sim_reward):
-        # Initialize observation history if it's the first call.
-        if self.obs_history is None:
-            self.obs_history = [transformed_obs]
+        # Parse the observation once; the history, the error and the trajectory all read from it.
+        obs = Observation.of(transformed_obs)
+        if self.criteria.new_episode(obs):
+            self.reset()
+        self.criteria.update(obs)
+
+        # The first observation only opens the episode history; no reward is given for it.
+        if self.history.total == 0:
+            self.history.append(obs, reward=0.0)
+            trajectory.emit('control_reaction_perceptor', self.stream, 0, obs=obs, action=action, reward=0.0)
             return 0.0
-        else:
-            # Append the current observation to the history.
-            self.obs_history.append(transformed_obs)
 
-        # Calculate the squared error between Cref and Ca.
-        error = (float(transformed_obs['Cref']) - float(transformed_obs['Ca']))**2
-        self.error_history.append(error)
+        # Compute the squared error between the reference concentration (Cref) and the actual concentration (Ca).
+        error = (obs['Cref'] - obs['Ca'])**2
+        self.error_sum += error
+        self.count += 1
 
-        # Compute the root mean square (RMS) error over all recorded errors.
-        rms = math.sqrt(np.mean(self.error_history))
-        self.rms_history.append(rms)
+        # Compute the root mean square (RMS) error over all errors seen so far from the running sum.
+        rms = math.sqrt(self.error_sum / self.count)
 
-        # Calculate the reward using an exponential decay function of the cumulative error.
-        reward = math.exp(-0.01 * np.sum(self.error_history))
-        self.reward_history.append(reward)
+        # Compute the reward using an exponential decay based on the cumulative error.
+        reward = float(reward_from_error_sum(self.error_sum))
+        reward += self.criteria.success_bonus(reward)
+        self.last_reward = reward
 
-        # Increment the count of reward computations.
-        self.count += 1
+        # Record the step in the episode history.
+        self.history.append(obs, error=error, rms=rms, reward=reward)
+        trajectory.emit('control_reaction_perceptor', self.stream, self.count, obs=obs, action=action, reward=reward)
         return reward
 
+    # Batch counterpart of compute_reward for vectorized environment runners.
+    # Takes an (N, sensors) array and a cstr_common.rewards.RewardState with the per-environment
+    # running sums, and returns the N rewards computed exactly as compute_reward does when the
+    # RewardState is built with the teacher's `criteria` (RewardState(n, criteria=...)).
+    compute_reward_batch = staticmethod(batch_reward)
+
+    # Returns the episode state (history, running error sum and step count) for a checkpoint (see cstr_common.snapshot).
+    def snapshot(self):
+        return {'history': self.history.snapshot(), 'last_reward': self.last_reward,
+                'error_sum': self.error_sum, 'count': self.count,
+                'criteria': self.criteria.snapshot()}
+
+    # Clears the episode state when a new episode starts (see EpisodeCriteria.new_episode).
+    def reset(self):
+        self.history.reset()
+        self.last_reward = 0
+        self.error_sum = 0.0
+        self.count = 0
+        self.criteria.reset()
+
+    # Restores the episode state from snapshot().
+    def restore(self, state):
+        self.history.restore(state['history'])
+        self.last_reward = state['last_reward']
+        self.error_sum = state['error_sum']
+        self.count = state['count']
+        self.criteria.restore(state['criteria'])
+
     # Optionally restrict the set of actions available to the agent.
     # Returns None, indicating no restrictions in this implementation.
     async def compute_action_mask(self, transformed_obs, action):
         return None
 
-    # Defines the success criteria for the skill.
-    # Currently, it always returns False, indicating no success condition is set yet.
+    # Succeeds once the reactor has settled in the final steady state (see cstr_common.termination).
     async def compute_success_criteria(self, transformed_obs, action):
-        success = False
-        return success
+        return self.criteria.succeeded
 
-    # Determines whether to terminate the current training episode.
-    # Always returns False, meaning episodes continue indefinitely.
+    # Terminates hopeless episodes: a thermal runaway, or Ca far off Cref for many steps in a row.
     async def compute_termination(self, transformed_obs, action):
-        return False
\ No newline at end of file
+        return self.criteria.terminated
\ No newline at end of file
@@ -1,16 +1,19 @@
-import random
 from typing import Dict, List
 
 from composabl_core import SkillController
 import numpy as np
-from gekko import GEKKO
-from scipy import interpolate
+
+from cstr_common import trajectory
+from cstr_common.observation import Observation
 
 class Controller(SkillController):
     def __init__(self, *args, **kwargs):
         self.count = 0  # Step counter to track time during simulation.
         self.display_mpc_vals = False  # Toggle for displaying MPC solution details during solve.
-        remote_server = True  # Use a remote GEKKO server for computational processing.
+        self.stream = trajectory.new_stream()  # Trajectory stream id (see cstr_common.trajectory).
+        self.remote_server = kwargs.get('remote', True)  # Use a remote GEKKO server for computational processing.
+        self.noise = kwargs.get('noise', 0)  # Measurement noise level (fraction of the operating range).
+        self.rng = np.random.default_rng(kwargs.get('seed'))  # Seeded generator for the measurement noise.
 
         # Steady State Initial Conditions
         u_ss = 280.0  # Steady-state input (coolant temperature, Tc).
@@ -24,8 +27,34 @@ class Controller(SkillController):
         self.x0[0] = Ca_ss  # Initial concentration.
         self.x0[1] = T_ss  # Initial temperature.
 
+        # GEKKO model, built on first use (see _build_model) so that importing and constructing
+        # the skill does not load GEKKO.
+        self.m = None
+
+        # Time interval for simulation (90 minutes total), one point per step boundary: step i
+        # runs from t[i] to t[i + 1], so the last of the 90 steps needs the 91st point.
+        time = 90
+        self.t = np.linspace(0, time, time + 1)
+
+        # Initialize storage for simulation results.
+        self.Ca = np.ones(len(self.t)) * Ca_ss  # Concentration over time.
+        self.T = np.ones(len(self.t)) * T_ss  # Temperature over time.
+        self.u = np.ones(len(self.t)) * u_ss  # Coolant temperature over time.
+
+    # Imports GEKKO in a parent process before it forks its workers (see cstr_common.preload).
+    @staticmethod
+    def preload():
+        import gekko  # noqa: F401
+
+    # Builds the GEKKO MPC model. GEKKO is imported here, on first use, rather than at module load.
+    def _build_model(self):
+        from gekko import GEKKO
+
+        # Steady state temperature (the CV's initial value).
+        T_ss = 311.2612
+
         # Initialize GEKKO for MPC.
-        self.m = GEKKO(remote=remote_server)
+        self.m = GEKKO(remote=self.remote_server)
 
         # Define simulation time for MPC.
         self.m.time = np.linspace(0, 90, num=90)  # 45 minutes (0.5 minute per step).
@@ -60,42 +89,30 @@ class Controller(SkillController):
 
         self.m.options.CV_TYPE = 2  # Use squared error (L2 norm) as the objective.
         self.m.options.IMODE = 6  # MPC mode.
-        self.m.options.SOLVER = 3  # Solver option.
-
-        # Time interval for simulation (90 minutes total).
-        time = 90
-        self.t = np.linspace(0, time, time)
-
-        # Initialize storage for simulation results.
-        self.Ca = np.ones(len(self.t)) * Ca_ss  # Concentration over time.
-        self.T = np.ones(len(self.t)) * T_ss  # Temperature over time.
-        self.u = np.ones(len(self.t)) * u_ss  # Coolant temperature over time.
-
-        # Define setpoints for reference transitions.
-        p1 = 22  # Time to start the transition.
-        p2 = 74  # Time to finish the transition.
-        T_ = interpolate.interp1d([0, p1, p2, time, time + 1], [311.2612, 311.2612, 373.1311, 373.1311, 373.1311])
-        C = interpolate.interp1d([0, p1, p2, time, time + 1], [8.57, 8.57, 2, 2, 2])
+        # Solver option: IPOPT on the server; the local APM executable ships APOPT and BPOPT only, and
+        # APOPT runs out of iterations on this problem, so BPOPT is used locally.
+        self.m.options.SOLVER = 3 if self.remote_server else 2
 
     # Computes the control action using the MPC solver.
     async def compute_action(self, obs, action):
+        obs = Observation.of(obs)
+        if self.m is None:
+            self._build_model()
         t = self.t
         i = self.count  # Current time step index.
-        noise = 0  # Measurement noise level.
+        noise = self.noise  # Measurement noise level.
 
         # Simulate for one time period (current to next time step).
         ts = [t[i], t[i + 1]]
 
-        # Add measurement noise.
-        σ_max1 = noise * (8.5698 - 2)  # Max noise for concentration.
-        σ_max2 = noise * (373.1311 - 311.2612)  # Max noise for temperature.
-        σ_Ca = random.uniform(-σ_max1, σ_max1)
-        σ_T = random.uniform(-σ_max2, σ_max2)
-        obs['T'] += σ_T
-        obs['Ca'] += σ_Ca
+        # Add measurement noise. The model only has the reactor temperature, so only T is measured.
+        σ_max = noise * (373.1311 - 311.2612)  # Max noise for temperature.
+        σ_T = self.rng.uniform(-σ_max, σ_max)
+        # The noisy measurement is kept apart, so an observation shared with other components is not modified.
+        T_meas = obs['T'] + σ_T
 
         # Update measurements and setpoint in the model.
-        self.m.T.MEAS = obs['T']  # Measured reactor temperature.
+        self.m.T.MEAS = T_meas  # Measured reactor temperature.
         self.m.T.SP = obs['Tref']  # Target temperature setpoint.
 
         # Solve the MPC problem.
@@ -103,15 +120,63 @@ class Controller(SkillController):
 
         # Retrieve the new control action (coolant temperature adjustment).
         self.u[i + 1] = self.m.Tc.NEWVAL
-        dTc = float(self.m.Tc.NEWVAL) - float(obs['Tc'])  # Change in coolant temperature.
+        dTc = float(self.m.Tc.NEWVAL) - obs['Tc']  # Change in coolant temperature.
 
         # Update initial conditions for the next time step.
         self.x0[0] = self.Ca[i + 1]
         self.x0[1] = self.T[i + 1]
 
         self.count += 1  # Advance the step counter.
+        trajectory.emit('mpc_benchmark', self.stream, self.count, obs=obs, action=dTc)
         return [dTc]
 
+    # Keeps the controller warm while another skill is active (see cstr_common.skill_pool).
+    # The measurement and setpoint are fed to the model and the step counter advances, so the
+    # controller's time index matches the episode when the selector switches back to it.
+    def observe(self, obs):
+        obs = Observation.of(obs)
+        if self.m is None:
+            self._build_model()
+        self.m.T.MEAS = obs['T']  # Measured reactor temperature.
+        self.m.T.SP = obs['Tref']  # Target temperature setpoint.
+        self.u[self.count + 1] = obs['Tc']  # Coolant temperature applied by the active skill.
+        self.count += 1
+
+    # Returns the controller state for a checkpoint (see cstr_common.snapshot): the step counter,
+    # the simulation arrays and the GEKKO variable values, measurement and setpoint. The values are
+    # the solver's initial guess, so a restored controller continues from the same trajectory.
+    def snapshot(self):
+        if self.m is None:
+            self._build_model()
+        return {
+            'count': self.count,
+            'x0': self.x0.copy(),
+            'Ca': self.Ca.copy(),
+            'T': self.T.copy(),
+            'u': self.u.copy(),
+            'Tc_value': np.array(self.m.Tc.VALUE).astype(np.float64),
+            'T_value': np.array(self.m.T.VALUE).astype(np.float64),
+            'T_meas': self.m.T.MEAS,
+            'T_sp': self.m.T.SP,
+            'rng': self.rng.bit_generator.state,
+        }
+
+    # Restores the controller state from snapshot().
+    def restore(self, state):
+        if self.m is None:
+            self._build_model()
+        self.count = state['count']
+        self.x0 = state['x0'].copy()
+        self.Ca = state['Ca'].copy()
+        self.T = state['T'].copy()
+        self.u = state['u'].copy()
+        # Before the first solve the values are scalars (snapshotted as 0-d arrays), which GEKKO only takes as floats.
+        self.m.Tc.VALUE = state['Tc_value'].copy() if state['Tc_value'].ndim else float(state['Tc_value'])
+        self.m.T.VALUE = state['T_value'].copy() if state['T_value'].ndim else float(state['T_value'])
+        self.m.T.MEAS = state['T_meas']
+        self.m.T.SP = state['T_sp']
+        self.rng.bit_generator.state = state['rng']
+
     # Pass sensor data through unchanged (identity transformation).
     async def transform_sensors(self, obs):
         return obs
@@ -1,40 +1,397 @@
-from random import randint
+import os
+import time
 from typing import Dict, List
 
 from composabl_core import SkillController
 ######
-import os
 import math
 import numpy as np
-import do_mpc
-import numpy as np
-from casadi import *
-from scipy import interpolate
-from math import exp
+
+from cstr_common import trajectory
+from cstr_common.observation import Observation
+from cstr_common.solver_stats import DEFAULT_CAPACITY, SolverStats
+from mpc_skill_group import solution_cache
 
 # time step (seconds) between state updates
 Δt = 1
 
 π = math.pi
 
+#constants
+F = 1 #Volumetric flow rate (m3/h)
+V = 1 #Reactor volume (m3)
+k0 = 34930800 #Pre-exponential nonthermal factor (1/h)
+E = 11843 #Activation energy per mole (kcal/kmol)
+R = 1.985875 #Boltzmann's ideal gas constant (kcal/(kmol·K))
+ΔH = -5960 #Heat of reaction per mole kcal/kmol
+phoCp = 500 #Density multiplied by heat capacity (kcal/(m3·K))
+UA = 150 #Overall heat transfer coefficient multiplied by tank area (kcal/(K·h))
+Cafin = 10 #kmol/m3
+Tf = 298.2 #K
+
+# max coolant temperature change per step (K)
+ΔTc_max = 10
+
+# retention of do_mpc's per-step data (mpc.data):
+#   'full'    keep every step with the full solution (grows without bound)
+#   'last_n'  keep the last `retention_steps` steps with the full solution
+#   'summary' keep nothing in mpc.data; per-solve statistics go to the SolverStats ring buffer
+#   'off'     keep nothing and record no statistics
+RETENTION_MODES = ('full', 'last_n', 'summary', 'off')
+DEFAULT_RETENTION = 'summary'
+DEFAULT_RETENTION_STEPS = 100
+
+# solve modes:
+#   'nlp'  solve the nonlinear MPC problem to convergence with do_mpc/IPOPT every step
+#   'rti'  real-time iteration: one Gauss-Newton SQP step per control step (see mpc_skill_group.rti)
+#   'ltv'  one convex QP per step on the model linearized along the previous plan (see mpc_skill_group.ltv)
+SOLVERS = ('nlp', 'rti', 'ltv')
+DEFAULT_SOLVER = 'nlp'
+
+# plan mode: default deviation (Ca kmol/m3, T K) between measured and planned state that triggers a re-solve
+DEFAULT_PLAN_TOLERANCE = (0.05, 1.0)
+
+# operating range of the measurements; the noise standard deviation is `noise` times the range
+Ca_range = 8.5698 - 2
+T_range = 373.1311 - 311.2612
+
+# solution cache (NLP mode): the key (Ca, T, Tc, Cref, step) is divided by CACHE_SCALE before distances
+# are measured. The step is the step within the episode (see Controller.reset()), so episodes served by
+# one long-lived controller share entries. The MPC problem depends on the step only through Cref, so the
+# step is weighted weakly.
+# Within DEFAULT_CACHE_HIT_TOLERANCE the cached action is returned without a solve; within
+# DEFAULT_CACHE_WARM_TOLERANCE the cached solution is the solver's initial guess.
+CACHE_SCALE = (Ca_range, T_range, 322 - 273, Ca_range, 900)
+DEFAULT_CACHE_HIT_TOLERANCE = 1e-3
+DEFAULT_CACHE_WARM_TOLERANCE = 0.05
+
+
+# Builds the CSTR model and the MPC controller.
+# The concentration setpoint is a time-varying parameter read from `setpoint` when the controller
+# needs it, so one controller serves every step and each solve is warm-started from the last one.
+def build_mpc(setpoint, store_full_solution=True):
+    """
+    Args:
+        setpoint: Dictionary whose 'Cref' entry holds the current concentration setpoint.
+        store_full_solution: If True, mpc.data also records the full solution and solver statistics of every step.
+
+    Returns:
+        mpc: The configured do_mpc MPC controller.
+    """
+    # The solver stack is imported here rather than at module load, so listing this skill
+    # does not cost an agent the do_mpc/CasADi import time until the MPC is first needed.
+    import casadi
+    import do_mpc
+
+    #MPC MODEL
+    model_type = 'continuous' # either 'discrete' or 'continuous'
+    model = do_mpc.model.Model(model_type)
+    # States struct (optimization variables):
+    Ca = model.set_variable(var_type='_x', var_name='Ca', shape=(1,1)) #Concentration
+    T = model.set_variable(var_type='_x', var_name='T', shape=(1,1)) #Temperature
+
+    # define measurements:
+    model.set_meas('Ca', Ca, meas_noise=True)
+    model.set_meas('T', T, meas_noise=True)
+
+    # Input struct (optimization variables):
+    Tc = model.set_variable(var_type='_u', var_name='Tc') #cooling liquid temperature
+
+    # Concentration setpoint:
+    CrSP = model.set_variable(var_type='_tvp', var_name='CrSP')
+
+    model.set_rhs('Ca', (F/V * (Cafin - Ca)) - (k0 * casadi.exp(-E/(R*T))*Ca)  )
+    model.set_rhs('T', (F/V *(Tf-T)) - ((ΔH/phoCp)*(k0 * casadi.exp(-E/(R*T))*Ca)) - ((UA /(phoCp*V)) *(T-Tc)) )
+
+    # Build the model
+    model.setup()
+
+    #CONTROLLER
+    mpc = do_mpc.controller.MPC(model)
+    setup_mpc = {
+        'n_horizon': 20,
+        'n_robust': 1,
+        'open_loop': 0,
+        't_step': Δt,
+        'store_full_solution': store_full_solution
+    }
+    if not store_full_solution:
+        setup_mpc['store_solver_stats'] = []
+
+    mpc.set_param(**setup_mpc)
+    surpress_ipopt = {'ipopt.print_level':0, 'ipopt.sb': 'yes', 'print_time':0}
+    mpc.set_param(nlpsol_opts = surpress_ipopt)
+
+    mpc.scaling['_x', 'T'] = 100
+    mpc.scaling['_u', 'Tc'] = 100
+
+    #OBJECTIVE
+    _x = model.x
+    _tvp = model.tvp
+
+    mterm = ((_x['Ca'] - _tvp['CrSP']))**2 # terminal cost
+    lterm = ((_x['Ca'] - _tvp['CrSP']))**2 # stage cost
+
+    mpc.set_objective(mterm=mterm, lterm=lterm)
+
+    mpc.set_rterm(Tc=1.5 * 1) # input penalty 1e-2 , 1000
+
+    #Constraints
+    # bounds of the states
+    mpc.bounds['lower', '_x', 'Ca'] = 0.1
+    mpc.bounds['upper', '_x', 'Ca'] = 12
+
+    mpc.bounds['upper', '_x', 'T'] = 400 #
+    mpc.bounds['lower', '_x', 'T'] = 100
+
+    # lower bounds of the inputs
+    mpc.bounds['lower', '_u', 'Tc'] = 273 #273
+
+    # upper bounds of the inputs
+    mpc.bounds['upper', '_u', 'Tc'] = 322
+
+    # The setpoint is held constant over the horizon, as in the stage cost of the original controller.
+    tvp_template = mpc.get_tvp_template()
+
+    def tvp_fun(t_now):
+        tvp_template['_tvp', :, 'CrSP'] = setpoint['Cref']
+        return tvp_template
+
+    mpc.set_tvp_fun(tvp_fun)
+
+    mpc.setup()
+    return mpc
+
+
 class Controller(SkillController):
     def __init__(self, *args, **kwargs):
         self.count = 0
+        self.stream = trajectory.new_stream()
+        # episode_step: step within the current episode, the step of the solution cache key.
+        # last_Cref: setpoint of the previous step; the reference schedule only falls, so a rise starts a new episode.
+        self.episode_step = 0
+        self.last_Cref = None
+        # mpc: built on the first call and kept, so later solves start from the previous solution.
+        # setpoint: current concentration setpoint, read by the MPC's time-varying parameter function.
+        # warm_solve: if True, observe() re-solves the MPC while the skill is inactive to keep the warm start current.
+        # solver: solve mode (see SOLVERS); qp: the RTI or LTV solver, built on the first call in those modes.
+        self.solver = kwargs.get('solver', DEFAULT_SOLVER)
+        if self.solver not in SOLVERS:
+            raise ValueError(f"solver must be one of {SOLVERS}, got {self.solver!r}")
+        self.mpc = None
+        self.qp = None
+        self.setpoint = {'Cref': 0.0}
+        self.warm_solve = kwargs.get('warm_solve', True)
+        # noise: measurement noise level; Gaussian noise is added to the Ca and T handed to the MPC.
+        # rng: seeded generator for the noise, so noisy runs are reproducible.
+        self.noise = kwargs.get('noise', 0)
+        self.rng = np.random.default_rng(kwargs.get('seed'))
+        # retention/retention_steps: what mpc.data keeps (see RETENTION_MODES).
+        # stats: ring buffer of per-solve statistics (iterations, status, solve time, objective), None when retention is 'off'.
+        self.retention = kwargs.get('retention', DEFAULT_RETENTION)
+        if self.retention not in RETENTION_MODES:
+            raise ValueError(f"retention must be one of {RETENTION_MODES}, got {self.retention!r}")
+        self.retention_steps = kwargs.get('retention_steps', DEFAULT_RETENTION_STEPS)
+        self.stats = None if self.retention == 'off' else SolverStats(kwargs.get('stats_capacity', DEFAULT_CAPACITY))
+        self._objective = None
+        # resolve_every: plan mode when > 1. The open-loop plan of a solve serves the following steps, and
+        #                the MPC is re-solved after resolve_every steps, or earlier when the measured (Ca, T) or
+        #                the setpoint leave plan_tolerance (Ca in kmol/m3, T in K) of the plan's prediction.
+        # plan/plan_index: stored plan and the horizon step served last.
+        # steps/solves/solve_seconds/serve_seconds: counters reported by plan_summary().
+        self.resolve_every = kwargs.get('resolve_every', 1)
+        self.plan_tolerance = kwargs.get('plan_tolerance', DEFAULT_PLAN_TOLERANCE)
+        self.plan = None
+        self.plan_index = 0
+        self.steps = 0
+        self.solves = 0
+        self.solve_seconds = 0.0
+        self.serve_seconds = 0.0
+        # cache: SolutionCache shared across episodes (NLP mode). Pass a SolutionCache to share one between
+        #        controllers in a process, a path to an .npz file (loaded if it exists, written by save_cache()),
+        #        or True for a new cache.
+        self.cache_path = None
+        cache = kwargs.get('cache')
+        if isinstance(cache, (str, os.PathLike)):
+            self.cache_path = cache
+            capacity = kwargs.get('cache_capacity', solution_cache.DEFAULT_CAPACITY)
+            cache = (solution_cache.SolutionCache.load(cache, capacity) if os.path.exists(cache)
+                     else solution_cache.SolutionCache(capacity, CACHE_SCALE))
+        elif cache is True:
+            cache = solution_cache.SolutionCache(kwargs.get('cache_capacity', solution_cache.DEFAULT_CAPACITY), CACHE_SCALE)
+        self.cache = cache if cache is not None and cache is not False else None
+        self.cache_hit_tolerance = kwargs.get('cache_hit_tolerance', DEFAULT_CACHE_HIT_TOLERANCE)
+        self.cache_warm_tolerance = kwargs.get('cache_warm_tolerance', DEFAULT_CACHE_WARM_TOLERANCE)
+
+    # Loads the process-wide solver artifacts: the do_mpc/CasADi modules, the IPOPT and qpOASES plugins
+    # and their setup code (by building one throwaway MPC). A parent that calls this before forking its
+    # workers shares them copy-on-write (see cstr_common.preload).
+    @staticmethod
+    def preload():
+        import casadi
+        casadi.load_nlpsol('ipopt')
+        casadi.load_conic('qpoases')
+        build_mpc({'Cref': 0.0})
+
+    # Builds the MPC and, when statistics are recorded, the function evaluating its objective.
+    def _build(self):
+        if self.solver == 'rti':
+            from mpc_skill_group.rti import RTISolver
+            self.qp = RTISolver()
+            return
+        if self.solver == 'ltv':
+            from mpc_skill_group.ltv import LTVSolver
+            self.qp = LTVSolver()
+            return
+        self.mpc = build_mpc(self.setpoint, store_full_solution=self.retention in ('full', 'last_n'))
+        if self.stats is not None:
+            import casadi
+            self._objective = casadi.Function('objective', [self.mpc.opt_x, self.mpc.opt_p], [self.mpc.nlp_obj])
+
+    # Applies the retention policy to mpc.data after a solve.
+    def _retain(self):
+        if self.retention == 'full':
+            return
+        keep = self.retention_steps if self.retention == 'last_n' else 0
+        data = self.mpc.data
+        for field in data.data_fields:
+            values = getattr(data, field)
+            if len(values) > keep:
+                setattr(data, field, values[len(values) - keep:])
+
+    # Measures the state (with measurement noise if configured) and returns the new coolant temperature,
+    # from a fresh MPC solve or, in plan mode, from the stored open-loop plan.
+    def _step(self, obs, action):
+        if self.last_Cref is not None and obs['Cref'] > self.last_Cref:
+            self.reset()
+        self.last_Cref = obs['Cref']
+        Ca0 = obs['Ca']
+        T0 = obs['T']
+        if self.noise:
+            Ca0 += self.noise * Ca_range * self.rng.standard_normal()
+            T0 += self.noise * T_range * self.rng.standard_normal()
+        Tc0 = obs['Tc'] + action
+        self.steps += 1
+
+        start = time.perf_counter()
+        i = self.plan_index + 1
+        if self.plan is not None and i < min(self.resolve_every, len(self.plan['u'])) and self._on_plan(Ca0, T0, obs['Cref'], i):
+            self.plan_index = i
+            newTc = self._clamp(self.plan['u'][i], Tc0)
+            self.serve_seconds += time.perf_counter() - start
+            return newTc
+
+        newTc = self._solve(Ca0, T0, Tc0, obs['Cref'])
+        self.solves += 1
+        self.solve_seconds += time.perf_counter() - start
+        return newTc
+
+    # True if the measured state and setpoint are within the plan tolerance of the plan's prediction for step i.
+    def _on_plan(self, Ca, T, Cref, i):
+        Ca_tol, T_tol = self.plan_tolerance
+        return (abs(Ca - self.plan['Ca'][i]) <= Ca_tol and abs(T - self.plan['T'][i]) <= T_tol
+                and abs(Cref - self.plan['Cref']) <= Ca_tol)
+
+    # Limits the coolant temperature to ΔTc_max from the current one.
+    @staticmethod
+    def _clamp(Tc, Tc0):
+        #fix from -10 to 10
+        return min(max(float(Tc), Tc0 - ΔTc_max), Tc0 + ΔTc_max)
+
+    # Solves the MPC for the measured state and returns the new coolant temperature.
+    def _solve(self, Ca0, T0, Tc0, Cref):
+        if self.solver != 'nlp':
+            return self._solve_qp(Ca0, T0, Tc0, Cref)
+        if self.mpc is None:
+            self._build()
+
+        self.setpoint['Cref'] = Cref
+
+        # Current state and the input applied before this step (used by the input penalty).
+        x0 = np.array([[Ca0], [T0]])
+        self.mpc.x0 = x0
+        self.mpc.u0 = np.array([[Tc0]])
+        if self.count == 0:
+            self.mpc.set_initial_guess()
+
+        # A cached solution of a nearby problem is returned directly or replaces the initial guess.
+        if self.cache is not None:
+            key = (Ca0, T0, Tc0, Cref, self.episode_step)
+            outcome, value = self.cache.lookup(key, self.cache_hit_tolerance, self.cache_warm_tolerance)
+            if outcome != 'miss':
+                self._load_solution(value[1:])
+            if outcome == 'hit':
+                if self.resolve_every > 1:
+                    self._store_plan(Cref)
+                return self._clamp(value[0], Tc0)
+
+        start = time.perf_counter()
+        u0 = self.mpc.make_step(x0)
+        if self.stats is not None:
+            objective = float(self._objective(self.mpc.opt_x_num, self.mpc.opt_p_num))
+            self.stats.record_casadi(self.count, self.mpc.solver_stats, objective, time.perf_counter() - start)
+        if self.cache is not None:
+            self.cache.insert(key, np.concatenate([[u0[0][0]], np.array(self.mpc.opt_x_num.cat).ravel()]))
+        if self.resolve_every > 1:
+            self._store_plan(Cref)
+        self._retain()
+
+        return self._clamp(u0[0][0], Tc0)
+
+    # Sets the MPC solution (scaled optimization variables), the initial guess of the next solve.
+    def _load_solution(self, opt_x):
+        import casadi
+        opt_x = casadi.DM(opt_x)
+        self.mpc.opt_x_num = self.mpc._opt_x(opt_x)
+        self.mpc.opt_x_num_unscaled.master = opt_x * self.mpc.opt_x_scaling
+
+    # RTI and LTV modes: the feedback phase (one QP solve) produces the action; the preparation phase
+    # for the next step (shift and, for RTI, linearization) runs after it, outside the measured feedback latency.
+    def _solve_qp(self, Ca0, T0, Tc0, Cref):
+        if self.qp is None:
+            self._build()
+
+        start = time.perf_counter()
+        Tc = self.qp.feedback(Ca0, T0, Tc0, Cref)
+        if self.stats is not None:
+            self.stats.record_casadi(self.count, dict(self.qp.stats, iter_count=1), self.qp.objective(),
+                                     time.perf_counter() - start)
+        if self.resolve_every > 1:
+            self._store_plan(Cref)
+        self.qp.shift()
+        self.qp.prepare()
+
+        return self._clamp(Tc, Tc0)
+
+    # Stores the open-loop plan of the last solve: the input of every horizon step and the predicted
+    # state at the start of each step (index 0 is the measured state).
+    def _store_plan(self, Cref):
+        if self.qp is not None:
+            u, Ca, T = self.qp.plan()
+        else:
+            X = self.mpc.opt_x_num_unscaled
+            n = self.mpc.settings.n_horizon
+            x = np.array([X['_x', k, 0, -1].full().ravel() for k in range(n + 1)])
+            u, Ca, T = np.array([float(X['_u', k, 0][0]) for k in range(n)]), x[:, 0], x[:, 1]
+        self.plan = {'u': u, 'Ca': Ca, 'T': T, 'Cref': Cref}
+        self.plan_index = 0
+
+    # Returns how many steps were solved and how many were served from the plan, with the time spent on each.
+    def plan_summary(self):
+        solve_mean = self.solve_seconds / self.solves if self.solves else float('nan')
+        served = self.steps - self.solves
+        return {
+            'steps': self.steps,
+            'solves': self.solves,
+            'solve_fraction': self.solves / self.steps if self.steps else float('nan'),
+            'solve_s': self.solve_seconds,
+            'serve_s': self.serve_seconds,
+            'saved_s': served * solve_mean - self.serve_seconds if self.solves else float('nan'),
+        }
 
     async def compute_action(self, obs, action):
-        #print(obs) #self.T, self.Tc, self.Ca, self.Cref, self.Tref
-        if type(obs)== list:
-            obs = {
-                'T': obs[0],
-                'Tc': obs[1],
-                'Ca': obs[2],
-                'Cref': obs[3],
-                'Tref': obs[4]
-            }
-        #else:
-        #    #change all to float
-        #    for key,value in obs.items():
-        #        obs[key] = float(value)
+        # The SDK passes either a dictionary or a list (T, Tc, Ca, Cref, Tref); both parse into an Observation.
+        obs = Observation.of(obs)
 
         # TODO: workaround for SDK bug on action types
         if type(action) == list or type(action) == np.ndarray:
@@ -45,235 +402,91 @@ class Controller(SkillController):
         else:
             action = float(action)
 
-        noise = 0
-        CrSP = float(obs['Cref'])
-        Ca0 = float(obs['Ca'])
-        T0 = float(obs['T'])
-        Tc0 = float(obs['Tc']) + action
-
-        #constants
-        F = 1 #Volumetric flow rate (m3/h)
-        V = 1 #Reactor volume (m3)
-        k0 = 34930800 #Pre-exponential nonthermal factor (1/h)
-        E = 11843 #Activation energy per mole (kcal/kmol)
-        R = 1.985875 #Boltzmann's ideal gas constant (kcal/(kmol·K))
-        ΔH = -5960 #Heat of reaction per mole kcal/kmol
-        phoCp = 500 #Density multiplied by heat capacity (kcal/(m3·K))
-        UA = 150 #Overall heat transfer coefficient multiplied by tank area (kcal/(K·h))
-        Cafin = 10 #kmol/m3
-        Tf = 298.2 #K
-
-        #MPC MODEL
-        model_type = 'continuous' # either 'discrete' or 'continuous'
-        model = do_mpc.model.Model(model_type)
-        # States struct (optimization variables):
-        Ca = model.set_variable(var_type='_x', var_name='Ca', shape=(1,1)) #Concentration
-        T = model.set_variable(var_type='_x', var_name='T', shape=(1,1)) #Temperature
-
-        # define measurements:
-        model.set_meas('Ca', Ca, meas_noise=True)
-        model.set_meas('T', T, meas_noise=True)
-
-        # Input struct (optimization variables):
-        Tc = model.set_variable(var_type='_u', var_name='Tc') #cooling liquid temperature
-
-        # Uncertain parameters:
-        Caf = model.set_variable(var_type='_tvp', var_name='Caf')
-        Tref = model.set_variable(var_type='_tvp', var_name='Tref')
-
-        model.set_rhs('Ca', (F/V * (Cafin - Ca)) - (k0 * exp(-E/(R*T))*Ca)  )
-        model.set_rhs('T', (F/V *(Tf-T)) - ((ΔH/phoCp)*(k0 * exp(-E/(R*T))*Ca)) - ((UA /(phoCp*V)) *(T-Tc)) )
-
-        # Build the model
-        model.setup()
-
-        #CONTROLLER
-        mpc = do_mpc.controller.MPC(model)
-        setup_mpc = {
-            'n_horizon': 20,
-            'n_robust': 1,
-            'open_loop': 0,
-            't_step': Δt,
-            'store_full_solution': True
-        }
-
-        mpc.set_param(**setup_mpc)
-        surpress_ipopt = {'ipopt.print_level':0, 'ipopt.sb': 'yes', 'print_time':0}
-        mpc.set_param(nlpsol_opts = surpress_ipopt)
-
-        mpc.scaling['_x', 'T'] = 100
-        mpc.scaling['_u', 'Tc'] = 100
-
-        #OBJECTIVE
-        _x = model.x
-        _tvp = model.tvp
-        _u = model.u
-
-        mterm = ((_x['Ca'] - CrSP))**2 # terminal cost
-        lterm = ((_x['Ca'] - CrSP))**2 # stage cost
-
-        mpc.set_objective(mterm=mterm, lterm=lterm)
-
-        mpc.set_rterm(Tc=1.5 * 1) # input penalty 1e-2 , 1000
-
-        #Constraints
-        # bounds of the states
-        mpc.bounds['lower', '_x', 'Ca'] = 0.1
-        mpc.bounds['upper', '_x', 'Ca'] = 12
-
-        mpc.bounds['upper', '_x', 'T'] = 400 #
-        mpc.bounds['lower', '_x', 'T'] = 100
-
-        # lower bounds of the inputs
-        mpc.bounds['lower', '_u', 'Tc'] = 273 #273
-
-        # upper bounds of the inputs
-        mpc.bounds['upper', '_u', 'Tc'] = 322
-
-        #UNCERTAIN VALUES
-        # in optimizer configuration:
-        tvp_temp_1 = mpc.get_tvp_template()
-        tvp_temp_1['_tvp', :] = np.array([8.5698])
-
-        tvp_temp_2 = mpc.get_tvp_template()
-        tvp_temp_2['_tvp', :] = np.array([2])
-
-        tvp_temp_3 = mpc.get_tvp_template()
-        tvp_temp_3['_tvp', :] = np.array([2])
-
-
-        def tvp_fun(t_now):
-            p1 = 22 #22 10
-            p2 = 74 #74 36
-            time = 90
-            ceq = [8.57,6.9275,5.2850,3.6425,2]
-            teq = [311.2612,327.9968,341.1084,354.7246,373.1311]
-            C = interpolate.interp1d([0,p1,p2,time], [8.57,8.57,2,2])
-            T_ = interpolate.interp1d([0,p1,p2,time], [311.2612,311.2612,373.1311,373.1311])
-
-            if t_now < p1:
-                return tvp_temp_1
-            elif t_now >= p1 and t_now < p2:
-                #y = -0.2527*t_now + 11.097
-                y = float(C(k))
-                tvp_temp_3['_tvp', :] = np.array([y])
-                return tvp_temp_3
-            else:
-                return tvp_temp_2
-
-        mpc.set_tvp_fun(tvp_fun)
-
-        mpc.setup()
-
-        #ESTIMATOR
-        estimator = do_mpc.estimator.StateFeedback(model)
-
-        #SIMULATOR
-        simulator = do_mpc.simulator.Simulator(model)
-        params_simulator = {
-            't_step': Δt
-        }
-
-        simulator.set_param(**params_simulator)
-
-
-        #uncertain parameters
-        p_num = simulator.get_p_template()
-        tvp_num = simulator.get_tvp_template()
-
-        # function for time-varying parameters
-        def tvp_fun(t_now):
-            return tvp_num
-
-        # uncertain parameters
-
-        def p_fun(t_now):
-            return p_num
-
-        simulator.set_tvp_fun(tvp_fun)
-        simulator.set_p_fun(p_fun)
-
-
-        simulator.setup()
-
-        # Set the initial state of mpc, simulator and estimator:
-        x0 = simulator.x0
-        x0['Ca'] = Ca0
-        x0['T'] = T0
-
-        u0 = simulator.u0
-        u0['Tc'] = Tc0
-
-        mpc.x0 = x0
-        simulator.x0 = x0
-        estimator.x0 = x0
-
-        mpc.u0 = u0
-        simulator.u0 = u0
-        estimator.u0 = u0
-
-
-        mpc.set_initial_guess()
-
-        #Simulate N steps
-        u0_old = 0
-        time = 1
-        for k in range(time):
-            if k > 1:
-                u0_old = u0[0][0]
-
-
-            u0 = mpc.make_step(x0)
-            #fix from -10 to 10
-            if k > 1:
-                if u0[0][0] - u0_old > 10:
-                    u0 = np.array([[u0_old + 10]])
-                elif u0[0][0] - u0_old < -10:
-                    u0 = np.array([[u0_old - 10]])
-            else:
-                if u0[0][0] - Tc0 >= 10:
-                    u0 = np.array([[Tc0 + 10]])
-                elif u0[0][0] - Tc0 <= -10:
-                    u0 = np.array([[Tc0 - 10]])
-
-            #Add Noise
-            error_var = noise
-            σ_max1 = error_var * (8.5698 -2)
-            σ_max2 = error_var * ( 373.1311 - 311.2612)
-            mu = 0
-            v0 = np.array([mu + σ_max1* np.random.randn(1, 1)[0],mu + σ_max2* np.random.randn(1, 1)[0]])
-
-            y_next = simulator.make_step(u0,v0=v0) # MPC
-
-            #get all state values
-            state_ops = y_next.reshape((1,2))
-
-            #Benchmark
-            p1 = 22 #22 10
-            p2 = 74 #74 36
-            ceq = [8.57,6.9275,5.2850,3.6425,2]
-            teq = [311.2612,327.9968,341.1084,354.7246,373.1311]
-            C = interpolate.interp1d([0,p1,p2,time], [8.57,8.57,2,2])
-            T_ = interpolate.interp1d([0,p1,p2,time], [311.2612,311.2612,373.1311,373.1311])
-            if k < p1:
-                Cref = 8.5698
-                Tref = 311.2612
-            elif k >= p1 and k < p2:
-                y = float(C(k))
-                y2 = float(T_(k))
-                Cref = y
-                Tref = y2
-            else:
-                Cref = 2
-                Tref = 373.1311
-
-            x0 = estimator.make_step(y_next) # MPC
+        newTc = self._step(obs, action)
 
         self.count += 1
-        newTc = u0[0][0]
-        dTc = float(newTc) - float(obs['Tc'])
+        self.episode_step += 1
+        dTc = newTc - obs['Tc']
+        trajectory.emit('mpc_skill_group', self.stream, self.count, obs=obs, action=dTc)
         return [dTc]
 
+    # Keeps the controller warm while another skill is active (see cstr_common.skill_pool).
+    # The MPC is re-solved for the current observation, so its warm start tracks the process
+    # and the first step after a switch does not pay the cold-start cost.
+    def observe(self, obs):
+        obs = Observation.of(obs)
+        if self.warm_solve:
+            self._step(obs, 0.0)
+            self.count += 1
+            self.episode_step += 1
+
+    # Starts a new episode: the episode step restarts at 0. Called when Cref rises; call it directly
+    # when an episode starts without one (for example after an early termination).
+    def reset(self):
+        self.episode_step = 0
+        self.last_Cref = None
+
+    # Returns the controller state for a checkpoint (see cstr_common.snapshot). Besides the step
+    # counter and setpoint this is the last MPC solution and its multipliers (in RTI and LTV modes the plan), the warm start of the next solve.
+    def snapshot(self):
+        solution = None
+        if self.mpc is not None:
+            solution = {
+                'opt_x': np.array(self.mpc.opt_x_num.cat).ravel(),
+                'lam_x': np.array(self.mpc.lam_x_num).ravel(),
+                'lam_g': np.array(self.mpc.lam_g_num).ravel(),
+            }
+        plan = None if self.plan is None else {key: np.copy(value) for key, value in self.plan.items()}
+        if self.qp is not None:
+            solution = self.qp.snapshot()
+        return {'count': self.count, 'episode_step': self.episode_step, 'last_Cref': self.last_Cref,
+                'Cref': self.setpoint['Cref'], 'solution': solution,
+                'rng': self.rng.bit_generator.state, 'plan': plan, 'plan_index': self.plan_index}
+
+    # Restores the controller state from snapshot(), building the MPC if needed.
+    def restore(self, state):
+        self.count = state['count']
+        self.episode_step = state['episode_step']
+        self.last_Cref = state['last_Cref']
+        self.setpoint['Cref'] = state['Cref']
+        self.rng.bit_generator.state = state['rng']
+        self.plan = None if state['plan'] is None else {key: np.copy(value) for key, value in state['plan'].items()}
+        self.plan_index = state['plan_index']
+        solution = state['solution']
+        if solution is not None and self.solver != 'nlp':
+            if self.qp is None:
+                self._build()
+            self.qp.restore(solution)
+        elif solution is not None:
+            import casadi
+            if self.mpc is None:
+                self._build()
+            self._load_solution(solution['opt_x'])
+            self.mpc.lam_x_num = casadi.DM(solution['lam_x'])
+            self.mpc.lam_g_num = casadi.DM(solution['lam_g'])
+            self.mpc.flags['set_initial_guess'] = True
+
+    # Returns aggregate solver statistics of the retained solves (see cstr_common.solver_stats).
+    def solver_summary(self):
+        return self.stats.summary() if self.stats is not None else {}
+
+    # Writes the retained per-solve statistics to a .csv or .npz file.
+    def export_stats(self, path):
+        if self.stats is None:
+            raise RuntimeError("solver statistics are not recorded with retention='off'")
+        self.stats.export(path)
+
+    # Returns the solution cache's lookup counts and hit rates.
+    def cache_summary(self):
+        return self.cache.metrics() if self.cache is not None else {}
+
+    # Writes the solution cache to `path`, or to the file it was loaded from.
+    def save_cache(self, path=None):
+        path = path or self.cache_path
+        if self.cache is None or path is None:
+            raise RuntimeError("no solution cache, or no path to save it to")
+        self.cache.save(path)
+
     async def transform_sensors(self, obs):
         return obs
 
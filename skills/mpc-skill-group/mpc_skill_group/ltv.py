@@ -0,0 +1,122 @@
+import time
+
+import numpy as np
+
+from mpc_skill_group.controller import ΔTc_max
+from mpc_skill_group.rti import (N_HORIZON, R_TC, SCALE, SUBSTEPS, Ca_bounds, T_bounds, Tc_bounds,
+                                 build_qp, interval_function)
+
+
+# Linear time-varying (LTV) MPC for the CSTR.
+#
+# Each step linearizes the Arrhenius model along the nominal trajectory: the measured state
+# simulated forward with the previous plan's inputs, shifted by one step. The predicted states are
+# then affine in the inputs, X = X_nom + S (U - U_nom), with S the sensitivity of the RK4 rollout.
+# The states are eliminated, and the result is a dense convex QP in the N inputs only. Its
+# constraints are linear:
+#   - Tc bounds (273-322 K) as variable bounds;
+#   - Ca and T bounds on the predicted states as linear constraints;
+#   - the ±ΔTc_max move limit on every input move, including the first one from the applied Tc.
+# The QP is solved with qpOASES, hot-started from the previous step's active set. There is one
+# linearization per step and no iteration, so the plan is only as good as the linear prediction
+# around the nominal trajectory.
+class LTVSolver:
+    def __init__(self, n_horizon=N_HORIZON, substeps=SUBSTEPS, qp_solver='qpoases'):
+        """
+        Args:
+            n_horizon: Prediction horizon (steps).
+            substeps: RK4 substeps per control interval.
+            qp_solver: CasADi conic plugin that solves the QP.
+        """
+        import casadi
+
+        self.n_horizon = n_horizon
+        interval = interval_function(substeps)
+
+        # Rollout of the inputs U from x0, and its sensitivity to U.
+        x0 = casadi.MX.sym('x0', 2)
+        U = casadi.MX.sym('U', n_horizon)
+        states = [x0]
+        for k in range(n_horizon):
+            states.append(interval(states[-1], U[k]))
+        X = casadi.vertcat(*states[1:])
+        self._rollout = casadi.Function('rollout', [x0, U], [X, casadi.jacobian(X, U)])
+
+        # Input moves D U - e u_prev; the first move is from the applied input.
+        self._D = np.eye(n_horizon) - np.eye(n_horizon, k=-1)
+        self._e = np.zeros(n_horizon)
+        self._e[0] = 1.0
+
+        dense = casadi.Sparsity.dense
+        self._qp = build_qp('ltv', qp_solver, {'h': dense(n_horizon, n_horizon), 'a': dense(3 * n_horizon, n_horizon)})
+        self._x_lower = np.tile([Ca_bounds[0], T_bounds[0] / SCALE[1]], n_horizon)
+        self._x_upper = np.tile([Ca_bounds[1], T_bounds[1] / SCALE[1]], n_horizon)
+
+        # u: current plan (scaled inputs); X: its predicted states; p: parameters of the last solve.
+        self.u = None
+        self.X = None
+        self.p = np.zeros(4)
+        self.stats = {}
+        self.prepare_seconds = 0.0
+        self.feedback_seconds = 0.0
+
+    # Nothing to prepare: the linearization depends on the measured state.
+    def prepare(self):
+        pass
+
+    # Linearizes around the shifted plan, solves the QP and returns the first input (Tc, K).
+    def feedback(self, Ca, T, Tc_prev, Cref):
+        start = time.perf_counter()
+        p = np.array([Ca, T / SCALE[1], Tc_prev / SCALE[2], Cref])
+        u_nom = np.full(self.n_horizon, p[2]) if self.u is None else self.u
+        X_nom, S = (np.array(m) for m in self._rollout(p[:2], u_nom))
+        X_nom = X_nom.ravel()
+
+        # Cost Σ (Ca_k - Cref)² + R_TC Σ (u_k - u_{k-1})² with Ca = Ca_nom + S_Ca (u - u_nom).
+        S_Ca = S[0::2]
+        r_Ca = X_nom[0::2] - S_Ca @ u_nom - Cref
+        r_u = -self._e * p[2]
+        H = 2 * (S_Ca.T @ S_Ca + R_TC * self._D.T @ self._D)
+        g = 2 * (S_Ca.T @ r_Ca + R_TC * self._D.T @ r_u)
+
+        # State bounds on the linear prediction, and the move limit.
+        move = ΔTc_max / SCALE[2]
+        A = np.vstack([S, self._D])
+        lba = np.concatenate([self._x_lower - X_nom + S @ u_nom, self._e * p[2] - move])
+        uba = np.concatenate([self._x_upper - X_nom + S @ u_nom, self._e * p[2] + move])
+        result = self._qp(h=H, g=g, a=A, lba=lba, uba=uba,
+                          lbx=Tc_bounds[0] / SCALE[2], ubx=Tc_bounds[1] / SCALE[2])
+        self.stats = self._qp.stats()
+        if self.stats['success']:
+            self.u = np.array(result['x']).ravel()
+            self.X = X_nom + S @ (self.u - u_nom)
+        else:
+            # Infeasible linear prediction (e.g. far from the nominal trajectory): keep the nominal plan.
+            self.u = u_nom
+            self.X = X_nom
+        self.p = p
+        self.feedback_seconds += time.perf_counter() - start
+        return float(self.u[0] * SCALE[2])
+
+    # Shifts the plan by one step for the next nominal trajectory; the last input is repeated.
+    def shift(self):
+        self.u = np.append(self.u[1:], self.u[-1])
+
+    # Tracking cost of the current plan, on its linear prediction.
+    def objective(self):
+        moves = self._D @ self.u - self._e * self.p[2]
+        return float(np.sum((self.X[0::2] - self.p[3])**2) + R_TC * np.sum(moves**2))
+
+    # Open-loop plan: inputs (K) and predicted states at the start of each step.
+    def plan(self):
+        x = np.vstack([self.p[:2], self.X.reshape(-1, 2)])
+        return self.u * SCALE[2], x[:, 0], x[:, 1] * SCALE[1]
+
+    def snapshot(self):
+        return {'u': None if self.u is None else self.u.copy(), 'X': None if self.X is None else self.X.copy(),
+                'p': self.p.copy()}
+
+    def restore(self, state):
+        self.u = None if state['u'] is None else state['u'].copy()
+        self.X = None if state['X'] is None else state['X'].copy()
+        self.p = state['p'].copy()
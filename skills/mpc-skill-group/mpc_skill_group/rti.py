@@ -0,0 +1,199 @@
+import ctypes
+import os
+import sys
+import time
+
+import numpy as np
+
+from mpc_skill_group.controller import (Cafin, E, F, R, Tf, UA, V, k0, phoCp, Δt, ΔH)
+
+# prediction horizon (steps), as the do_mpc controller
+N_HORIZON = 20
+# RK4 substeps per control interval in the shooting constraints
+SUBSTEPS = 4
+# input penalty on consecutive (scaled) coolant temperatures, as the do_mpc controller's rterm
+R_TC = 1.5
+# scaling of the decision variables (T and Tc in units of 100 K, as the do_mpc controller)
+SCALE = np.array([1.0, 100.0, 100.0])  # Ca, T, Tc
+# bounds of the states and input (unscaled)
+Ca_bounds = (0.1, 12)
+T_bounds = (100, 400)
+Tc_bounds = (273, 322)
+# RTI iterations on the first step, when there is no previous solution to start from
+INIT_ITERATIONS = 20
+
+
+# CSTR dynamics in the scaled variables x = (Ca, T/100) and u = Tc/100.
+def _rhs(x, u):
+    import casadi
+    Ca = x[0]
+    T = x[1] * SCALE[1]
+    Tc = u * SCALE[2]
+    rate = k0 * casadi.exp(-E / (R * T)) * Ca
+    dCa = F / V * (Cafin - Ca) - rate
+    dT = F / V * (Tf - T) - ΔH / phoCp * rate - UA / (phoCp * V) * (T - Tc)
+    return casadi.vertcat(dCa, dT / SCALE[1])
+
+
+# Builds the CasADi QP solver for a QP structure (sparsity patterns of 'h' and 'a'). qpOASES prints its
+# copyright notice from C++ whenever a solver is constructed, whatever printLevel says, so standard
+# output is sent to /dev/null at the file-descriptor level (sys.stdout does not reach C's printf)
+# while the solver is built.
+def build_qp(name, qp_solver, structure):
+    import casadi
+    if qp_solver != 'qpoases':
+        return casadi.conic(name, qp_solver, structure, {'error_on_fail': False})
+    sys.stdout.flush()
+    saved = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        os.dup2(devnull, 1)
+        return casadi.conic(name, qp_solver, structure, {'printLevel': 'none', 'error_on_fail': False})
+    finally:
+        ctypes.CDLL(None).fflush(None)  # Flush the banner from C's buffer while it still goes to /dev/null.
+        os.dup2(saved, 1)
+        os.close(saved)
+        os.close(devnull)
+
+
+# CasADi function (x, u) -> x after one control interval, integrated with `substeps` RK4 steps.
+def interval_function(substeps=SUBSTEPS):
+    import casadi
+    x = casadi.SX.sym('x', 2)
+    u = casadi.SX.sym('u', 1)
+    h = Δt / substeps
+    xk = x
+    for _ in range(substeps):
+        k1 = _rhs(xk, u)
+        k2 = _rhs(xk + h / 2 * k1, u)
+        k3 = _rhs(xk + h / 2 * k2, u)
+        k4 = _rhs(xk + h * k3, u)
+        xk = xk + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+    return casadi.Function('interval', [x, u], [xk])
+
+
+# Real-time iteration (RTI) MPC for the CSTR.
+#
+# The optimal control problem of the do_mpc controller (tracking cost on Ca, input penalty on Tc
+# moves, state and input bounds) is discretized by multiple shooting with RK4. Each control step
+# performs a single Gauss-Newton SQP iteration instead of solving the NLP to convergence. The cost
+# is a sum of squares of affine functions, so the Gauss-Newton Hessian is exact and constant; only
+# the shooting constraints are linearized.
+#
+# A step is split into two phases:
+#   shift() and prepare()  (after the previous action, before the next measurement) shift the
+#              solution by one interval and linearize the constraints around it;
+#   feedback() (after the measurement) solves the QP and returns the first input.
+# The measured state, the previous input and the setpoint enter the QP only affinely (through the
+# initial-value constraint and the cost gradient), so feedback() is one QP solve with qpOASES,
+# hot-started from the previous step's active set.
+class RTISolver:
+    def __init__(self, n_horizon=N_HORIZON, substeps=SUBSTEPS, qp_solver='qpoases'):
+        """
+        Args:
+            n_horizon: Prediction horizon (steps).
+            substeps: RK4 substeps per control interval.
+            qp_solver: CasADi conic plugin that solves the QP.
+        """
+        import casadi
+
+        self.n_horizon = n_horizon
+        nx, nu = 2, 1
+        interval = interval_function(substeps)
+
+        # Decision variables w = (x_0, u_0, x_1, u_1, ..., u_{N-1}, x_N), parameters p = (x0, Tc_prev, Cref).
+        n_w = (nx + nu) * n_horizon + nx
+        w = casadi.MX.sym('w', n_w)
+        p = casadi.MX.sym('p', nx + 2)
+        self._x_index = np.array([[k * (nx + nu) + i for i in range(nx)] for k in range(n_horizon + 1)])
+        self._u_index = np.array([k * (nx + nu) + nx for k in range(n_horizon)])
+        X = casadi.horzcat(*[w[list(self._x_index[k])] for k in range(n_horizon + 1)])
+        U = casadi.horzcat(*[w[int(i)] for i in self._u_index])
+
+        X_next = interval.map(n_horizon)(X[:, :n_horizon], U)
+        g = casadi.vertcat(X[:, 0] - p[:nx], casadi.reshape(X_next - X[:, 1:], -1, 1))
+        Cref = p[nx + 1]
+        u_prev = casadi.horzcat(p[nx], U[:, :-1])
+        f = casadi.sumsqr(X[0, :] - Cref) + R_TC * casadi.sumsqr(U - u_prev)
+
+        grad = casadi.gradient(f, w)
+        self._linearize = casadi.Function('linearize', [w, p], [g, casadi.jacobian(g, w), grad])
+        constant = casadi.Function('constant', [w, p], [casadi.hessian(f, w)[0], casadi.jacobian(grad, p), casadi.jacobian(g, p)])
+        self._objective = casadi.Function('objective', [w, p], [f])
+
+        H, self._grad_p, self._g_p = (np.array(m) for m in constant(np.zeros(n_w), np.zeros(nx + 2)))
+        self._H = casadi.DM(H)
+        self._qp = build_qp('rti', qp_solver, {'h': self._H.sparsity(), 'a': casadi.jacobian(g, w).sparsity()})
+
+        lower = np.tile([Ca_bounds[0], T_bounds[0] / SCALE[1], Tc_bounds[0] / SCALE[2]], n_horizon + 1)[:n_w]
+        upper = np.tile([Ca_bounds[1], T_bounds[1] / SCALE[1], Tc_bounds[1] / SCALE[2]], n_horizon + 1)[:n_w]
+        self._lbw, self._ubw = lower, upper
+
+        # w: current iterate; p_lin: parameters of the last linearization; initialized: False until the first feedback.
+        self.w = np.zeros(n_w)
+        self.p_lin = np.zeros(nx + 2)
+        self.initialized = False
+        self._lin = None
+        self.stats = {}
+        self.prepare_seconds = 0.0
+        self.feedback_seconds = 0.0
+
+    # Linearizes the problem around the current iterate.
+    def prepare(self):
+        start = time.perf_counter()
+        g, A, grad = self._linearize(self.w, self.p_lin)
+        self._lin = (np.array(g).ravel(), A, np.array(grad).ravel())
+        self.prepare_seconds += time.perf_counter() - start
+
+    # Solves the QP for the measurement, takes the full step and returns the first input (Tc, K).
+    def feedback(self, Ca, T, Tc_prev, Cref):
+        p = np.array([Ca, T / SCALE[1], Tc_prev / SCALE[2], Cref])
+        if not self.initialized:
+            return self._initialize(p)
+
+        start = time.perf_counter()
+        g, A, grad = self._lin
+        dp = p - self.p_lin
+        g = g + self._g_p @ dp
+        grad = grad + self._grad_p @ dp
+        result = self._qp(h=self._H, g=grad, a=A, lba=-g, uba=-g, lbx=self._lbw - self.w, ubx=self._ubw - self.w)
+        self.w = self.w + np.array(result['x']).ravel()
+        self.p_lin = p
+        self.stats = self._qp.stats()
+        self.feedback_seconds += time.perf_counter() - start
+        return float(self.w[self._u_index[0]] * SCALE[2])
+
+    # Iterates from a constant trajectory at the measured state until the first step's solution settles.
+    def _initialize(self, p):
+        self.w[self._x_index] = p[:2]
+        self.w[self._u_index] = p[2]
+        self.p_lin = p
+        self.initialized = True
+        for _ in range(INIT_ITERATIONS):
+            self.prepare()
+            u = self.feedback(p[0], p[1] * SCALE[1], p[2] * SCALE[2], p[3])
+        return u
+
+    # Shifts the solution by one interval for the next step; the last interval is repeated.
+    def shift(self):
+        n = self._x_index[1, 0]
+        self.w[:-n] = self.w[n:]
+
+    # Objective value of the current iterate.
+    def objective(self):
+        return float(self._objective(self.w, self.p_lin))
+
+    # Open-loop plan of the current iterate: inputs (K) and predicted states at the start of each step.
+    def plan(self):
+        x = self.w[self._x_index]
+        return self.w[self._u_index] * SCALE[2], x[:, 0], x[:, 1] * SCALE[1]
+
+    def snapshot(self):
+        return {'w': self.w.copy(), 'p_lin': self.p_lin.copy(), 'initialized': self.initialized}
+
+    def restore(self, state):
+        self.w = state['w'].copy()
+        self.p_lin = state['p_lin'].copy()
+        self.initialized = state['initialized']
+        if self.initialized:
+            self.prepare()
@@ -0,0 +1,153 @@
+import numpy as np
+
+# Default number of solutions kept by SolutionCache.
+DEFAULT_CAPACITY = 4096
+# Inserts (and evictions) between KD-tree rebuilds; newer entries are searched by brute force.
+DEFAULT_REBUILD_EVERY = 256
+
+
+# The SolutionCache class stores solver solutions keyed on a small state vector and finds the
+# nearest stored key with a KD-tree (scipy.spatial.cKDTree).
+#
+# Keys and values are fixed-length float vectors in preallocated arrays, so the cache can outlive
+# episodes (and be saved to and loaded from an .npz file) without growing past `capacity`. When it
+# is full, the least recently used entry (inserted or returned by a lookup) is evicted. The tree is
+# rebuilt every `rebuild_every` changes; entries inserted since the last rebuild are searched by
+# brute force, and tree entries overwritten since then are skipped.
+class SolutionCache:
+    def __init__(self, capacity=DEFAULT_CAPACITY, scale=None, rebuild_every=DEFAULT_REBUILD_EVERY):
+        """
+        Args:
+            capacity: Number of solutions retained.
+            scale: Per-component scale of the keys; distances are measured on key / scale.
+            rebuild_every: Changes between KD-tree rebuilds.
+        """
+        if capacity <= 0:
+            raise ValueError(f"capacity must be positive, got {capacity}")
+        self.capacity = capacity
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float64)
+        self.rebuild_every = rebuild_every
+        self.size = 0
+        self.keys = None  # (capacity, key length), allocated on the first insert
+        self.values = None  # (capacity, value length)
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self._clock = 0
+        self._tree = None
+        self._tree_slots = np.zeros(0, dtype=np.int64)
+        self._stale = set()  # slots overwritten since the last rebuild
+        self._pending = []  # slots written since the last rebuild
+
+        # Lookup outcomes (see lookup()) and evictions.
+        self.lookups = 0
+        self.hits = 0
+        self.warm = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return self.size
+
+    def _scaled(self, key):
+        key = np.asarray(key, dtype=np.float64)
+        return key / self.scale if self.scale is not None else key
+
+    def _rebuild(self):
+        from scipy.spatial import cKDTree
+        self._tree_slots = np.arange(self.size)
+        self._tree = cKDTree(self._scaled(self.keys[:self.size])) if self.size else None
+        self._stale.clear()
+        self._pending = []
+
+    # Returns the scaled distance to the nearest stored key and its slot, or (inf, -1) if the cache is empty.
+    def nearest(self, key):
+        query = self._scaled(key)
+        best, slot = np.inf, -1
+        if self._tree is not None:
+            k = min(len(self._stale) + 1, len(self._tree_slots))
+            distances, indices = self._tree.query(query, k=k)
+            for distance, index in zip(np.atleast_1d(distances), np.atleast_1d(indices)):
+                if self._tree_slots[index] not in self._stale:
+                    best, slot = float(distance), int(self._tree_slots[index])
+                    break
+        if self._pending:
+            pending = np.array(self._pending)
+            distances = np.linalg.norm(self._scaled(self.keys[pending]) - query, axis=1)
+            i = int(np.argmin(distances))
+            if distances[i] < best:
+                best, slot = float(distances[i]), int(pending[i])
+        return best, slot
+
+    # Looks up the nearest solution.
+    def lookup(self, key, hit_tolerance, warm_tolerance):
+        """
+        Returns:
+            ('hit', value) if the nearest key is within hit_tolerance (the value can be used directly),
+            ('warm', value) if it is within warm_tolerance (the value is a warm start), else ('miss', None).
+        """
+        self.lookups += 1
+        distance, slot = self.nearest(key)
+        if distance > warm_tolerance:
+            self.misses += 1
+            return 'miss', None
+        self._clock += 1
+        self.last_used[slot] = self._clock
+        if distance <= hit_tolerance:
+            self.hits += 1
+            return 'hit', self.values[slot].copy()
+        self.warm += 1
+        return 'warm', self.values[slot].copy()
+
+    # Stores a solution, evicting the least recently used one if the cache is full.
+    def insert(self, key, value):
+        key = np.asarray(key, dtype=np.float64)
+        value = np.asarray(value, dtype=np.float64)
+        if self.keys is None:
+            self.keys = np.zeros((self.capacity, len(key)))
+            self.values = np.zeros((self.capacity, len(value)))
+        if self.size < self.capacity:
+            slot = self.size
+            self.size += 1
+        else:
+            slot = int(np.argmin(self.last_used))
+            self.evictions += 1
+            self._stale.add(slot)
+        self.keys[slot] = key
+        self.values[slot] = value
+        self._clock += 1
+        self.last_used[slot] = self._clock
+        self._pending.append(slot)
+        if len(self._pending) >= self.rebuild_every:
+            self._rebuild()
+
+    # Lookup outcome counts and rates.
+    def metrics(self):
+        return {
+            'size': self.size,
+            'capacity': self.capacity,
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'warm': self.warm,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / self.lookups if self.lookups else float('nan'),
+            'warm_rate': self.warm / self.lookups if self.lookups else float('nan'),
+        }
+
+    # Writes the stored solutions to an .npz file.
+    def save(self, path):
+        np.savez_compressed(path, keys=self.keys[:self.size] if self.size else np.zeros((0, 0)),
+                            values=self.values[:self.size] if self.size else np.zeros((0, 0)),
+                            last_used=self.last_used[:self.size],
+                            scale=self.scale if self.scale is not None else np.zeros(0))
+
+    # Reads a cache written by save(); the capacity may differ from the saved one (the most recently used entries are kept).
+    @classmethod
+    def load(cls, path, capacity=DEFAULT_CAPACITY, rebuild_every=DEFAULT_REBUILD_EVERY):
+        data = np.load(path)
+        scale = data['scale'] if len(data['scale']) else None
+        cache = cls(capacity, scale, rebuild_every)
+        order = np.argsort(data['last_used'])[-capacity:]
+        for key, value in zip(data['keys'][order], data['values'][order]):
+            cache.insert(key, value)
+        cache._rebuild()
+        return cache
@@ -0,0 +1,36 @@
+import asyncio
+
+import numpy as np
+
+from cstr_common.cstr import EPISODE_STEPS, CSTRBatch
+from mpc_skill_group.controller import Controller
+
+
+# Runs one episode with the controller and returns the cache hits it scored.
+def run_episode(controller, env):
+    hits = controller.cache.hits
+    env.reset()
+    for _ in range(EPISODE_STEPS):
+        dTc = asyncio.run(controller.compute_action(env.observe()[0].copy(), 0.0))
+        env.step(np.array([dTc[0]], dtype=np.float64))
+    return controller.cache.hits - hits
+
+
+# One controller serving identical episodes hits its cache on every step after the first episode:
+# the cache key holds the step within the episode, which restarts when Cref rises.
+def test_cache_hits_across_episodes_of_one_controller():
+    controller = Controller(cache=True)
+    env = CSTRBatch(1)
+    assert run_episode(controller, env) == 0
+    assert run_episode(controller, env) == EPISODE_STEPS
+    assert run_episode(controller, env) == EPISODE_STEPS
+
+
+# An episode that starts without a rise of Cref (after an early end) restarts the step with reset().
+def test_reset_restarts_the_episode_step():
+    controller = Controller(cache=True)
+    env = CSTRBatch(1)
+    run_episode(controller, env)
+    assert controller.episode_step == EPISODE_STEPS
+    controller.reset()
+    assert controller.episode_step == 0
@@ -3,6 +3,10 @@ from typing import Dict, List
 from composabl_core import SkillController
 import numpy as np
 
+from cstr_common import trajectory
+from cstr_common.observation import Observation
+from cstr_common.sensors import SENSOR_INDEX
+
 # PID Controller Function
 # Implements a Proportional-Integral-Derivative (PID) controller for process control.
 # Allows different numerical methods for calculating the integral and derivative actions.
@@ -82,6 +86,47 @@ def PID(TPV,
     return U
 
 
+# Gains used by both controllers for reactor temperature control: proportional gain, integral and
+# derivative time constants, time step, derivative filter parameter and numerical method.
+GAINS = dict(Kp=0.04, TauI=1.8, TauD=1.5, dt=1, N=1, Method='Backward')
+
+
+# Batch Controller Class
+# Vectorized counterpart of Controller for N environments. PID() works on arrays unchanged,
+# so a batch of environments is served with one call instead of one per environment.
+class BatchController:
+    def __init__(self, n):
+        """
+        Args:
+            n: Number of environments.
+        """
+        self.count = np.zeros(n, dtype=np.int64)  # Step counter per environment.
+        self.T_prev = np.zeros(n)  # Previous temperature per environment.
+        self.ΔTc = np.zeros(n)  # Last output per environment.
+
+    # Computes the control output for the environments in env_ids (usable as a batch skill in cstr_common.dispatch).
+    def __call__(self, obs, env_ids):
+        """
+        Args:
+            obs: (M, sensors) observation array for the selected environments.
+            env_ids: (M,) environment indices.
+
+        Returns:
+            (M,) array of ΔTc values.
+        """
+        T = obs[:, SENSOR_INDEX['T']]
+        Tref = obs[:, SENSOR_INDEX['Tref']]
+
+        # As in Controller, the first step of an environment keeps the initial output of 0.
+        started = self.count[env_ids] > 0
+        ΔTc = PID(T, TSP=Tref, Tkm1=self.T_prev[env_ids], Ubias=0, **GAINS)
+        self.ΔTc[env_ids] = np.where(started, ΔTc, self.ΔTc[env_ids])
+
+        self.T_prev[env_ids] = T
+        self.count[env_ids] += 1
+        return self.ΔTc[env_ids]
+
+
 # Controller Class
 # Implements a PID controller to manage the behavior of a process (e.g., reactor temperature).
 class Controller(SkillController):
@@ -93,6 +138,7 @@ class Controller(SkillController):
         self.I = 0  # Initial integral value for the PID controller.
         self.T_list = []  # List to store past temperature values for derivative calculations.
         self.ΔTc = 0  # Output adjustment (change in coolant temperature).
+        self.stream = trajectory.new_stream()  # Trajectory stream id (see cstr_common.trajectory).
 
     # Compute the control action using a PID controller
     async def compute_action(self, obs, action):
@@ -100,8 +146,9 @@ class Controller(SkillController):
         Computes the control output (adjustment to manipulated variable) based on the current observation.
         """
         # Extract target and current temperatures
-        self.Tref = float(obs['Tref'])  # Setpoint (desired temperature).
-        self.T = float(obs['T'])  # Current temperature.
+        obs = Observation.of(obs)
+        self.Tref = obs['Tref']  # Setpoint (desired temperature).
+        self.T = obs['T']  # Current temperature.
 
         bias = 0  # Baseline control bias.
 
@@ -109,15 +156,10 @@ class Controller(SkillController):
         if self.count > 0:
             self.ΔTc = PID(self.T,
                            TSP=self.Tref,
-                           Kp=0.04,  # Proportional gain.
-                           TauI=1.8,  # Integral time constant.
-                           TauD=1.5,  # Derivative time constant.
                            Tkm1=self.T_list[-1],  # Previous temperature.
-                           dt=1,  # Time step.
                            Ubias=bias,  # Control bias.
                            I=self.I,  # Integral state.
-                           N=1,  # Derivative filter parameter.
-                           Method='Backward')  # Numerical method.
+                           **GAINS)  # Gains, time step and numerical method.
 
         # Update temperature history
         self.T_list.append(self.T)
@@ -125,9 +167,36 @@ class Controller(SkillController):
         # Increment step counter
         self.count += 1
 
+        trajectory.emit('pid', self.stream, self.count, obs=obs, action=self.ΔTc)
+
         # Return control output as a list
         return [self.ΔTc]
 
+    # Keep the controller warm while another skill is active (see cstr_common.skill_pool)
+    def observe(self, obs):
+        """
+        Records the temperature without computing an output, so the first step after a
+        selector switch differentiates against the previous step instead of a stale sample.
+        """
+        obs = Observation.of(obs)
+        self.T_list.append(obs['T'])
+        self.count += 1
+
+    # Capture the controller state for a checkpoint (see cstr_common.snapshot)
+    def snapshot(self):
+        """
+        Only the last temperature of T_list is kept: it is the only one the PID reads,
+        so the snapshot stays the same size however far into the episode it is taken.
+        """
+        return {'count': self.count, 'I': self.I, 'T_list': self.T_list[-1:], 'ΔTc': self.ΔTc}
+
+    # Restore the controller state from snapshot()
+    def restore(self, state):
+        self.count = state['count']
+        self.I = state['I']
+        self.T_list = list(state['T_list'])
+        self.ΔTc = state['ΔTc']
+
     # Identity transformation for sensors
     async def transform_sensors(self, obs):
         """